@@ -6,40 +6,36 @@ import tempfile
 from typing import Optional
 import traceback
 
-# Import the sound generator and analyzer
-try:
-    from .sound_generator import CarSoundGenerator
-    print("Successfully imported CarSoundGenerator")
-except ImportError as e:
-    print(f"Failed to import CarSoundGenerator: {e}")
-    CarSoundGenerator = None
-
-try:
-    from .sound_analyzer import CarSoundAnalyzer
-    print("Successfully imported CarSoundAnalyzer")
-except ImportError as e:
-    print(f"Failed to import CarSoundAnalyzer: {e}")
-    CarSoundAnalyzer = None
-
 car_router = APIRouter()
 
-# Initialize services if available
+# Services are imported and created on first use, so the API boots without
+# loading scipy and matplotlib
 sound_generator = None
 sound_analyzer = None
 
-if CarSoundGenerator:
-    try:
-        sound_generator = CarSoundGenerator()
-        print("CarSoundGenerator initialized successfully")
-    except Exception as e:
-        print(f"Failed to initialize CarSoundGenerator: {e}")
+def get_sound_generator():
+    """Create the sound generator on first use"""
+    global sound_generator
+    if sound_generator is None:
+        try:
+            from .sound_generator import CarSoundGenerator
+            sound_generator = CarSoundGenerator()
+            print("CarSoundGenerator initialized successfully")
+        except Exception as e:
+            print(f"Failed to initialize CarSoundGenerator: {e}")
+    return sound_generator
 
-if CarSoundAnalyzer:
-    try:
-        sound_analyzer = CarSoundAnalyzer()
-        print("CarSoundAnalyzer initialized successfully")
-    except Exception as e:
-        print(f"Failed to initialize CarSoundAnalyzer: {e}")
+def get_sound_analyzer():
+    """Create the sound analyzer on first use"""
+    global sound_analyzer
+    if sound_analyzer is None:
+        try:
+            from .sound_analyzer import CarSoundAnalyzer
+            sound_analyzer = CarSoundAnalyzer()
+            print("CarSoundAnalyzer initialized successfully")
+        except Exception as e:
+            print(f"Failed to initialize CarSoundAnalyzer: {e}")
+    return sound_analyzer
 
 class SoundGenerationRequest(BaseModel):
     velocity: float
@@ -69,6 +65,7 @@ async def generate_car_sound(request: SoundGenerationRequest):
             raise HTTPException(status_code=400, detail="Frequency must be between 20 and 1000 Hz")
         
         # Check if sound generator is available
+        sound_generator = get_sound_generator()
         if not sound_generator:
             print("Sound generator not available!")
             raise HTTPException(status_code=500, detail="Sound generator not available")
@@ -116,6 +113,7 @@ async def analyze_car_sound(
             raise HTTPException(status_code=400, detail="Invalid file type. Supported: WAV, MP3, M4A, OGG, FLAC")
         
         # Check if analyzer is available
+        sound_analyzer = get_sound_analyzer()
         if not sound_analyzer:
             raise HTTPException(status_code=500, detail="Sound analyzer not available")
         
@@ -149,8 +147,8 @@ async def health_check():
     """Health check endpoint"""
     status = {
         "status": "Car audio service is running",
-        "sound_generator_available": sound_generator is not None,
-        "sound_analyzer_available": sound_analyzer is not None
+        "sound_generator_available": get_sound_generator() is not None,
+        "sound_analyzer_available": get_sound_analyzer() is not None
     }
     
     print(f"Health check: {status}")
@@ -1 +1 @@
-from .ecg import ecg_router
+from .ecg import ecg_router, ECG_MODES
@@ -0,0 +1,569 @@
+"""Batch Mode 2 analysis over the PTB database.
+
+A job freezes a selection of (patient, recording, channel) tasks from the PTB
+index, scores them in a process pool and appends the results to compressed
+NPZ shards in its own directory. Shards are written atomically, and tasks
+already present in a shard are skipped when the job is started again, so an
+interrupted run resumes where it stopped. Run a job from the command line
+with::
+
+    python -m app.ecg.batch --channels ii,v1 [--diagnosis infarction] [--job-id nightly]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional
+
+import numpy as np
+from fastapi import APIRouter
+
+from .cache import atomic_write
+from .dat_reader import read_header, read_window
+from .ecg_mode2 import Mode2Processor
+from .ptb_index import PTBIndex, ptb_index
+
+router = APIRouter()
+
+DEFAULT_BATCH_DIR = "./ecg_batch"
+BATCH_DIR = os.environ.get("ECG_BATCH_DIR", DEFAULT_BATCH_DIR)
+BATCH_WORKERS = int(os.environ.get("ECG_BATCH_WORKERS", 0)) or max(1, (os.cpu_count() or 2) - 1)
+DEFAULT_SHARD_SIZE = 16
+DEFAULT_CHANNELS = ["ii"]
+
+# Per-task columns of a shard; beat columns are concatenated across tasks
+# and split by beat_offsets (task i owns beats beat_offsets[i]:beat_offsets[i + 1]).
+TASK_FIELDS = ("patient", "recording", "channel", "signal_length", "total_beats",
+               "abnormal_beats", "abnormality_percentage", "threshold_used", "error")
+BEAT_FIELDS = ("beat_index", "r_peak", "score", "abnormal")
+
+
+def _quiet_worker():
+    sys.stdout = open(os.devnull, "w")
+
+
+def analyze_record(record_path: str, channel: str, threshold: float) -> Dict:
+    """Score every beat of one channel of one record; runs in the worker processes.
+
+    Template beats have no score and are stored as NaN; r_peak is the sample
+    position of each beat's R peak in the record.
+    """
+    processor = Mode2Processor()
+    header = read_header(record_path)
+    if channel not in header.sig_name:
+        raise ValueError(f"Channel {channel} not found. Available channels: {header.sig_name}")
+
+    ecg_signal = read_window(record_path, 0, header.sig_len, [channel])[:, 0]
+    beats, _ = processor.extract_heartbeats(ecg_signal)
+
+    scores = np.full(len(beats), np.nan, dtype=np.float32)
+    abnormal = np.zeros(len(beats), dtype=bool)
+    threshold_used = threshold
+
+    scoring = processor.score_beats(beats)
+    if scoring is not None:
+        candidates = scoring['candidate_indices']
+        threshold_used = processor.effective_threshold(scoring['scores'], threshold)
+        scores[candidates] = scoring['scores']
+        abnormal[candidates] = scoring['scores'] > threshold_used
+
+    return {
+        "signal_length": int(header.sig_len),
+        "threshold_used": float(threshold_used),
+        "beat_index": np.array([beat['index'] for beat in beats], dtype=np.int32),
+        "r_peak": np.array([beat['start_idx'] + beat['r_peak'] for beat in beats], dtype=np.int64),
+        "score": scores,
+        "abnormal": abnormal
+    }
+
+
+class JobLock:
+    """Exclusive OS-level lock on ``job.lock`` in a job directory.
+
+    Held for the whole of BatchJob.run, so the API and the command line (or
+    two servers) cannot run the same job at once. The OS releases it if the
+    holding process dies.
+    """
+
+    def __init__(self, job_dir: str):
+        self.path = os.path.join(job_dir, "job.lock")
+        self._file = None
+
+    def acquire(self) -> bool:
+        f = open(self.path, "a+")
+        try:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if os.name == "nt":
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def is_locked(self) -> bool:
+        """Whether another holder has the lock right now."""
+        if not self.acquire():
+            return True
+        self.release()
+        return False
+
+
+def task_key(task) -> str:
+    return "/".join(task)
+
+
+def _shard_paths(job_dir: str) -> List[str]:
+    names = sorted(
+        name for name in os.listdir(job_dir)
+        if name.startswith("shard_") and name.endswith(".npz") and ".tmp" not in name
+    )
+    return [os.path.join(job_dir, name) for name in names]
+
+
+def load_results(job_dir: str, beats: bool = False) -> Dict[str, np.ndarray]:
+    """Concatenate the task columns (and optionally the beat columns) of every shard of a job."""
+    fields = TASK_FIELDS + (BEAT_FIELDS if beats else ())
+    columns = {name: [] for name in fields}
+    offsets = [np.zeros(1, dtype=np.int64)]
+
+    for path in _shard_paths(job_dir):
+        with np.load(path) as shard:
+            for name in fields:
+                columns[name].append(shard[name])
+            if beats:
+                offsets.append(shard["beat_offsets"][1:] + offsets[-1][-1])
+
+    results = {
+        name: np.concatenate(parts) if parts else np.array([])
+        for name, parts in columns.items()
+    }
+    if beats:
+        results["beat_offsets"] = np.concatenate(offsets)
+    return results
+
+
+class BatchJob:
+    """One batch run: a frozen task list, its shard directory and its live progress."""
+
+    def __init__(self, job_id: str, job_dir: str, manifest: Dict):
+        self.job_id = job_id
+        self.job_dir = job_dir
+        self.manifest = manifest
+        self.tasks = [tuple(task) for task in manifest["tasks"]]
+        self.state = "created"
+        self.completed = 0
+        self.failed = 0
+        self.resumed_from = 0
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self._cancel = threading.Event()
+        self._shard_count = 0
+
+    @classmethod
+    def create(
+        cls,
+        channels: List[str],
+        diagnosis: Optional[str] = None,
+        patients: Optional[List[str]] = None,
+        threshold: float = 0.025,
+        job_id: Optional[str] = None,
+        index: PTBIndex = ptb_index,
+        batch_dir: str = BATCH_DIR,
+        shard_size: int = DEFAULT_SHARD_SIZE
+    ) -> "BatchJob":
+        job_id = job_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        job_dir = os.path.join(batch_dir, job_id)
+
+        tasks = [
+            (entry["patient"], entry["recording"], channel)
+            for entry in index.query(diagnosis=diagnosis)
+            if not patients or entry["patient"] in patients
+            for channel in channels
+            if channel in entry["channels"]
+        ]
+
+        manifest = {
+            "job_id": job_id,
+            "created": time.time(),
+            "base_path": index.base_path,
+            "selection": {"channels": channels, "diagnosis": diagnosis, "patients": patients},
+            "threshold": threshold,
+            "shard_size": shard_size,
+            "tasks": tasks
+        }
+
+        os.makedirs(job_dir, exist_ok=True)
+        payload = json.dumps(manifest, ensure_ascii=False).encode("utf-8")
+        atomic_write(os.path.join(job_dir, "job.json"), lambda f: f.write(payload))
+
+        return cls(job_id, job_dir, manifest)
+
+    @classmethod
+    def open(cls, job_id: str, batch_dir: str = BATCH_DIR) -> Optional["BatchJob"]:
+        job_dir = os.path.join(batch_dir, job_id)
+        try:
+            with open(os.path.join(job_dir, "job.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        job = cls(job_id, job_dir, manifest)
+        done = len(job.finished_keys())
+        job.completed = done
+        job.state = "completed" if done >= len(job.tasks) else "stopped"
+        return job
+
+    def finished_keys(self) -> set:
+        keys = set()
+        for path in _shard_paths(self.job_dir):
+            with np.load(path) as shard:
+                keys.update(task_key(task) for task in zip(shard["patient"], shard["recording"], shard["channel"]))
+        return keys
+
+    def _write_shard(self, rows):
+        columns = {name: [] for name in TASK_FIELDS + BEAT_FIELDS}
+        beat_offsets = [0]
+
+        for (patient, recording, channel), result, error in rows:
+            result = result or {}
+            beat_count = len(result.get("beat_index", ()))
+            abnormal_count = int(np.sum(result["abnormal"])) if beat_count else 0
+
+            columns["patient"].append(patient)
+            columns["recording"].append(recording)
+            columns["channel"].append(channel)
+            columns["signal_length"].append(result.get("signal_length", 0))
+            columns["total_beats"].append(beat_count)
+            columns["abnormal_beats"].append(abnormal_count)
+            columns["abnormality_percentage"].append(abnormal_count / beat_count * 100 if beat_count else 0.0)
+            columns["threshold_used"].append(result.get("threshold_used", np.nan))
+            columns["error"].append(error)
+            for name in BEAT_FIELDS:
+                if beat_count:
+                    columns[name].append(result[name])
+            beat_offsets.append(beat_offsets[-1] + beat_count)
+
+        task_dtypes = {"signal_length": np.int64, "total_beats": np.int32, "abnormal_beats": np.int32,
+                       "abnormality_percentage": np.float64, "threshold_used": np.float64}
+        beat_dtypes = {"beat_index": np.int32, "r_peak": np.int64, "score": np.float32, "abnormal": bool}
+
+        arrays = {name: np.asarray(columns[name], dtype=task_dtypes.get(name, str)) for name in TASK_FIELDS}
+        for name, dtype in beat_dtypes.items():
+            arrays[name] = np.concatenate(columns[name]).astype(dtype) if columns[name] else np.array([], dtype=dtype)
+        arrays["beat_offsets"] = np.asarray(beat_offsets, dtype=np.int64)
+
+        path = os.path.join(self.job_dir, f"shard_{self._shard_count:05d}.npz")
+        atomic_write(path, lambda f: np.savez_compressed(f, **arrays))
+        self._shard_count += 1
+
+    def run(self, workers: int = BATCH_WORKERS, progress=None):
+        """Score every task not already in a shard, flushing a shard every ``shard_size`` results.
+
+        Holds the job's JobLock throughout; if another process is running the
+        job, the state becomes "stopped" with an error and nothing is done.
+        """
+        lock = JobLock(self.job_dir)
+        if not lock.acquire():
+            self.state = "stopped"
+            self.error = f"Batch job {self.job_id} is already running in another process"
+            print(f"❌ {self.error}")
+            return
+        try:
+            self._run(workers, progress)
+        finally:
+            lock.release()
+
+    def _run(self, workers: int, progress):
+        self.state = "running"
+        self.started_at = time.time()
+        self.finished_at = None
+        self.error = None
+        self._cancel.clear()
+
+        done = self.finished_keys()
+        pending = iter([task for task in self.tasks if task_key(task) not in done])
+        self.completed = self.resumed_from = len(done)
+        self.failed = 0
+        self._shard_count = len(_shard_paths(self.job_dir))
+
+        base_path = self.manifest["base_path"]
+        threshold = self.manifest["threshold"]
+        shard_size = self.manifest.get("shard_size", DEFAULT_SHARD_SIZE)
+        buffer = []
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_quiet_worker
+            ) as pool:
+                in_flight = {}
+
+                def submit_next():
+                    task = next(pending, None)
+                    if task is not None:
+                        record_path = os.path.join(base_path, task[0], task[1])
+                        in_flight[pool.submit(analyze_record, record_path, task[2], threshold)] = task
+
+                # Keep only a couple of tasks per worker queued so cancelling is prompt
+                for _ in range(workers * 2):
+                    submit_next()
+
+                while in_flight:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        task = in_flight.pop(future)
+                        try:
+                            buffer.append((task, future.result(), ""))
+                        except Exception as e:
+                            buffer.append((task, None, str(e)))
+                            self.failed += 1
+                        self.completed += 1
+
+                        if len(buffer) >= shard_size:
+                            self._write_shard(buffer)
+                            buffer = []
+                        if progress is not None:
+                            progress(self)
+                        if not self._cancel.is_set():
+                            submit_next()
+
+            if buffer:
+                self._write_shard(buffer)
+            self.state = "cancelled" if self._cancel.is_set() else "completed"
+
+        except Exception as e:
+            if buffer:
+                self._write_shard(buffer)
+            self.state = "failed"
+            self.error = str(e)
+            print(f"❌ Batch job {self.job_id} failed: {e}")
+            print(traceback.format_exc())
+        finally:
+            self.finished_at = time.time()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def status(self) -> Dict:
+        total = len(self.tasks)
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        processed = self.completed - self.resumed_from
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        return {
+            "job_id": self.job_id,
+            "state": self.state,
+            "selection": self.manifest["selection"],
+            "threshold": self.manifest["threshold"],
+            "total": total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "resumed_from": self.resumed_from,
+            "progress": round(self.completed / total * 100, 2) if total else 100.0,
+            "elapsed_seconds": round(elapsed, 2),
+            "tasks_per_second": round(rate, 3),
+            "eta_seconds": round((total - self.completed) / rate, 1) if rate > 0 else None,
+            "shards": len(_shard_paths(self.job_dir)),
+            "output_dir": self.job_dir,
+            "error": self.error
+        }
+
+
+_jobs: Dict[str, BatchJob] = {}
+_jobs_lock = threading.Lock()
+
+
+def _running_job() -> Optional[BatchJob]:
+    return next((job for job in _jobs.values() if job.state == "running"), None)
+
+
+def _get_job(job_id: str) -> Optional[BatchJob]:
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    return job or BatchJob.open(job_id)
+
+
+def _workers_error(workers: int) -> Optional[str]:
+    if not 1 <= workers <= BATCH_WORKERS:
+        return f"workers must be between 1 and {BATCH_WORKERS}"
+    return None
+
+
+def _start(job: BatchJob, workers: int):
+    """Run ``job`` on a background thread; only one job runs at a time."""
+    error = _workers_error(workers)
+    if error:
+        return {"error": error}
+    with _jobs_lock:
+        running = _running_job()
+        if running is not None:
+            return {"error": f"Batch job {running.job_id} is already running"}
+        if JobLock(job.job_dir).is_locked():
+            return {"error": f"Batch job {job.job_id} is already running in another process"}
+        job.state = "running"
+        _jobs[job.job_id] = job
+
+    threading.Thread(target=job.run, args=(workers,), name=f"batch-{job.job_id}", daemon=True).start()
+    return job.status()
+
+
+def _split(values: Optional[str]) -> List[str]:
+    return [value.strip() for value in (values or "").split(",") if value.strip()]
+
+
+@router.post("/jobs")
+def create_batch_job(
+    channels: str = ",".join(DEFAULT_CHANNELS),
+    diagnosis: Optional[str] = None,
+    patients: Optional[str] = None,
+    threshold: float = 0.025,
+    job_id: Optional[str] = None,
+    workers: int = BATCH_WORKERS
+):
+    """Start a batch job; an existing ``job_id`` is resumed instead of recreated."""
+    try:
+        error = _workers_error(workers)
+        if error:
+            return {"error": error}
+
+        running = _running_job()
+        if running is not None:
+            return {"error": f"Batch job {running.job_id} is already running"}
+
+        if job_id:
+            existing = _get_job(job_id)
+            if existing is not None:
+                return _start(existing, workers)
+
+        channels_list = _split(channels)
+        if not channels_list:
+            return {"error": "At least one channel is required"}
+
+        job = BatchJob.create(channels_list, diagnosis, _split(patients), threshold, job_id)
+        if not job.tasks:
+            return {"error": "No recordings match the selection", "selection": job.manifest["selection"]}
+        return _start(job, workers)
+    except Exception as e:
+        return {"error": f"Error creating batch job: {str(e)}"}
+
+
+@router.get("/jobs")
+def list_batch_jobs():
+    try:
+        job_ids = sorted(
+            name for name in os.listdir(BATCH_DIR)
+            if os.path.exists(os.path.join(BATCH_DIR, name, "job.json"))
+        ) if os.path.isdir(BATCH_DIR) else []
+        jobs = [_get_job(job_id) for job_id in job_ids]
+        return {"jobs": [job.status() for job in jobs if job is not None]}
+    except Exception as e:
+        return {"error": f"Error listing batch jobs: {str(e)}"}
+
+
+@router.get("/jobs/{job_id}")
+def get_batch_job(job_id: str):
+    job = _get_job(job_id)
+    if job is None:
+        return {"error": f"Batch job {job_id} not found"}
+    return job.status()
+
+
+@router.post("/jobs/{job_id}/resume")
+def resume_batch_job(job_id: str, workers: int = BATCH_WORKERS):
+    job = _get_job(job_id)
+    if job is None:
+        return {"error": f"Batch job {job_id} not found"}
+    return _start(job, workers)
+
+
+@router.post("/jobs/{job_id}/cancel")
+def cancel_batch_job(job_id: str):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None or job.state != "running":
+        return {"error": f"Batch job {job_id} is not running"}
+    job.cancel()
+    return {"job_id": job_id, "state": "cancelling"}
+
+
+@router.get("/jobs/{job_id}/results")
+def get_batch_results(job_id: str, offset: int = 0, limit: int = 1000):
+    """Per-task summary columns of a job (beat-level columns stay in the shards)."""
+    job = _get_job(job_id)
+    if job is None:
+        return {"error": f"Batch job {job_id} not found"}
+
+    try:
+        results = load_results(job.job_dir)
+        total = len(results["patient"])
+        return {
+            "job_id": job_id,
+            "total": total,
+            "offset": offset,
+            "columns": {name: values[offset:offset + limit].tolist() for name, values in results.items()}
+        }
+    except Exception as e:
+        return {"error": f"Error reading batch results: {str(e)}"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Mode 2 analysis over the PTB database")
+    parser.add_argument("--channels", default=",".join(DEFAULT_CHANNELS), help="Comma-separated leads to analyze")
+    parser.add_argument("--diagnosis", default=None, help="Case-insensitive diagnosis substring filter")
+    parser.add_argument("--patients", default=None, help="Comma-separated patient IDs (defaults to all)")
+    parser.add_argument("--threshold", type=float, default=0.025)
+    parser.add_argument("--job-id", default=None, help="Resume this job if it exists, otherwise create it")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--base-path", default=ptb_index.base_path, help="PTB database directory")
+    parser.add_argument("--output-dir", default=BATCH_DIR, help="Directory holding the job directories")
+    args = parser.parse_args()
+
+    job = BatchJob.open(args.job_id, args.output_dir) if args.job_id else None
+    if job is None:
+        index = PTBIndex(args.base_path, os.environ.get("PTB_INDEX_PATH"))
+        index.ensure_loaded()
+        job = BatchJob.create(
+            _split(args.channels), args.diagnosis, _split(args.patients), args.threshold,
+            args.job_id, index=index, batch_dir=args.output_dir
+        )
+
+    def report(job):
+        status = job.status()
+        print(f"\r{status['completed']}/{status['total']} ({status['progress']}%) "
+              f"failed={status['failed']} eta={status['eta_seconds']}s", end="", flush=True)
+
+    print(f"Batch job {job.job_id}: {len(job.tasks)} tasks -> {job.job_dir}")
+    job.run(args.workers, progress=report)
+    print()
+    print(json.dumps(job.status(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
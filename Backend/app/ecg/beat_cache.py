@@ -0,0 +1,94 @@
+import hashlib
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+from .cache import DiskBudget, SizedLRUCache, atomic_write
+
+# Bump when the cleaning / peak detection / segmentation pipeline changes
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES = 1024 * 1024 * 1024
+DEFAULT_CACHE_DIR = "./ecg_cache"
+
+ENTRY_FIELDS = ("cleaned", "rpeaks", "beat_index", "start_idx", "end_idx")
+
+
+class BeatCache:
+    """Content-addressed cache of cleaned signals, R-peaks and beat boundaries.
+
+    Entries are keyed by a hash of the raw signal samples and the pipeline
+    parameters, kept in a size-bounded in-memory LRU and persisted as
+    compressed ``.npz`` files so they survive restarts; those files are
+    bounded by ``max_disk_bytes``, oldest deleted first.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                 max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES):
+        self._memory = SizedLRUCache(max_bytes, sizeof=lambda entry: sum(a.nbytes for a in entry.values()))
+        self.cache_dir = cache_dir or None
+        self._disk = DiskBudget(self.cache_dir, max_disk_bytes, ".npz") if self.cache_dir else None
+        self.disk_hits = 0
+        self.disk_writes = 0
+
+    @staticmethod
+    def key(ecg_signal: np.ndarray, sampling_rate: int, **params) -> str:
+        digest = hashlib.sha1(np.ascontiguousarray(ecg_signal, dtype=np.float64).tobytes())
+        digest.update(f"|fs={sampling_rate}|v={CACHE_VERSION}".encode())
+        for name in sorted(params):
+            digest.update(f"|{name}={params[name]}".encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        entry = self._memory.get(key)
+        if entry is not None or self.cache_dir is None:
+            return entry
+
+        try:
+            with np.load(self._path(key)) as data:
+                entry = {name: data[name] for name in ENTRY_FIELDS}
+        except (OSError, KeyError, ValueError):
+            return None
+
+        self.disk_hits += 1
+        self._store_in_memory(key, entry)
+        return entry
+
+    def put(self, key: str, entry: Dict[str, np.ndarray]):
+        self._store_in_memory(key, entry)
+
+        if self.cache_dir is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            atomic_write(self._path(key), lambda f: np.savez_compressed(f, **entry))
+            self._disk.added(self._path(key))
+            self.disk_writes += 1
+        except OSError as e:
+            print(f"⚠️ Could not write beat cache entry {key}: {e}")
+
+    def _store_in_memory(self, key: str, entry: Dict[str, np.ndarray]):
+        for array in entry.values():
+            array.setflags(write=False)
+        self._memory.put(key, entry)
+
+    def stats(self):
+        stats = self._memory.stats()
+        stats.update(
+            cache_dir=self.cache_dir,
+            disk_hits=int(self.disk_hits),
+            disk_writes=int(self.disk_writes),
+            **(self._disk.stats() if self._disk is not None else {})
+        )
+        return stats
+
+
+beat_cache = BeatCache(
+    int(os.environ.get("ECG_BEAT_CACHE_BYTES", DEFAULT_MAX_BYTES)),
+    os.environ.get("ECG_BEAT_CACHE_DIR", DEFAULT_CACHE_DIR),
+    int(os.environ.get("ECG_BEAT_CACHE_DISK_BYTES", DEFAULT_MAX_DISK_BYTES))
+)
@@ -0,0 +1,182 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class SizedLRUCache:
+    """Thread-safe LRU cache bounded by the total size (in bytes) of its values."""
+
+    def __init__(self, max_bytes: int, sizeof=None):
+        self.max_bytes = int(max_bytes)
+        self._sizeof = sizeof or (lambda value: getattr(value, "nbytes", 0))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key, default=None):
+        """Look up ``key`` without touching recency or the hit/miss counters."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return default if entry is None else entry[0]
+
+    def put(self, key, value):
+        size = int(self._sizeof(value))
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+
+            if size > self.max_bytes:
+                return False
+
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+        return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self.current_bytes -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "current_bytes": int(self.current_bytes),
+                "max_bytes": int(self.max_bytes),
+                "hits": int(self.hits),
+                "misses": int(self.misses),
+                "evictions": int(self.evictions),
+                "hit_rate": float(round(self.hits / lookups, 4)) if lookups else 0.0
+            }
+
+
+def atomic_write(path: str, write):
+    """Call ``write(f)`` on a uniquely named temporary file next to ``path``, then move it into place.
+
+    Concurrent writers of the same path (threads or processes) each get their
+    own temporary file, and readers only ever see a complete file.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class DiskBudget:
+    """Bounds the total size of the ``suffix`` files of a cache directory, deleting the oldest first.
+
+    The index is built from the directory (ordered by modification time) on
+    first use and then updated by the owning cache as it writes and deletes
+    entries. Processes sharing a directory each keep their own index, so the
+    bound is approximate there.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        self.suffix = suffix
+        self._files = None
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.evictions = 0
+
+    def _load(self):
+        if self._files is not None:
+            return
+        found = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(self.suffix) and entry.is_file():
+                        stat = entry.stat()
+                        found.append((stat.st_mtime, entry.name, stat.st_size))
+        except OSError:
+            pass
+        self._files = OrderedDict((name, size) for _, name, size in sorted(found))
+        self.current_bytes = sum(self._files.values())
+
+    def added(self, path: str):
+        """Record a newly written file and delete the oldest files while over budget."""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        name = os.path.basename(path)
+        with self._lock:
+            self._load()
+            self.current_bytes -= self._files.pop(name, 0)
+            self._files[name] = size
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes and self._files:
+                evicted, evicted_size = self._files.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+                self._unlink(evicted)
+
+    def remove(self, path: str):
+        name = os.path.basename(path)
+        with self._lock:
+            self._load()
+            self.current_bytes -= self._files.pop(name, 0)
+            self._unlink(name)
+
+    def _unlink(self, name: str):
+        try:
+            os.unlink(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            self._load()
+            return {
+                "disk_files": len(self._files),
+                "disk_bytes": int(self.current_bytes),
+                "max_disk_bytes": int(self.max_bytes),
+                "disk_evictions": int(self.evictions)
+            }
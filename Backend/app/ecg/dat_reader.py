@@ -0,0 +1,139 @@
+import os
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+import numpy as np
+
+from .record_store import record_store
+
+# Only the 16-bit little-endian format used by the PTB database is memory-mapped;
+# every other format falls back to the shared record store.
+MMAP_FORMATS = {"16": np.dtype("<i2")}
+
+_SIGNAL_FORMAT = re.compile(r"^(?P<fmt>\d+)(?:x\d+)?(?::\d+)?(?:\+(?P<offset>\d+))?$")
+_SIGNAL_GAIN = re.compile(r"^(?P<gain>[-+]?[\d.eE+-]+)?(?:\((?P<baseline>[-+]?\d+)\))?(?:/(?P<units>.+))?$")
+
+
+class RecordHeader:
+    """Parsed contents of a WFDB ``.hea`` header."""
+
+    def __init__(self, record_name: str, fs: float, sig_len: int, signals: List[dict], comments: List[str]):
+        self.record_name = record_name
+        self.fs = fs
+        self.sig_len = sig_len
+        self.signals = signals
+        self.comments = comments
+        self.sig_name = [spec["name"] for spec in signals]
+        self.units = [spec["units"] for spec in signals]
+
+    @property
+    def n_sig(self):
+        return len(self.signals)
+
+
+def _parse_header(hea_path: str) -> RecordHeader:
+    with open(hea_path, "r", encoding="utf-8", errors="ignore") as f:
+        lines = f.read().splitlines()
+
+    comments = [line[1:].strip() for line in lines if line.startswith("#")]
+    body = [line.split() for line in lines if line.strip() and not line.startswith("#")]
+
+    record_line = body[0]
+    n_sig = int(record_line[1])
+    fs = float(re.split(r"[/(]", record_line[2])[0]) if len(record_line) > 2 else 250.0
+    sig_len = int(record_line[3]) if len(record_line) > 3 else 0
+
+    signals = []
+    for index, fields in enumerate(body[1:1 + n_sig]):
+        fmt_match = _SIGNAL_FORMAT.match(fields[1])
+        gain_match = _SIGNAL_GAIN.match(fields[2]) if len(fields) > 2 else None
+        adc_zero = int(fields[4]) if len(fields) > 4 else 0
+
+        gain = float(gain_match.group("gain")) if gain_match and gain_match.group("gain") else 0.0
+        baseline = gain_match.group("baseline") if gain_match else None
+
+        signals.append({
+            "file_name": fields[0],
+            "fmt": fmt_match.group("fmt") if fmt_match else fields[1],
+            "byte_offset": int(fmt_match.group("offset") or 0) if fmt_match else 0,
+            "gain": gain if gain != 0 else 200.0,
+            "baseline": int(baseline) if baseline is not None else adc_zero,
+            "units": (gain_match.group("units") if gain_match else None) or "mV",
+            "name": fields[8] if len(fields) > 8 else f"ch{index + 1}"
+        })
+
+    return RecordHeader(record_line[0], fs, sig_len, signals, comments)
+
+
+@lru_cache(maxsize=1024)
+def _cached_header(hea_path: str, mtime_ns: int) -> RecordHeader:
+    return _parse_header(hea_path)
+
+
+def read_header(record_path: str) -> RecordHeader:
+    hea_path = record_path + ".hea"
+    return _cached_header(hea_path, os.stat(hea_path).st_mtime_ns)
+
+
+@lru_cache(maxsize=64)
+def _cached_memmap(dat_path: str, mtime_ns: int, byte_offset: int, n_columns: int, dtype: str):
+    item_size = np.dtype(dtype).itemsize
+    n_frames = (os.path.getsize(dat_path) - byte_offset) // (item_size * n_columns)
+    return np.memmap(dat_path, dtype=dtype, mode="r", offset=byte_offset, shape=(n_frames, n_columns))
+
+
+def _frames(record_path: str, header: RecordHeader, file_name: str):
+    specs = [spec for spec in header.signals if spec["file_name"] == file_name]
+    dat_path = os.path.join(os.path.dirname(record_path), file_name)
+    dtype = MMAP_FORMATS[specs[0]["fmt"]]
+    return _cached_memmap(dat_path, os.stat(dat_path).st_mtime_ns, specs[0]["byte_offset"], len(specs), dtype.str)
+
+
+def read_window(record_path: str, start: int, stop: int, channels: Optional[List[str]] = None,
+                out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Return samples ``start:stop`` of ``channels`` in physical units, shape ``(n_samples, n_channels)``.
+
+    Only the requested frames are touched, so the cost scales with the window
+    rather than with the record length. When ``out`` is given (any dtype or
+    layout with room for ``(stop - start, n_channels)``) the samples are
+    written into it and the filled part is returned.
+    """
+    header = read_header(record_path)
+    channels = list(channels) if channels is not None else header.sig_name
+    indices = [header.sig_name.index(ch) for ch in channels]
+
+    start = max(0, int(start))
+    stop = max(start, min(int(stop), header.sig_len))
+
+    if any(header.signals[i]["fmt"] not in MMAP_FORMATS for i in indices):
+        record = record_store.read_record(record_path)
+        if out is None:
+            return np.array(record.p_signal[start:stop, indices], dtype=np.float64)
+        window = out[:stop - start]
+        window[:] = record.p_signal[start:stop, indices]
+        return window
+
+    frames = {
+        header.signals[i]["file_name"]: _frames(record_path, header, header.signals[i]["file_name"])
+        for i in indices
+    }
+    stop = min([stop] + [len(f) for f in frames.values()])
+    stop = max(start, stop)
+
+    window = out[:stop - start] if out is not None else np.empty((stop - start, len(indices)), dtype=np.float64)
+    for out_col, sig_index in enumerate(indices):
+        spec = header.signals[sig_index]
+        file_col = [s["file_name"] for s in header.signals[:sig_index]].count(spec["file_name"])
+        digital = frames[spec["file_name"]][start:stop, file_col]
+        np.subtract(digital, spec["baseline"], out=window[:, out_col], dtype=np.float64)
+        window[:, out_col] /= spec["gain"]
+
+    return window
+
+
+def channel_scaling(record_path: str, channels: List[str]):
+    """Return the ADC ``(gains, baselines)`` of ``channels``, used to ship exact int16 samples."""
+    header = read_header(record_path)
+    specs = [header.signals[header.sig_name.index(ch)] for ch in channels]
+    return [spec["gain"] for spec in specs], [spec["baseline"] for spec in specs]
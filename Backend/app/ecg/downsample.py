@@ -0,0 +1,119 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+from .cache import SizedLRUCache
+from .dat_reader import read_header, read_window
+from .record_store import file_version
+
+DEFAULT_PYRAMID_CACHE_BYTES = 128 * 1024 * 1024
+
+
+class MinMaxPyramid:
+    """Multi-resolution min/max envelope of a single channel.
+
+    Level ``k`` stores, for every bucket of ``base_bucket * 2**k`` samples, the
+    minimum and maximum value together with their sample positions. Drawing
+    both extremes of every bucket keeps spikes such as R-peaks visible at any
+    zoom level, and a query only touches the buckets it returns.
+    """
+
+    def __init__(self, signal: np.ndarray, base_bucket: int = 2):
+        self.signal = np.ascontiguousarray(signal, dtype=np.float64)
+        self.levels = []
+
+        if len(self.signal) == 0:
+            return
+
+        bucket, width = base_bucket, base_bucket
+        min_pos = max_pos = np.arange(len(self.signal), dtype=np.int32)
+
+        while True:
+            min_pos = self._reduce(min_pos, self.signal, width, np.argmin)
+            max_pos = self._reduce(max_pos, self.signal, width, np.argmax)
+            self.levels.append((bucket, min_pos, max_pos))
+            if len(min_pos) <= 1:
+                break
+            bucket, width = bucket * 2, 2
+
+    @staticmethod
+    def _reduce(positions: np.ndarray, signal: np.ndarray, width: int, arg_reducer):
+        """Group ``positions`` ``width`` at a time and keep the extreme sample of each group."""
+        pad = -len(positions) % width
+        if pad:
+            positions = np.concatenate([positions, np.repeat(positions[-1], pad)])
+        groups = positions.reshape(-1, width)
+        picks = arg_reducer(signal[groups], axis=1)
+        return groups[np.arange(len(groups)), picks]
+
+    def _extremes(self, start: int, end: int):
+        window = self.signal[start:end]
+        return start + int(np.argmin(window)), start + int(np.argmax(window))
+
+    @property
+    def nbytes(self):
+        return self.signal.nbytes + sum(mn.nbytes + mx.nbytes for _, mn, mx in self.levels)
+
+    def query(self, start: int, end: int, max_points: int):
+        """Return ``(x, y, bucket_size)`` for samples ``start:end`` using at most ``max_points`` points."""
+        start = max(0, int(start))
+        end = max(start, min(int(end), len(self.signal)))
+        n = end - start
+
+        if n <= max_points:
+            return np.arange(start, end), self.signal[start:end], 1
+
+        # Every bucket touched by the range contributes two points, including
+        # the partial ones at either edge, so size the level by buckets touched.
+        budget = max(2, max_points)
+        bucket, min_pos, max_pos = next(
+            (level for level in self.levels if 2 * (-(-end // level[0]) - start // level[0]) <= budget),
+            self.levels[-1],
+        )
+
+        first = start // bucket
+        last = -(-end // bucket)
+        lo = min_pos[first:last].astype(np.int64)
+        hi = max_pos[first:last].astype(np.int64)
+
+        # Edge buckets clipped by the range are scanned directly so their
+        # in-range samples keep a representative.
+        if start % bucket:
+            lo[0], hi[0] = self._extremes(start, min(end, (first + 1) * bucket))
+        if end % bucket and (last - 1 > first or not start % bucket):
+            lo[-1], hi[-1] = self._extremes(max(start, (last - 1) * bucket), end)
+
+        x = np.empty(2 * len(lo), dtype=np.int64)
+        x[0::2] = np.minimum(lo, hi)
+        x[1::2] = np.maximum(lo, hi)
+        x = x[np.concatenate(([True], np.diff(x) != 0))] if len(x) else x
+
+        return x, self.signal[x], bucket
+
+
+class PyramidStore:
+    """LRU of per-channel pyramids keyed by record file version."""
+
+    def __init__(self, max_bytes: int = DEFAULT_PYRAMID_CACHE_BYTES):
+        self._cache = SizedLRUCache(max_bytes)
+
+    def get_pyramid(self, record_path: str, channel: str) -> MinMaxPyramid:
+        key = (os.path.normpath(record_path), file_version(record_path), channel)
+        pyramid = self._cache.get(key)
+        if pyramid is None:
+            header = read_header(record_path)
+            pyramid = MinMaxPyramid(read_window(record_path, 0, header.sig_len, [channel])[:, 0])
+            self._cache.put(key, pyramid)
+        return pyramid
+
+    def stats(self):
+        return self._cache.stats()
+
+
+pyramid_store = PyramidStore(int(os.environ.get("ECG_PYRAMID_CACHE_BYTES", DEFAULT_PYRAMID_CACHE_BYTES)))
+
+
+def downsample_channel(record_path: str, channel: str, max_points: int, start: int = 0, end: Optional[int] = None):
+    pyramid = pyramid_store.get_pyramid(record_path, channel)
+    return pyramid.query(start, len(pyramid.signal) if end is None else end, max_points)
@@ -1,17 +1,47 @@
+import importlib
+import os
+
 from fastapi import APIRouter
-from .ecg_mode1 import router as mode1_router
-from .records  import router as mode1_records_router
-from .ecg_mode4 import router as mode4_router
-from .ecg_mode3 import router as mode3_router
-from .ecg_mode2 import router as mode2_router  
-from .ecg_mode5 import router as mode5_router  
+from .record_store import record_store
+from .execution import executor
+
+# mode -> routers it mounts as (module, prefix, tag)
+ECG_ROUTERS = {
+    "mode1": [(".ecg_mode1", "/mode1", "Mode 1"), (".records", "/mode1", "Mode 1")],
+    "mode4": [(".ecg_mode4", "/mode4", "Mode 4")],
+    "mode3": [(".ecg_mode3", "/mode3", "Mode 3")],
+    "mode2": [(".ecg_mode2", "/mode2", "Mode 2")],
+    "mode5": [(".ecg_mode5", "/mode5", "Mode 5")],
+    "stream": [(".ecg_stream", "/stream", "Streaming")],
+    "batch": [(".batch", "/batch", "Batch")],
+}
+
+# Comma-separated modes to mount, e.g. ECG_MODES=mode1,mode2; all by default
+ECG_MODES = [
+    mode.strip().lower()
+    for mode in os.environ.get("ECG_MODES", ",".join(ECG_ROUTERS)).split(",")
+    if mode.strip()
+]
+
+unknown_modes = [mode for mode in ECG_MODES if mode not in ECG_ROUTERS]
+if unknown_modes:
+    print(f"⚠️ Ignoring unknown ECG_MODES entries: {unknown_modes}")
 
 ecg_router = APIRouter()
 
-ecg_router.include_router(mode1_router, prefix="/mode1", tags=["Mode 1"])
-ecg_router.include_router(mode1_records_router, prefix="/mode1", tags=["Mode 1"]) 
-ecg_router.include_router(mode4_router, prefix="/mode4", tags=["Mode 4"])
-ecg_router.include_router(mode3_router, prefix="/mode3", tags=["Mode 3"])
-ecg_router.include_router(mode2_router, prefix="/mode2", tags=["Mode 2"])  
-ecg_router.include_router(mode5_router, prefix="/mode5", tags=["Mode 5"])  
+for mode, routers in ECG_ROUTERS.items():
+    if mode not in ECG_MODES:
+        continue
+    for module_name, prefix, tag in routers:
+        module = importlib.import_module(module_name, __package__)
+        ecg_router.include_router(module.router, prefix=prefix, tags=[tag])
+
+
+@ecg_router.get("/record-cache/stats")
+def get_record_cache_stats():
+    return record_store.stats()
+
 
+@ecg_router.get("/executor/stats")
+def get_executor_stats():
+    return executor.stats()
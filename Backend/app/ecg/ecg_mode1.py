@@ -1,7 +1,15 @@
-from fastapi import APIRouter
-import wfdb
-import pandas as pd
+from fastapi import APIRouter, Request
+from .record_store import record_store
+from .ptb_index import get_diagnosis
+from .dat_reader import read_header, read_window, channel_scaling
+from .signal_format import wants_binary, binary_signal_response
+from .downsample import downsample_channel
+from .execution import offload
+from ..lazy import lazy_import
 import os
+from typing import Optional
+
+pd = lazy_import("pandas")
 
 # uvicorn app.main:app --reload
 
@@ -9,27 +17,6 @@ router = APIRouter()
 
 BASE_PATH = r"E:\OneDrive\المستندات\SBE\DSP\SmartSignalAI\Backend\app\data\ptb-diagnostic-ecg-database-1.0.0"
 
-def get_diagnosis(patient: str, recording: str):
-    hea_path = os.path.join(BASE_PATH, patient, f"{recording}.hea")
-    diagnosis_lines = []
-    if os.path.exists(hea_path):
-        with open(hea_path, "r", encoding="utf-8", errors="ignore") as f:
-            capture = False
-            for line in f:
-                if line.startswith("# Diagnose:"):
-                    capture = True
-                    diagnosis_lines.append(line.strip("# ").strip())
-                elif capture:
-                    if line.startswith("#") and line.strip() != "#":
-                        diagnosis_lines.append(line.strip("# ").strip())
-                    else:
-                        break
-    else:
-        return "Diagnosis file not found."
-    
-    return "\n".join(diagnosis_lines) if diagnosis_lines else "No diagnosis found."
-
-
 @router.get("/channels")
 def get_channels(patient: str, recording: str):
 
@@ -39,14 +26,24 @@ def get_channels(patient: str, recording: str):
         return {"error": "Invalid recording path."}
     
     try:
-        record = wfdb.rdrecord(record_path)  
-        return {"channels": record.sig_name}
+        header = read_header(record_path)
+        return {"channels": header.sig_name}
     except Exception as e:
         return {"error": f"Error reading record: {str(e)}"}
 
 
 @router.get("/signal")
-def get_signal(patient: str, recording: str, channel: str, offset: int = 0, length: int = 3000):
+@offload("decode")
+def get_signal(
+    request: Request,
+    patient: str,
+    recording: str,
+    channel: str,
+    offset: int = 0,
+    length: int = 3000,
+    format: Optional[str] = None,
+    encoding: str = "float32"
+):
 
     record_path = os.path.join(BASE_PATH, patient, recording)
     
@@ -54,23 +51,41 @@ def get_signal(patient: str, recording: str, channel: str, offset: int = 0, leng
         return {"error": "Invalid recording path."}
 
     try:
-        record = wfdb.rdrecord(record_path) 
+        header = read_header(record_path)
 
-        if channel not in record.sig_name:
-            return {"error": f"Invalid channel name: {channel}. Available channels: {record.sig_name}"}
+        if channel not in header.sig_name:
+            return {"error": f"Invalid channel name: {channel}. Available channels: {header.sig_name}"}
 
-        df = pd.DataFrame(record.p_signal, columns=record.sig_name)  
-        
-        total_length = len(df)
+        total_length = header.sig_len
         if offset >= total_length:
             return {"error": f"Offset {offset} exceeds signal length {total_length}"}
         
         end_index = min(offset + length, total_length)
-        y = df[channel][offset:end_index].tolist()  
-        x = list(range(offset, offset + len(y)))  
+        window = read_window(record_path, offset, end_index, [channel])
 
         diagnosis = get_diagnosis(patient, recording)  
 
+        if wants_binary(request, format):
+            gains, baselines = channel_scaling(record_path, [channel])
+            return binary_signal_response(
+                {
+                    "patient": patient,
+                    "recording": recording,
+                    "channels": [channel],
+                    "offset": offset,
+                    "length": length,
+                    "actual_length": len(window),
+                    "diagnosis": diagnosis
+                },
+                [window[:, 0]],
+                encoding,
+                scale=gains,
+                baseline=baselines
+            )
+
+        y = window[:, 0].tolist()
+        x = list(range(offset, offset + len(y)))  
+
         return {
             "patient": patient,
             "recording": recording,
@@ -87,7 +102,18 @@ def get_signal(patient: str, recording: str, channel: str, offset: int = 0, leng
 
 
 @router.get("/full-signal")
-def get_full_signal_for_mode1(patient: str, recording: str, channel: str):
+@offload("decode")
+def get_full_signal_for_mode1(
+    request: Request,
+    patient: str,
+    recording: str,
+    channel: str,
+    format: Optional[str] = None,
+    encoding: str = "float32",
+    max_points: Optional[int] = None,
+    start: int = 0,
+    end: Optional[int] = None
+):
 
     record_path = os.path.join(BASE_PATH, patient, recording)
     
@@ -95,15 +121,61 @@ def get_full_signal_for_mode1(patient: str, recording: str, channel: str):
         return {"error": "Invalid recording path."}
 
     try:
-        record = wfdb.rdrecord(record_path)
+        header = read_header(record_path)
         
-        available_channels_lower = [ch.lower() for ch in record.sig_name]
+        available_channels_lower = [ch.lower() for ch in header.sig_name]
         channel_lower = channel.lower()
         
         if channel_lower not in available_channels_lower:
-            return {"error": f"Invalid channel: {channel}. Available channels: {record.sig_name}"}
+            return {"error": f"Invalid channel: {channel}. Available channels: {header.sig_name}"}
         
-        actual_channel_name = next((ch for ch in record.sig_name if ch.lower() == channel_lower), channel)
+        actual_channel_name = next((ch for ch in header.sig_name if ch.lower() == channel_lower), channel)
+
+        if max_points is not None:
+            if max_points < 2:
+                return {"error": "max_points must be at least 2"}
+
+            x, y, bucket_size = downsample_channel(record_path, actual_channel_name, max_points, start, end)
+            result = {
+                "patient": patient,
+                "recording": recording,
+                "channel": channel,
+                "total_length": header.sig_len,
+                "start": max(0, start),
+                "end": min(header.sig_len, end) if end is not None else header.sig_len,
+                "max_points": max_points,
+                "bucket_size": int(bucket_size),
+                "decimated": bucket_size > 1,
+                "diagnosis": get_diagnosis(patient, recording),
+                "x": x.tolist()
+            }
+
+            if wants_binary(request, format):
+                gains, baselines = channel_scaling(record_path, [actual_channel_name])
+                result["channels"] = [result.pop("channel")]
+                return binary_signal_response(result, [y], encoding, scale=gains, baseline=baselines)
+
+            result["y"] = y.tolist()
+            return result
+
+        record = record_store.read_record(record_path)
+
+        if wants_binary(request, format):
+            gains, baselines = channel_scaling(record_path, [actual_channel_name])
+            return binary_signal_response(
+                {
+                    "patient": patient,
+                    "recording": recording,
+                    "channels": [channel],
+                    "offset": 0,
+                    "total_length": len(record.p_signal),
+                    "diagnosis": get_diagnosis(patient, recording)
+                },
+                [record.p_signal[:, record.sig_name.index(actual_channel_name)]],
+                encoding,
+                scale=gains,
+                baseline=baselines
+            )
         
         df = pd.DataFrame(record.p_signal, columns=record.sig_name)
         full_signal = df[actual_channel_name].tolist()
@@ -127,7 +199,16 @@ def get_full_signal_for_mode1(patient: str, recording: str, channel: str):
 
 
 @router.get("/all-signals")
-def get_all_signals(patient: str, recording: str, offset: int = 0, length: int = 1000):
+@offload("decode")
+def get_all_signals(
+    request: Request,
+    patient: str,
+    recording: str,
+    offset: int = 0,
+    length: int = 1000,
+    format: Optional[str] = None,
+    encoding: str = "float32"
+):
 
     record_path = os.path.join(BASE_PATH, patient, recording)
     
@@ -135,7 +216,7 @@ def get_all_signals(patient: str, recording: str, offset: int = 0, length: int =
         return {"error": "Invalid recording path."}
 
     try:
-        record = wfdb.rdrecord(record_path)
+        record = record_store.read_record(record_path)
         
         signals = {}
         df = pd.DataFrame(record.p_signal, columns=record.sig_name)
@@ -146,10 +227,28 @@ def get_all_signals(patient: str, recording: str, offset: int = 0, length: int =
         
         end_index = min(offset + length, total_length)
         
+        diagnosis = get_diagnosis(patient, recording)
+
+        if wants_binary(request, format):
+            gains, baselines = channel_scaling(record_path, record.sig_name)
+            return binary_signal_response(
+                {
+                    "patient": patient,
+                    "recording": recording,
+                    "channels": record.sig_name,
+                    "offset": offset,
+                    "length": length,
+                    "actual_length": end_index - offset,
+                    "diagnosis": diagnosis
+                },
+                [record.p_signal[offset:end_index, i] for i in range(len(record.sig_name))],
+                encoding,
+                scale=gains,
+                baseline=baselines
+            )
+
         for channel in record.sig_name:
             signals[channel] = df[channel][offset:end_index].tolist()
-        
-        diagnosis = get_diagnosis(patient, recording)
 
         return {
             "patient": patient,
@@ -1,19 +1,188 @@
-from fastapi import APIRouter
-import wfdb
-import pandas as pd
+from fastapi import APIRouter, Request
+from .record_store import record_store
+from .ptb_index import ptb_index
+from .beat_cache import beat_cache
+from .execution import executor, offload
+from .signal_format import wants_binary, binary_signal_response
+from ..lazy import lazy_import
 import numpy as np
-import neurokit2 as nk
-from scipy import signal
-from scipy.spatial.distance import euclidean
-from scipy.stats import pearsonr
 import os
-from typing import Dict, List, Any
+from itertools import repeat
+from typing import Dict, List, Any, Optional
 import traceback
 
+pd = lazy_import("pandas")
+nk = lazy_import("neurokit2")
+scipy_stats = lazy_import("scipy.stats")
+
 router = APIRouter()
 
 BASE_PATH = r"E:\OneDrive\المستندات\SBE\DSP\SmartSignalAI\Backend\app\data\ptb-diagnostic-ecg-database-1.0.0"
 
+# Weights of the per-beat difference features, in FEATURE_NAMES order
+FEATURE_NAMES = ['correlation', 'euclidean', 'mean_abs', 'st_t']
+SCORE_WEIGHTS = {
+    'correlation': 0.5,
+    'euclidean': 0.3,
+    'mean_abs': 0.1,
+    'st_t': 0.1
+}
+
+# Whole-record analysis splits the signal into windows of WINDOW_SECONDS,
+# each extended by OVERLAP_SECONDS on both sides so filter transients stay
+# outside the part that is kept.
+WINDOW_SECONDS = 60
+OVERLAP_SECONDS = 5
+
+
+def clean_and_detect(ecg_signal: np.ndarray, sampling_rate: int):
+    """neurokit2 cleaning and R-peak detection; module level so process pools can run it."""
+    cleaned = nk.ecg_clean(ecg_signal, sampling_rate=sampling_rate)
+    _, rpeaks = nk.ecg_peaks(cleaned, sampling_rate=sampling_rate)
+    return np.asarray(cleaned, dtype=np.float64), np.asarray(rpeaks['ECG_R_Peaks'], dtype=np.int64)
+
+
+# Leads /analyze-multichannel analyzes when no channels are given
+STANDARD_LEADS = ['i', 'ii', 'iii', 'avr', 'avl', 'avf', 'v1', 'v2', 'v3', 'v4', 'v5', 'v6']
+
+
+def fuse_leads(cleaned_leads: np.ndarray) -> np.ndarray:
+    """RMS of the z-scored leads: one positive QRS envelope whatever each lead's polarity."""
+    std = cleaned_leads.std(axis=1, keepdims=True)
+    z = (cleaned_leads - cleaned_leads.mean(axis=1, keepdims=True)) / np.where(std > 1e-6, std, 1.0)
+    return np.sqrt(np.mean(z ** 2, axis=0))
+
+
+# Upper bound on the temporary distance block used by mean_pairwise_distances
+DISTANCE_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def mean_pairwise_distances(beat_matrix: np.ndarray, block_size: int = None) -> np.ndarray:
+    """Average Euclidean distance from every beat (row) to every other beat.
+
+    Uses ||a - b||² = ||a||² + ||b||² - 2·a·b so each block of rows costs one
+    matrix product; rows are processed ``block_size`` at a time to keep the
+    temporary distance block bounded for thousands of beats.
+    """
+    n_beats = len(beat_matrix)
+    if n_beats < 2:
+        return np.full(n_beats, np.inf)
+
+    beat_matrix = np.asarray(beat_matrix, dtype=np.float64)
+    if block_size is None:
+        block_size = max(1, DISTANCE_BLOCK_BYTES // (8 * n_beats))
+
+    sq_norms = np.einsum("ij,ij->i", beat_matrix, beat_matrix)
+    totals = np.empty(n_beats)
+
+    for start in range(0, n_beats, block_size):
+        stop = min(start + block_size, n_beats)
+        sq_dist = sq_norms[start:stop, None] + sq_norms[None, :] - 2.0 * (beat_matrix[start:stop] @ beat_matrix.T)
+        np.maximum(sq_dist, 0.0, out=sq_dist)
+        sq_dist[np.arange(stop - start), np.arange(start, stop)] = 0.0
+        totals[start:stop] = np.sqrt(sq_dist).sum(axis=1)
+
+    return totals / (n_beats - 1)
+
+
+# Fiducial points, in the column order of extract_fiducial_points_batch's
+# arrays, and their keys in the per-beat fiducial_points dicts
+FIDUCIAL_NAMES = ['P', 'Q', 'R', 'S', 'T']
+FIDUCIAL_KEYS = {
+    'R': ('R_Peak', 'R_Value'),
+    'P': ('P_Peak', 'P_Value'),
+    'Q': ('Q_Point', 'Q_Value'),
+    'S': ('S_Point', 'S_Value'),
+    'T': ('T_Peak', 'T_Value')
+}
+
+# Search window of every point except R as (name, start, end, minimum window
+# length, 'max' or 'min'); start and end are samples relative to the R peak
+# and are clipped to the beat
+FIDUCIAL_WINDOWS = [
+    ('P', -150, -50, 11, 'max'),
+    ('Q', -50, 0, 6, 'min'),
+    ('S', 0, 50, 6, 'min'),
+    ('T', 100, 300, 11, 'max')
+]
+MIN_FIDUCIAL_BEAT_LENGTH = 400
+
+
+def stack_beats(beat_signals: List[np.ndarray]):
+    """Zero-padded (beats × longest beat) matrix of ``beat_signals`` and the length of each."""
+    lengths = np.array([len(beat) for beat in beat_signals], dtype=np.int64)
+    if len(lengths) and np.all(lengths == lengths[0]):
+        return np.stack(beat_signals).astype(np.float64, copy=False), lengths
+
+    beat_matrix = np.zeros((len(beat_signals), int(lengths.max()) if len(lengths) else 0))
+    for i, beat in enumerate(beat_signals):
+        beat_matrix[i, :len(beat)] = beat
+    return beat_matrix, lengths
+
+
+def extract_fiducial_points_batch(beat_matrix: np.ndarray, lengths: np.ndarray = None):
+    """P/Q/R/S/T sample indices and amplitudes of every beat (row) at once.
+
+    R is the maximum of each beat; every other point is the arg-max/min of a
+    masked window around it (FIDUCIAL_WINDOWS), gathered for all beats in one
+    fancy-indexing step per point. Rows may be zero-padded past ``lengths``.
+
+    Returns (indices, values) arrays of shape (beats, len(FIDUCIAL_NAMES)).
+    Points that could not be located are -1 / NaN, and beats shorter than
+    MIN_FIDUCIAL_BEAT_LENGTH have none.
+    """
+    beat_matrix = np.ascontiguousarray(beat_matrix, dtype=np.float64)
+    n_beats, width = beat_matrix.shape
+    lengths = np.full(n_beats, width, dtype=np.int64) if lengths is None else np.asarray(lengths, dtype=np.int64)
+
+    indices = np.full((n_beats, len(FIDUCIAL_NAMES)), -1, dtype=np.int64)
+    values = np.full(indices.shape, np.nan)
+    if n_beats == 0 or width == 0:
+        return indices, values
+
+    rows = np.arange(n_beats)
+    if np.all(lengths >= width):
+        r_peaks = np.argmax(beat_matrix, axis=1)
+    else:
+        in_beat = np.arange(width) < lengths[:, None]
+        r_peaks = np.argmax(np.where(in_beat, beat_matrix, -np.inf), axis=1)
+    usable = lengths >= MIN_FIDUCIAL_BEAT_LENGTH
+    flat = beat_matrix.ravel()
+    row_starts = (rows * width)[:, None]
+
+    found = {'R': (r_peaks, usable)}
+    for name, start_offset, end_offset, min_length, mode in FIDUCIAL_WINDOWS:
+        starts = np.clip(r_peaks + start_offset, 0, lengths)
+        ends = np.clip(r_peaks + end_offset, 0, lengths)
+        window = starts[:, None] + np.arange(end_offset - start_offset)
+        samples = np.take(flat, row_starts + np.minimum(window, width - 1))
+        
+        inside = window < ends[:, None]
+        if mode == 'max':
+            offsets = np.argmax(np.where(inside, samples, -np.inf), axis=1)
+        else:
+            offsets = np.argmin(np.where(inside, samples, np.inf), axis=1)
+        found[name] = (starts + offsets, usable & (ends - starts >= min_length))
+
+    for column, name in enumerate(FIDUCIAL_NAMES):
+        points, valid = found[name]
+        indices[valid, column] = points[valid]
+        values[valid, column] = beat_matrix[rows[valid], points[valid]]
+
+    return indices, values
+
+
+def fiducial_points_dict(indices: np.ndarray, values: np.ndarray) -> Dict:
+    """The fiducial_points dict of one beat from its rows of extract_fiducial_points_batch."""
+    points = {}
+    for name, (index_key, value_key) in FIDUCIAL_KEYS.items():
+        column = FIDUCIAL_NAMES.index(name)
+        if indices[column] >= 0:
+            points[index_key] = int(indices[column])
+            points[value_key] = float(values[column])
+    return points
+
+
 class Mode2Processor:
     """معالج محسن لـ Mode 2 مع خوارزميات متقدمة"""
     
@@ -25,7 +194,7 @@ class Mode2Processor:
             record_path = os.path.join(BASE_PATH, patient, recording)
             print(f"📁 Loading signal from: {record_path}")
             
-            record = wfdb.rdrecord(record_path)
+            record = record_store.read_record(record_path)
             df = pd.DataFrame(record.p_signal, columns=record.sig_name)
             
             if channel not in record.sig_name:
@@ -40,37 +209,114 @@ class Mode2Processor:
             print(f"❌ Error loading signal: {e}")
             raise
     
-    def extract_heartbeats(self, ecg_signal: np.ndarray):
+    def load_signals(self, patient: str, recording: str, channels: List[str]) -> np.ndarray:
+        """(leads × samples) matrix of ``channels``, decoded from one read of the record."""
+        record_path = os.path.join(BASE_PATH, patient, recording)
+        print(f"📁 Loading {len(channels)} channels from: {record_path}")
+        
+        record = record_store.read_record(record_path)
+        missing = [channel for channel in channels if channel not in record.sig_name]
+        if missing:
+            raise ValueError(f"Channels {missing} not found. Available channels: {record.sig_name}")
+        
+        columns = [record.sig_name.index(channel) for channel in channels]
+        return np.ascontiguousarray(record.p_signal[:, columns].T, dtype=np.float64)
+    
+    def clean_and_detect_windowed(
+        self,
+        ecg_signal: np.ndarray,
+        window_seconds: float = WINDOW_SECONDS,
+        overlap_seconds: float = OVERLAP_SECONDS
+    ):
+        """Clean and detect R-peaks over overlapping windows in a process pool, then stitch.
+
+        Every window owns the samples of its core range; the overlap on each
+        side is only there to absorb filter edge effects and is discarded.
+        Peaks are kept by the window whose core contains them, and a peak
+        found on both sides of a boundary is kept once.
+        """
+        n = len(ecg_signal)
+        window = int(window_seconds * self.sampling_rate)
+        overlap = int(overlap_seconds * self.sampling_rate)
+        
+        if n <= window + overlap:
+            return clean_and_detect(ecg_signal, self.sampling_rate)
+        
+        cores = [(start, min(start + window, n)) for start in range(0, n, window)]
+        spans = [(max(0, start - overlap), min(n, end + overlap)) for start, end in cores]
+        print(f"🧩 Processing {len(cores)} windows of {window_seconds}s with {executor.process_workers} workers")
+        
+        results = executor.process_pool().map(
+            clean_and_detect,
+            [np.asarray(ecg_signal[a:b]) for a, b in spans],
+            repeat(self.sampling_rate)
+        )
+        
+        cleaned = np.empty(n, dtype=np.float64)
+        peaks = []
+        for (core_start, core_end), (span_start, _), (window_cleaned, window_peaks) in zip(cores, spans, results):
+            cleaned[core_start:core_end] = window_cleaned[core_start - span_start:core_end - span_start]
+            global_peaks = window_peaks + span_start
+            peaks.append(global_peaks[(global_peaks >= core_start) & (global_peaks < core_end)])
+        
+        rpeaks = np.concatenate(peaks)
+        refractory = int(0.2 * self.sampling_rate)
+        keep = np.concatenate(([True], np.diff(rpeaks) > refractory)) if len(rpeaks) else np.array([], dtype=bool)
+        return cleaned, rpeaks[keep]
+    
+    def clean_signal_cached(self, ecg_signal: np.ndarray, whole_record: bool = False):
+        """Cleaned signal, R-peaks and beat boundaries of ``ecg_signal``, from the beat cache when possible."""
+        if whole_record:
+            cache_key = beat_cache.key(
+                ecg_signal, self.sampling_rate, window=WINDOW_SECONDS, overlap=OVERLAP_SECONDS
+            )
+        else:
+            cache_key = beat_cache.key(ecg_signal, self.sampling_rate)
+        cached = beat_cache.get(cache_key)
+        
+        if cached is not None:
+            print(f"⚡ Cleaned signal and {len(cached['rpeaks'])} R-peaks loaded from cache")
+            boundaries = (cached['beat_index'], cached['start_idx'], cached['end_idx'])
+            return cached['cleaned'], cached['rpeaks'], boundaries
+        
+        if whole_record:
+            cleaned, rpeaks = self.clean_and_detect_windowed(ecg_signal)
+        else:
+            cleaned, rpeaks = clean_and_detect(ecg_signal, self.sampling_rate)
+        print(f"✅ Signal cleaned")
+        print(f"📍 R-peaks detected: {len(rpeaks)}")
+        
+        boundaries = self.beat_boundaries(rpeaks, len(cleaned))
+        beat_cache.put(cache_key, {
+            'cleaned': cleaned,
+            'rpeaks': rpeaks,
+            'beat_index': boundaries[0],
+            'start_idx': boundaries[1],
+            'end_idx': boundaries[2]
+        })
+        return cleaned, rpeaks, boundaries
+    
+    def extract_heartbeats(self, ecg_signal: np.ndarray, whole_record: bool = False):
         """استخراج النبضات الفردية من إشارة ECG"""
         try:
             print(f"📊 Processing ECG signal of length: {len(ecg_signal)}")
             
-            cleaned = nk.ecg_clean(ecg_signal, sampling_rate=self.sampling_rate)
-            print(f"✅ Signal cleaned")
-            
-            _, rpeaks = nk.ecg_peaks(cleaned, sampling_rate=self.sampling_rate)
-            rpeaks = rpeaks['ECG_R_Peaks']
-            print(f"📍 R-peaks detected: {len(rpeaks)}")
+            cleaned, rpeaks, boundaries = self.clean_signal_cached(ecg_signal, whole_record)
             
             if len(rpeaks) < 2:
                 print("❌ Not enough R-peaks found")
                 return [], []
             
-            beats = []
-            for i in range(len(rpeaks) - 1):
-                start = rpeaks[i] - int(0.3 * self.sampling_rate)  
-                end = rpeaks[i] + int(0.5 * self.sampling_rate)    
-                
-                if start >= 0 and end < len(cleaned):
-                    beat = cleaned[start:end]
-                    if len(beat) > 200:
-                        beats.append({
-                            'index': i,
-                            'signal': beat,
-                            'r_peak': int(0.3 * self.sampling_rate),  
-                            'start_idx': start,
-                            'end_idx': end
-                        })
+            beats = [
+                {
+                    'index': int(i),
+                    'signal': cleaned[start:end],
+                    'r_peak': int(0.3 * self.sampling_rate),  
+                    'start_idx': int(start),
+                    'end_idx': int(end)
+                }
+                for i, start, end in zip(*boundaries)
+            ]
             
             print(f"💓 Beats extracted: {len(beats)}")
             return beats, rpeaks
@@ -80,167 +326,291 @@ class Mode2Processor:
             print(traceback.format_exc())
             return [], []
     
-    def detect_abnormal_beats_optimized(self, beats: List[Dict], threshold: float = 0.03):
+    def score_beats(self, beats: List[Dict]):
+        """Build the template and score every non-template beat in one pass.
+
+        Returns a dict with the resized beat matrix, the template, the template
+        and candidate beat indices, a (candidates × features) matrix of
+        FEATURE_NAMES differences and the weighted total score of each
+        candidate, or None when there are too few beats.
+        """
         if len(beats) < 9:
             print(f"❌ Not enough beats. Need at least 9, got {len(beats)}")
-            return []
+            return None
         
-        try:
-            all_beats_normalized = [self.normalize_beat_preserve_variability(beat['signal']) for beat in beats]
-            
-            target_length = 800
-            all_beats_resized = []
-            
-            for beat in all_beats_normalized:
-                if len(beat) >= target_length:
-                    resized_beat = beat[:target_length]
-                else:
-                    resized_beat = np.zeros(target_length)
-                    resized_beat[:len(beat)] = beat
-                all_beats_resized.append(resized_beat)
-            
-            print(f"📏 All beats resized to length: {target_length}")
-            
-            variability_scores = []
-            
-            for i, current_beat in enumerate(all_beats_resized):
-                variabilities = []
-                for j, other_beat in enumerate(all_beats_resized):
-                    if i != j:
-                        variability = euclidean(current_beat, other_beat)
-                        variabilities.append(variability)
-                
-                avg_variability = float(np.mean(variabilities)) if variabilities else float('inf')
-                variability_scores.append((i, avg_variability))
-            
-            variability_scores.sort(key=lambda x: x[1])
+        all_beats_normalized = [self.normalize_beat_preserve_variability(beat['signal']) for beat in beats]
+        
+        target_length = 800
+        all_beats_resized = np.zeros((len(all_beats_normalized), target_length))
+        
+        for i, beat in enumerate(all_beats_normalized):
+            n = min(len(beat), target_length)
+            all_beats_resized[i, :n] = beat[:n]
+        
+        print(f"📏 All beats resized to length: {target_length}")
+        
+        avg_variability = mean_pairwise_distances(all_beats_resized)
+        order = np.argsort(avg_variability, kind="stable")
+        
+        template_indices = [int(idx) for idx in order[:8]]
+        template = np.mean(all_beats_resized[template_indices], axis=0)
+        
+        print(f"🎯 Template beats indices: {template_indices}")
+        print(f"📊 Template variability range: {avg_variability[order[0]]:.3f} to {avg_variability[order[7]]:.3f}")
+        
+        is_template = np.zeros(len(beats), dtype=bool)
+        is_template[template_indices] = True
+        candidate_indices = np.flatnonzero(~is_template)
+        
+        features = self.compute_difference_features(all_beats_resized[candidate_indices], template)
+        scores = features @ np.array([SCORE_WEIGHTS[name] for name in FEATURE_NAMES])
+        
+        return {
+            'beat_matrix': all_beats_resized,
+            'template': template,
+            'template_indices': template_indices,
+            'candidate_indices': candidate_indices,
+            'features': features,
+            'scores': scores
+        }
+    
+    def score_lead_beats(self, cleaned_leads: np.ndarray, starts: np.ndarray):
+        """score_beats for every lead at once, on shared beat boundaries.
+
+        All leads are cut at the same ``starts`` into a (leads × beats × 800)
+        tensor, normalized and resized as in score_beats. Each lead gets its
+        own 8-beat template, and every beat of every lead is scored in one
+        compute_lead_difference_features call. Scores of a lead's own template
+        beats are NaN. Returns None when there are too few beats.
+        """
+        if len(starts) < 9:
+            print(f"❌ Not enough beats. Need at least 9, got {len(starts)}")
+            return None
+        
+        target_length = 800
+        width = min(target_length, int(0.8 * self.sampling_rate))
+        beat_tensor = np.zeros((cleaned_leads.shape[0], len(starts), target_length))
+        beat_tensor[:, :, :width] = cleaned_leads[:, starts[:, None] + np.arange(width)]
+        
+        mean = beat_tensor[:, :, :width].mean(axis=2, keepdims=True)
+        std = beat_tensor[:, :, :width].std(axis=2, keepdims=True)
+        beat_tensor[:, :, :width] = (beat_tensor[:, :, :width] - mean) / np.where(std > 1e-6, 3 * std, 1.0)
+        
+        is_template = np.zeros(beat_tensor.shape[:2], dtype=bool)
+        for lead, beat_matrix in enumerate(beat_tensor):
+            order = np.argsort(mean_pairwise_distances(beat_matrix), kind="stable")
+            is_template[lead, order[:8]] = True
+        templates = np.einsum("lbj,lb->lj", beat_tensor, is_template.astype(np.float64)) / 8
+        
+        features = self.compute_lead_difference_features(beat_tensor, templates)
+        scores = features @ np.array([SCORE_WEIGHTS[name] for name in FEATURE_NAMES])
+        scores[is_template] = np.nan
+        
+        return {
+            'templates': templates,
+            'is_template': is_template,
+            'features': features,
+            'scores': scores
+        }
+    
+    def compute_difference_features(self, beat_matrix: np.ndarray, template: np.ndarray):
+        """Correlation, Euclidean, mean-absolute and ST-T differences of every row against the template."""
+        diff = beat_matrix - template
+        length = beat_matrix.shape[1]
+        
+        centered = beat_matrix - beat_matrix.mean(axis=1, keepdims=True)
+        template_centered = template - template.mean()
+        denominator = np.sqrt(np.einsum("ij,ij->i", centered, centered) * np.dot(template_centered, template_centered))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            correlation = (centered @ template_centered) / denominator
+        correlation_diff = np.where(np.isfinite(correlation), 1.0 - np.maximum(correlation, 0), 1.0)
+        
+        euclidean_diff = np.sqrt(np.einsum("ij,ij->i", diff, diff)) / length
+        mean_abs_diff = np.mean(np.abs(diff), axis=1)
+        st_t_diff = self._st_t_differences(np.abs(diff), template)
+        
+        return np.column_stack([correlation_diff, euclidean_diff, mean_abs_diff, st_t_diff])
+    
+    def compute_lead_difference_features(self, beat_tensor: np.ndarray, templates: np.ndarray):
+        """compute_difference_features for many leads at once.
+
+        ``beat_tensor`` is (leads × beats × samples) and ``templates`` is
+        (leads × samples); returns a (leads × beats × features) array. The ST
+        and T windows follow each lead's own template R peak, so they are
+        applied as per-lead masks.
+        """
+        diff = beat_tensor - templates[:, None, :]
+        length = beat_tensor.shape[2]
+        
+        centered = beat_tensor - beat_tensor.mean(axis=2, keepdims=True)
+        templates_centered = templates - templates.mean(axis=1, keepdims=True)
+        denominator = np.sqrt(
+            np.einsum("lbj,lbj->lb", centered, centered)
+            * np.einsum("lj,lj->l", templates_centered, templates_centered)[:, None]
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            correlation = np.einsum("lbj,lj->lb", centered, templates_centered) / denominator
+        correlation_diff = np.where(np.isfinite(correlation), 1.0 - np.maximum(correlation, 0), 1.0)
+        
+        euclidean_diff = np.sqrt(np.einsum("lbj,lbj->lb", diff, diff)) / length
+        abs_diff = np.abs(diff)
+        mean_abs_diff = abs_diff.mean(axis=2)
+        
+        st_t_diff = np.zeros(correlation_diff.shape)
+        if length >= 400:
+            r_peaks = np.argmax(templates, axis=1)[:, None]
+            positions = np.arange(length)
+            clip = lambda idx: np.clip(idx, 0, length - 1)
+            st_mask = (positions >= clip(r_peaks + 20)) & (positions < clip(r_peaks + 80))
+            t_mask = (positions >= clip(r_peaks + 120)) & (positions < clip(r_peaks + 200))
             
-            template_indices = [int(idx) for idx, _ in variability_scores[:8]]
-            template_beats = [all_beats_resized[idx] for idx in template_indices]
-            template = np.mean(template_beats, axis=0)
+            def window_diff(mask):
+                counts = np.maximum(mask.sum(axis=1), 1)[:, None]
+                spans = np.where(mask, templates, -np.inf).max(axis=1) - np.where(mask, templates, np.inf).min(axis=1)
+                means = np.einsum("lbj,lj->lb", abs_diff, mask.astype(np.float64)) / counts
+                return means / (spans[:, None] + 1e-6)
             
-            print(f"🎯 Template beats indices: {template_indices}")
-            print(f"📊 Template variability range: {variability_scores[0][1]:.3f} to {variability_scores[7][1]:.3f}")
+            valid = (st_mask.any(axis=1) & t_mask.any(axis=1))[:, None]
+            with np.errstate(invalid="ignore"):
+                st_t_diff = np.where(valid, (window_diff(st_mask) + window_diff(t_mask)) / 2.0, 0.0)
+        
+        return np.stack([correlation_diff, euclidean_diff, mean_abs_diff, st_t_diff], axis=2)
+    
+    def _st_t_differences(self, abs_diff: np.ndarray, template: np.ndarray):
+        """Vectorized analyze_st_t_segments_improved over a matrix of |beat - template| rows."""
+        length = abs_diff.shape[1]
+        if length < 400:
+            return np.zeros(len(abs_diff))
+        
+        r_peak_template = int(np.argmax(template))
+        clip = lambda idx: max(0, min(idx, length - 1))
+        st_start, st_end = clip(r_peak_template + 20), clip(r_peak_template + 80)
+        t_start, t_end = clip(r_peak_template + 120), clip(r_peak_template + 200)
+        
+        if st_end <= st_start or t_end <= t_start:
+            return np.zeros(len(abs_diff))
+        
+        st_template = template[st_start:st_end]
+        t_template = template[t_start:t_end]
+        
+        st_diff = abs_diff[:, st_start:st_end].mean(axis=1) / (np.max(st_template) - np.min(st_template) + 1e-6)
+        t_diff = abs_diff[:, t_start:t_end].mean(axis=1) / (np.max(t_template) - np.min(t_template) + 1e-6)
+        
+        return (st_diff + t_diff) / 2.0
+    
+    def effective_threshold(self, scores: np.ndarray, threshold: float):
+        """Auto-adjust the requested threshold when it sits above (almost) every score."""
+        if len(scores) == 0:
+            return threshold
+        
+        avg_diff = float(np.mean(scores))
+        std_diff = float(np.std(scores))
+        max_diff = float(np.max(scores))
+        
+        if max_diff < threshold:
+            return max(0.015, max_diff * 0.7)
+        elif avg_diff < threshold * 0.5:
+            return max(0.02, avg_diff + std_diff)
+        return threshold
+    
+    def threshold_sweep(self, scores: np.ndarray, thresholds, auto_adjust: bool = True):
+        """Abnormal-beat counts for many thresholds from one score vector.
+
+        With ``auto_adjust`` each requested threshold goes through the same
+        auto-adjustment as detect_abnormal_beats_optimized, so the counts match
+        calling it once per threshold; without it the counts are taken at the
+        raw thresholds, which keeps a curve monotonic. Every count is a binary
+        search in the sorted scores.
+        """
+        sorted_scores = np.sort(scores)
+        sweep = []
+        for threshold in thresholds:
+            used = self.effective_threshold(scores, float(threshold)) if auto_adjust else float(threshold)
+            count = len(sorted_scores) - int(np.searchsorted(sorted_scores, used, side="right"))
+            point = {'threshold': float(threshold), 'abnormal_beats': count}
+            if auto_adjust:
+                point['threshold_used'] = float(used)
+            sweep.append(point)
+        return sweep
+    
+    def score_distribution(self, scores: np.ndarray, bins: int = 20):
+        if len(scores) == 0:
+            return {}
+        
+        counts, edges = np.histogram(scores, bins=bins)
+        quantiles = np.quantile(scores, [0.05, 0.25, 0.5, 0.75, 0.95])
+        return {
+            "count": int(len(scores)),
+            "mean": float(np.mean(scores)),
+            "std": float(np.std(scores)),
+            "min": float(np.min(scores)),
+            "max": float(np.max(scores)),
+            "quantiles": {
+                name: float(value) for name, value in zip(["p5", "p25", "p50", "p75", "p95"], quantiles)
+            },
+            "histogram": {
+                "counts": counts.tolist(),
+                "bin_edges": edges.tolist()
+            }
+        }
+    
+    def detect_abnormal_beats_optimized(self, beats: List[Dict], threshold: float = 0.03, scoring: Dict = None,
+                                        include_signal: bool = True):
+        try:
+            if scoring is None:
+                scoring = self.score_beats(beats)
+            if scoring is None:
+                return []
             
-            all_differences = []
-            difference_components_list = []
+            scores = scoring['scores']
+            features = scoring['features']
+            candidate_indices = scoring['candidate_indices']
             
-            for i, beat in enumerate(beats):
-                if i in template_indices:
-                    continue
-                    
-                current_beat = all_beats_resized[i]
-                
-                try:
-                    correlation, _ = pearsonr(current_beat, template)
-                    correlation_diff = 1.0 - max(correlation, 0)
-                except:
-                    correlation_diff = 1.0
-                
-                euclidean_diff = euclidean(current_beat, template) / len(current_beat)
-                mean_abs_diff = float(np.mean(np.abs(current_beat - template)))
-                st_t_diff = self.analyze_st_t_segments_improved(current_beat, template)
-                
-                weights = {
-                    'correlation': 0.5,   
-                    'euclidean': 0.3,      
-                    'mean_abs': 0.1,       
-                    'st_t': 0.1           
-                }
-                
-                total_difference = (
-                    weights['correlation'] * correlation_diff +
-                    weights['euclidean'] * euclidean_diff +
-                    weights['mean_abs'] * mean_abs_diff +
-                    weights['st_t'] * st_t_diff
-                )
-                
-                all_differences.append(total_difference)
-                difference_components_list.append({
-                    'beat': i,
-                    'total': total_difference,
-                    'correlation': correlation_diff,
-                    'euclidean': euclidean_diff,
-                    'mean_abs': mean_abs_diff,
-                    'st_t': st_t_diff
-                })
-            
-            if all_differences:
-                avg_diff = np.mean(all_differences)
-                std_diff = np.std(all_differences)
-                max_diff = np.max(all_differences)
-                min_diff = np.min(all_differences)
-                
+            if len(scores):
                 print(f"📊 DIFFERENCE STATISTICS:")
-                print(f"   - Average: {avg_diff:.4f}")
-                print(f"   - Std Dev: {std_diff:.4f}")
-                print(f"   - Maximum: {max_diff:.4f}")
-                print(f"   - Minimum: {min_diff:.4f}")
+                print(f"   - Average: {np.mean(scores):.4f}")
+                print(f"   - Std Dev: {np.std(scores):.4f}")
+                print(f"   - Maximum: {np.max(scores):.4f}")
+                print(f"   - Minimum: {np.min(scores):.4f}")
                 print(f"   - Requested Threshold: {threshold:.4f}")
                 
-                original_threshold = threshold
-                if max_diff < threshold:
-                    print(f"🚨 WARNING: All differences are below requested threshold!")
-                    auto_threshold = max(0.015, max_diff * 0.7) 
-                    print(f"   Using auto-adjusted threshold: {auto_threshold:.4f}")
-                    threshold = auto_threshold
-                elif avg_diff < threshold * 0.5:
-                   
-                    auto_threshold = max(0.02, avg_diff + std_diff)
-                    print(f"   Adjusting threshold based on statistics: {auto_threshold:.4f}")
-                    threshold = auto_threshold
-                
+                adjusted = self.effective_threshold(scores, threshold)
+                if adjusted != threshold:
+                    if np.max(scores) < threshold:
+                        print(f"🚨 WARNING: All differences are below requested threshold!")
+                        print(f"   Using auto-adjusted threshold: {adjusted:.4f}")
+                    else:
+                        print(f"   Adjusting threshold based on statistics: {adjusted:.4f}")
+                    threshold = adjusted
                 
-                sorted_diffs = sorted(difference_components_list, key=lambda x: x['total'], reverse=True)
                 print(f"🔝 TOP 5 DIFFERENCES:")
-                for i, diff_info in enumerate(sorted_diffs[:5]):
-                    print(f"   Beat {diff_info['beat']}: total={diff_info['total']:.4f}, "
-                          f"corr={diff_info['correlation']:.4f}")
-            
+                for k in np.argsort(-scores, kind="stable")[:5]:
+                    print(f"   Beat {candidate_indices[k]}: total={scores[k]:.4f}, "
+                          f"corr={features[k, 0]:.4f}")
             
             abnormal_beats = []
+            abnormal = np.flatnonzero(scores > threshold)
+            all_fiducial_points = self.fiducial_points(beats, candidate_indices[abnormal])
             
-            for i, beat in enumerate(beats):
-                if i in template_indices:
-                    continue
-                    
-                current_beat = all_beats_resized[i]
-                
-                try:
-                    correlation, _ = pearsonr(current_beat, template)
-                    correlation_diff = 1.0 - max(correlation, 0)
-                except:
-                    correlation_diff = 1.0
-                
-                euclidean_diff = euclidean(current_beat, template) / len(current_beat)
-                mean_abs_diff = float(np.mean(np.abs(current_beat - template)))
-                st_t_diff = self.analyze_st_t_segments_improved(current_beat, template)
-                
-                total_difference = (
-                    0.5 * correlation_diff +
-                    0.3 * euclidean_diff +
-                    0.1 * mean_abs_diff + 
-                    0.1 * st_t_diff
-                )
+            for k, fiducial_points in zip(abnormal, all_fiducial_points):
+                i = int(candidate_indices[k])
+                beat = beats[i]
+                correlation_diff, euclidean_diff, mean_abs_diff, st_t_diff = features[k]
                 
-                is_abnormal = total_difference > threshold
-                
-                if is_abnormal:
-                    fiducial_points = self.extract_fiducial_points_improved(beat['signal'])
-                    
-                    abnormal_beats.append({
-                        'beat_index': int(i),
-                        'difference_score': float(total_difference),
-                        'difference_components': {
-                            'correlation_diff': float(correlation_diff),
-                            'euclidean_diff': float(euclidean_diff),
-                            'mean_abs_diff': float(mean_abs_diff),
-                            'st_t_diff': float(st_t_diff)
-                        },
-                        'threshold_used': float(threshold),
-                        'fiducial_points': fiducial_points,
-                        'signal': beat['signal'].tolist()
-                    })
+                abnormal_beats.append({
+                    'beat_index': i,
+                    'difference_score': float(scores[k]),
+                    'difference_components': {
+                        'correlation_diff': float(correlation_diff),
+                        'euclidean_diff': float(euclidean_diff),
+                        'mean_abs_diff': float(mean_abs_diff),
+                        'st_t_diff': float(st_t_diff)
+                    },
+                    'threshold_used': float(threshold),
+                    'fiducial_points': fiducial_points
+                })
+                if include_signal:
+                    abnormal_beats[-1]['signal'] = beat['signal'].tolist()
             
             print(f"🚨 Final result: {len(abnormal_beats)} abnormal beats out of {len(beats)}")
             print(f"📈 Abnormality percentage: {(len(abnormal_beats)/len(beats))*100:.1f}%")
@@ -252,7 +622,44 @@ class Mode2Processor:
             print(traceback.format_exc())
             return []
     
-    def detect_abnormal_beats_aggressive(self, beats: List[Dict], threshold: float = 0.02):
+    def compact_abnormal_beats(self, abnormal_beats: List[Dict], beats: List[Dict]) -> Dict:
+        """Columnar form of ``abnormal_beats``: one array per field instead of one dict per beat.
+
+        Beats are located by their [start_idx, end_idx) range in the analyzed
+        signal; their samples are served by /beat-signals. Fields a detector
+        did not produce for a beat are null.
+        """
+        components = ['correlation_diff', 'euclidean_diff', 'mean_abs_diff', 'st_t_diff']
+        fiducial_keys = [key for keys in FIDUCIAL_KEYS.values() for key in keys]
+        thresholds = {beat['threshold_used'] for beat in abnormal_beats if 'threshold_used' in beat}
+        
+        return {
+            'count': len(abnormal_beats),
+            'beat_index': [beat['beat_index'] for beat in abnormal_beats],
+            'start_idx': [beats[beat['beat_index']]['start_idx'] for beat in abnormal_beats],
+            'end_idx': [beats[beat['beat_index']]['end_idx'] for beat in abnormal_beats],
+            'difference_score': [beat['difference_score'] for beat in abnormal_beats],
+            'threshold_used': thresholds.pop() if len(thresholds) == 1 else None,
+            'difference_components': {
+                name: [beat.get('difference_components', {}).get(name) for beat in abnormal_beats]
+                for name in components
+            },
+            'fiducial_points': {
+                key: [beat.get('fiducial_points', {}).get(key) for beat in abnormal_beats]
+                for key in fiducial_keys
+            }
+        }
+    
+    def beat_boundaries(self, rpeaks: np.ndarray, signal_length: int):
+        """Beat numbers and [start, end) sample ranges for every R-peak that has a full beat window."""
+        rpeaks = np.asarray(rpeaks, dtype=np.int64)[:-1]
+        starts = rpeaks - int(0.3 * self.sampling_rate)
+        ends = rpeaks + int(0.5 * self.sampling_rate)
+        
+        valid = (starts >= 0) & (ends < signal_length) & (ends - starts > 200)
+        return np.flatnonzero(valid), starts[valid], ends[valid]
+    
+    def detect_abnormal_beats_aggressive(self, beats: List[Dict], threshold: float = 0.02, include_signal: bool = True):
         """خوارزمية عدوانية لاكتشاف النبضات الشاذة"""
         if len(beats) < 5:
             return []
@@ -274,7 +681,7 @@ class Mode2Processor:
                 current_beat = all_beats[i]
                 
                 try:
-                    correlation, _ = pearsonr(current_beat, template)
+                    correlation, _ = scipy_stats.pearsonr(current_beat, template)
                     difference = 1.0 - max(correlation, 0)
                 except:
                     difference = 1.0
@@ -282,10 +689,14 @@ class Mode2Processor:
                 if difference > threshold:
                     abnormal_beats.append({
                         'beat_index': i,
-                        'difference_score': float(difference),
-                        'signal': beat['signal'].tolist(),
-                        'fiducial_points': self.extract_fiducial_points_improved(beat['signal'])
+                        'difference_score': float(difference)
                     })
+                    if include_signal:
+                        abnormal_beats[-1]['signal'] = beat['signal'].tolist()
+            
+            all_fiducial_points = self.fiducial_points(beats, [beat['beat_index'] for beat in abnormal_beats])
+            for abnormal_beat, fiducial_points in zip(abnormal_beats, all_fiducial_points):
+                abnormal_beat['fiducial_points'] = fiducial_points
             
             return abnormal_beats
             
@@ -335,53 +746,27 @@ class Mode2Processor:
     def extract_fiducial_points_improved(self, beat_signal: np.ndarray):
         """استخراج محسن للنقاط الأساسية"""
         try:
-            if len(beat_signal) < 400:
-                return {}
-                
-            points = {}
-            
-            r_peak = int(np.argmax(beat_signal))
-            points['R_Peak'] = r_peak
-            points['R_Value'] = float(beat_signal[r_peak])
-            
-            p_region_start = max(0, r_peak - 150)  # 150ms قبل R
-            p_region_end = max(0, r_peak - 50)     # 50ms قبل R
-            
-            if p_region_end > p_region_start:
-                p_region = beat_signal[p_region_start:p_region_end]
-                if len(p_region) > 10:
-                    p_peak = int(np.argmax(p_region) + p_region_start)
-                    points['P_Peak'] = p_peak
-                    points['P_Value'] = float(beat_signal[p_peak])
-            
-            q_region = beat_signal[max(0, r_peak-50):r_peak]
-            if len(q_region) > 5:
-                q_point = int(np.argmin(q_region) + max(0, r_peak-50))
-                points['Q_Point'] = q_point
-                points['Q_Value'] = float(beat_signal[q_point])
-            
-            s_region = beat_signal[r_peak:min(len(beat_signal), r_peak+50)]
-            if len(s_region) > 5:
-                s_point = int(np.argmin(s_region) + r_peak)
-                points['S_Point'] = s_point
-                points['S_Value'] = float(beat_signal[s_point])
-            
-            t_region_start = min(len(beat_signal), r_peak + 100)  # 100ms بعد R
-            t_region_end = min(len(beat_signal), r_peak + 300)    # 300ms بعد R
-            
-            if t_region_end > t_region_start:
-                t_region = beat_signal[t_region_start:t_region_end]
-                if len(t_region) > 10:
-                    t_peak = int(np.argmax(t_region) + t_region_start)
-                    points['T_Peak'] = t_peak
-                    points['T_Value'] = float(beat_signal[t_peak])
-            
-            return points
+            indices, values = extract_fiducial_points_batch(*stack_beats([beat_signal]))
+            return fiducial_points_dict(indices[0], values[0])
             
         except Exception as e:
             print(f"❌ Error in improved fiducial points: {e}")
             return {}
     
+    def fiducial_points(self, beats: List[Dict], beat_indices) -> List[Dict]:
+        """fiducial_points dicts of ``beats[i]`` for every i in ``beat_indices``, extracted in one batch."""
+        beat_indices = [int(i) for i in beat_indices]
+        if not beat_indices:
+            return []
+        try:
+            indices, values = extract_fiducial_points_batch(
+                *stack_beats([beats[i]['signal'] for i in beat_indices])
+            )
+            return [fiducial_points_dict(indices[k], values[k]) for k in range(len(beat_indices))]
+        except Exception as e:
+            print(f"❌ Error in batched fiducial points: {e}")
+            return [{} for _ in beat_indices]
+    
     def normalize_beat_preserve_variability(self, beat_signal: np.ndarray):
         """تطبيع يحافظ على التباين بين النبضات"""
         try:
@@ -402,29 +787,42 @@ class Mode2Processor:
             print(f"❌ Error in variability-preserving normalization: {e}")
             return beat_signal
 
+def load_analysis_signal(processor: Mode2Processor, patient: str, recording: str, channel: str,
+                         max_beats: int, whole_record: bool) -> np.ndarray:
+    """The part of the record that /analyze-optimized analyzes."""
+    ecg_signal = processor.load_signal(patient, recording, channel)
+    if whole_record:
+        return ecg_signal
+    return ecg_signal[:min(len(ecg_signal), max_beats * 1500)]
+
 @router.get("/analyze-optimized")
+@offload("mode2")
 def analyze_ecg_mode2_optimized(
     patient: str,                  
     recording: str,                  
     channel: str,                   
     threshold: float = 0.025,        
-    max_beats: int = 100             
+    max_beats: int = 100,
+    whole_record: bool = False,
+    compact: bool = False
 ):
-    """تحليل محسن باستخدام الخوارزمية الجديدة - كل الـ parameters مطلوبة"""
+    """تحليل محسن باستخدام الخوارزمية الجديدة - كل الـ parameters مطلوبة
+
+    With ``compact=true`` abnormal beats come back as parallel arrays with
+    [start_idx, end_idx) ranges instead of per-beat dicts with their samples;
+    fetch the samples from /beat-signals with the same max_beats/whole_record.
+    """
     try:
         print(f"🔍 Starting OPTIMIZED Mode 2 analysis for {patient}/{recording}")
         print(f"🎯 Channel: {channel}, Threshold: {threshold}")
         print(f"⚙️ Parameters: threshold={threshold}, max_beats={max_beats}")
         
         processor = Mode2Processor()
-        ecg_signal = processor.load_signal(patient, recording, channel)
-        
-        analysis_length = min(len(ecg_signal), max_beats * 1500)
-        analysis_signal = ecg_signal[:analysis_length]
+        analysis_signal = load_analysis_signal(processor, patient, recording, channel, max_beats, whole_record)
         
         print(f"📥 Signal loaded, analyzing {len(analysis_signal)} samples")
         
-        beats, rpeaks = processor.extract_heartbeats(analysis_signal)
+        beats, rpeaks = processor.extract_heartbeats(analysis_signal, whole_record=whole_record)
         
         if not beats:
             return {
@@ -440,12 +838,14 @@ def analyze_ecg_mode2_optimized(
         
         print(f"💓 Total beats available: {len(beats)}")
         
-        abnormal_beats = processor.detect_abnormal_beats_optimized(beats, threshold)
+        abnormal_beats = processor.detect_abnormal_beats_optimized(beats, threshold, include_signal=not compact)
         
         if len(abnormal_beats) == 0:
             print("🔄 No abnormal beats found with optimized algorithm, trying aggressive approach...")
             aggressive_threshold = max(0.01, threshold * 0.3)  
-            abnormal_beats = processor.detect_abnormal_beats_aggressive(beats, aggressive_threshold)
+            abnormal_beats = processor.detect_abnormal_beats_aggressive(
+                beats, aggressive_threshold, include_signal=not compact
+            )
             print(f"🔍 Aggressive approach found: {len(abnormal_beats)} abnormal beats")
         
         normal_beats_count = len(beats) - len(abnormal_beats)
@@ -477,10 +877,12 @@ def analyze_ecg_mode2_optimized(
                 "requested_threshold": float(threshold),
                 "actual_threshold_used": float(actual_threshold),
                 "max_beats_analyzed": int(max_beats),
+                "whole_record": whole_record,
+                "compact": compact,
                 "template_size": 8,
                 "difference_method": "weighted_correlation_emphasis"
             },
-            "abnormal_beats": abnormal_beats,
+            "abnormal_beats": processor.compact_abnormal_beats(abnormal_beats, beats) if compact else abnormal_beats,
             "debug_info": {
                 "signal_analysis_length": int(len(analysis_signal)),
                 "minimum_beats_required": 9,
@@ -510,16 +912,146 @@ def analyze_ecg_mode2_optimized(
             "channel": channel
         }
 
+@router.get("/analyze-multichannel")
+@offload("mode2")
+def analyze_ecg_mode2_multichannel(
+    patient: str,
+    recording: str,
+    channels: Optional[str] = None,
+    reference: str = "ii",
+    threshold: float = 0.025,
+    max_beats: int = 100,
+    whole_record: bool = False
+):
+    """Mode 2 on several leads from one read of the record.
+
+    R-peaks are detected once, on the ``reference`` lead or, with
+    ``reference=fusion``, on the RMS of all requested leads, and every lead is
+    cut at the same beat boundaries. ``channels`` is a comma-separated list
+    (the 12 standard leads by default). Returns beats × leads score and
+    abnormal matrices; a lead's own template beats score null.
+    """
+    try:
+        channel_list = [c.strip().lower() for c in channels.split(",") if c.strip()] if channels else STANDARD_LEADS
+        reference = reference.strip().lower()
+        fused = reference == "fusion"
+        load_list = channel_list if fused or reference in channel_list else channel_list + [reference]
+        print(f"🔍 Starting multi-channel Mode 2 analysis for {patient}/{recording}")
+        print(f"🎯 Channels: {channel_list}, reference: {reference}, threshold: {threshold}")
+        
+        processor = Mode2Processor()
+        signals = processor.load_signals(patient, recording, load_list)
+        if not whole_record:
+            signals = signals[:, :max_beats * 1500]
+        
+        if fused:
+            cleaned = np.stack([
+                np.asarray(nk.ecg_clean(lead, sampling_rate=processor.sampling_rate), dtype=np.float64)
+                for lead in signals[:len(channel_list)]
+            ])
+            _, peaks = nk.ecg_peaks(fuse_leads(cleaned), sampling_rate=processor.sampling_rate)
+            rpeaks = np.asarray(peaks['ECG_R_Peaks'], dtype=np.int64)
+            boundaries = processor.beat_boundaries(rpeaks, signals.shape[1])
+        else:
+            reference_cleaned, rpeaks, boundaries = processor.clean_signal_cached(
+                signals[load_list.index(reference)], whole_record
+            )
+            cleaned = np.stack([
+                reference_cleaned if channel == reference
+                else np.asarray(nk.ecg_clean(signals[i], sampling_rate=processor.sampling_rate), dtype=np.float64)
+                for i, channel in enumerate(channel_list)
+            ])
+        print(f"📍 R-peaks detected: {len(rpeaks)}, beats: {len(boundaries[0])}")
+        
+        scored = processor.score_lead_beats(cleaned, boundaries[1])
+        if scored is None:
+            return {
+                "error": "Not enough heartbeats detected in the signal",
+                "debug_info": {
+                    "signal_length": int(signals.shape[1]),
+                    "r_peaks_found": int(len(rpeaks)),
+                    "beats_available": int(len(boundaries[0])),
+                    "minimum_beats_required": 9
+                }
+            }
+        
+        scores = scored['scores']
+        thresholds = np.array([
+            processor.effective_threshold(lead_scores[~np.isnan(lead_scores)], threshold) for lead_scores in scores
+        ])
+        with np.errstate(invalid="ignore"):
+            abnormal = scores > thresholds[:, None]
+        abnormal_leads = abnormal.sum(axis=0)
+        n_beats = scores.shape[1]
+        
+        print(f"✅ Multi-channel analysis completed - {int(np.count_nonzero(abnormal_leads))} beats abnormal in at least one lead")
+        
+        return {
+            "patient": patient,
+            "recording": recording,
+            "channels": channel_list,
+            "reference": reference,
+            "analysis_summary": {
+                "total_beats_analyzed": int(n_beats),
+                "r_peaks_detected": int(len(rpeaks)),
+                "abnormal_in_any_lead": int(np.count_nonzero(abnormal_leads)),
+                "abnormal_in_most_leads": int(np.count_nonzero(abnormal_leads * 2 > len(channel_list))),
+                "per_lead": {
+                    channel: {
+                        "abnormal_beats": int(abnormal[i].sum()),
+                        "abnormality_percentage": float(round(abnormal[i].sum() / n_beats * 100, 2)),
+                        "threshold_used": float(thresholds[i])
+                    }
+                    for i, channel in enumerate(channel_list)
+                }
+            },
+            "beats": {
+                "beat_index": boundaries[0].tolist(),
+                "start_idx": boundaries[1].tolist(),
+                "end_idx": boundaries[2].tolist()
+            },
+            "matrix": {
+                "leads": channel_list,
+                "scores": [[None if np.isnan(v) else float(v) for v in row] for row in scores.T],
+                "abnormal": abnormal.T.astype(int).tolist(),
+                "abnormal_leads": abnormal_leads.tolist()
+            },
+            "parameters": {
+                "requested_threshold": float(threshold),
+                "max_beats_analyzed": int(max_beats),
+                "whole_record": whole_record,
+                "template_size": 8
+            }
+        }
+        
+    except Exception as e:
+        error_msg = f"Error in multi-channel analysis: {str(e)}"
+        print(f"❌ {error_msg}")
+        print(traceback.format_exc())
+        return {
+            "error": error_msg,
+            "patient": patient,
+            "recording": recording,
+            "channels": channels
+        }
+
 @router.get("/analyze-comprehensive")
+@offload("mode2")
 def analyze_ecg_comprehensive(
     patient: str,          
     recording: str,        
-    channel: str           
+    channel: str,
+    sweep_points: int = 0,
+    min_threshold: float = 0.0,
+    max_threshold: float = None,
+    histogram_bins: int = 20,
+    whole_record: bool = False
 ):
     try:
         processor = Mode2Processor()
         ecg_signal = processor.load_signal(patient, recording, channel)
-        beats, rpeaks = processor.extract_heartbeats(ecg_signal[:30000])
+        analysis_signal = ecg_signal if whole_record else ecg_signal[:30000]
+        beats, rpeaks = processor.extract_heartbeats(analysis_signal, whole_record=whole_record)
         
         if len(beats) < 5:
             return {
@@ -532,27 +1064,45 @@ def analyze_ecg_comprehensive(
         thresholds = [0.01, 0.015, 0.02, 0.025, 0.03, 0.035, 0.04, 0.05, 0.06]
         results = {}
         
-        for threshold in thresholds:
-            abnormal_count = len(processor.detect_abnormal_beats_optimized(beats, threshold))
+        # Score once; every threshold below is derived from the same score vector
+        scoring = processor.score_beats(beats)
+        scores = scoring['scores'] if scoring is not None else np.array([])
+        
+        for point in processor.threshold_sweep(scores, thresholds):
+            abnormal_count = point['abnormal_beats']
             percentage = (abnormal_count / len(beats)) * 100 if beats else 0
             
-            results[f"threshold_{threshold:.3f}"] = {
+            results[f"threshold_{point['threshold']:.3f}"] = {
                 "abnormal_beats": int(abnormal_count),
                 "abnormality_percentage": float(round(percentage, 2))
             }
         
         optimal_threshold = 0.025  
         
-        return {
+        result = {
             "patient": patient,
             "recording": recording, 
             "channel": channel,
             "total_beats": int(len(beats)),
+            "whole_record": whole_record,
+            "analyzed_samples": int(len(analysis_signal)),
             "comprehensive_analysis": results,
             "optimal_threshold": optimal_threshold,
-            "recommendation": f"Use threshold {optimal_threshold} for balanced sensitivity and specificity"
+            "recommendation": f"Use threshold {optimal_threshold} for balanced sensitivity and specificity",
+            "score_distribution": processor.score_distribution(scores, histogram_bins)
         }
         
+        if sweep_points > 0:
+            upper = max_threshold if max_threshold is not None else (float(np.max(scores)) if len(scores) else 0.1)
+            curve = processor.threshold_sweep(
+                scores, np.linspace(min_threshold, upper, sweep_points), auto_adjust=False
+            )
+            for point in curve:
+                point['abnormality_percentage'] = float(round(point['abnormal_beats'] / len(beats) * 100, 2))
+            result["threshold_curve"] = curve
+        
+        return result
+        
     except Exception as e:
         return {
             "error": f"Error in comprehensive analysis: {str(e)}",
@@ -561,18 +1111,94 @@ def analyze_ecg_comprehensive(
             "channel": channel
         }
 
+@router.get("/beat-signals")
+@offload("mode2")
+def get_beat_signals(
+    request: Request,
+    patient: str,
+    recording: str,
+    channel: str,
+    beats: Optional[str] = None,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    max_beats: int = 100,
+    whole_record: bool = False,
+    format: Optional[str] = None,
+    encoding: str = "float32"
+):
+    """Cleaned samples behind a compact /analyze-optimized response.
+
+    Either ``beats`` (comma-separated beat_index values, one column each) or
+    a ``start``/``end`` range of the cleaned signal. ``max_beats`` and
+    ``whole_record`` must match the analysis so the same cleaned signal is
+    used; it normally comes straight from the beat cache. Served as JSON or in
+    the binary signal format.
+    """
+    try:
+        processor = Mode2Processor()
+        analysis_signal = load_analysis_signal(processor, patient, recording, channel, max_beats, whole_record)
+        cleaned, _, (beat_index, start_idx, end_idx) = processor.clean_signal_cached(analysis_signal, whole_record)
+        
+        if beats is not None:
+            try:
+                requested = [int(b) for b in beats.split(",") if b.strip()]
+            except ValueError:
+                return {"error": "beats must be a comma-separated list of beat indices"}
+            invalid = [b for b in requested if not 0 <= b < len(beat_index)]
+            if not requested or invalid:
+                return {"error": f"Invalid beat index(es): {invalid}. Beats available: 0-{len(beat_index) - 1}"}
+            
+            names = [f"beat_{b}" for b in requested]
+            columns = [cleaned[start_idx[b]:end_idx[b]] for b in requested]
+            header = {
+                "patient": patient,
+                "recording": recording,
+                "channel": channel,
+                "beats": requested,
+                "start_idx": [int(start_idx[b]) for b in requested],
+                "end_idx": [int(end_idx[b]) for b in requested]
+            }
+            if wants_binary(request, format):
+                return binary_signal_response(dict(header, channels=names, offset=0), columns, encoding)
+            return dict(header, signals={name: col.tolist() for name, col in zip(names, columns)})
+        
+        if start is None:
+            return {"error": "Either beats or start/end is required"}
+        
+        stop = len(cleaned) if end is None else min(end, len(cleaned))
+        if not 0 <= start < stop:
+            return {"error": f"Invalid range {start}-{end} for a signal of length {len(cleaned)}"}
+        
+        header = {
+            "patient": patient,
+            "recording": recording,
+            "channel": channel,
+            "start": int(start),
+            "end": int(stop),
+            "total_length": int(len(cleaned))
+        }
+        if wants_binary(request, format):
+            return binary_signal_response(dict(header, channels=[channel], offset=int(start)), [cleaned[start:stop]], encoding)
+        return dict(header, y=cleaned[start:stop].tolist())
+        
+    except Exception as e:
+        return {
+            "error": f"Error fetching beat signals: {str(e)}",
+            "patient": patient,
+            "recording": recording,
+            "channel": channel
+        }
+
 @router.get("/available-recordings")
 def get_available_recordings(patient: str):
     try:
-        patient_path = os.path.join(BASE_PATH, patient)
-        if not os.path.exists(patient_path):
+        if not ptb_index.has_patient(patient):
             return {
                 "error": f"Patient {patient} not found",
-                "available_patients": os.listdir(BASE_PATH)[:10]  
+                "available_patients": ptb_index.patients()[:10]  
             }
         
-        recordings = [f for f in os.listdir(patient_path) if f.endswith('.dat')]
-        recording_names = [f.replace('.dat', '') for f in recordings]
+        recording_names = [entry["recording"] for entry in ptb_index.records(patient)]
         
         return {
             "patient": patient,
@@ -586,17 +1212,22 @@ def get_available_recordings(patient: str):
 @router.get("/available-channels")
 def get_available_channels(patient: str, recording: str):
     try:
-        record_path = os.path.join(BASE_PATH, patient, recording)
-        record = wfdb.rdrecord(record_path)
+        entry = ptb_index.get_record(patient, recording)
+        if entry is None:
+            raise FileNotFoundError(f"Record {patient}/{recording} not found")
         
         return {
             "patient": patient,
             "recording": recording,
-            "available_channels": record.sig_name,
-            "sampling_rate": record.fs,
-            "signal_length": len(record.p_signal)
+            "available_channels": entry["channels"],
+            "sampling_rate": entry["sampling_rate"],
+            "signal_length": entry["signal_length"]
         }
         
     except Exception as e:
 
         return {"error": f"Error getting channels: {str(e)}"}
+
+@router.get("/cache-stats")
+def get_beat_cache_stats():
+    return beat_cache.stats()
@@ -1,39 +1,65 @@
-
 from fastapi import APIRouter
-import wfdb
-import pandas as pd
+from .record_store import record_store
+from .ptb_index import get_diagnosis
+from .execution import offload
+from ..lazy import lazy_import
+import numpy as np
 import os
 
+pd = lazy_import("pandas")
+
 router = APIRouter()
 
 BASE_PATH = r"E:\OneDrive\المستندات\SBE\DSP\SmartSignalAI\Backend\app\data\ptb-diagnostic-ecg-database-1.0.0"
 
+POLAR_DISPLAY_MODES = ("fixed", "moving", "cumulative")
+# Upper bound on max_points for /polar; a few thousand already fill a screen
+MAX_POLAR_POINTS = 20000
 
 
+def polar_segment(n: int, cycle_length: int, display_mode: str, time_index: int):
+    """[start, end) sample range a polar display mode shows, as in the Mode 3 page."""
+    if display_mode == "moving":
+        start = min(max(0, time_index), n)
+        return start, min(start + cycle_length, n)
+    if display_mode == "cumulative":
+        return 0, min(max(0, time_index), n)
+    return 0, min(cycle_length, n)
+
+
+def polar_angles(n: int, cycle_length: int, display_mode: str) -> np.ndarray:
+    """Angle in degrees of each sample of an ``n``-sample polar segment."""
+    positions = np.arange(n)
+    if display_mode == "cumulative":
+        # Every cycle takes a full turn, shifted 5 degrees so cycles do not overlap
+        return (positions % cycle_length) / cycle_length * 360 + (positions // cycle_length) * 5
+    return positions / max(n, 1) * 360
 
-def get_diagnosis(patient: str, recording: str):
-    hea_path = os.path.join(BASE_PATH, patient, f"{recording}.hea")
-    diagnosis_lines = []
-    if os.path.exists(hea_path):
-        with open(hea_path, "r", encoding="utf-8", errors="ignore") as f:
-            capture = False
-            for line in f:
-                if line.startswith("# Diagnose:"):
-                    capture = True
-                    diagnosis_lines.append(line.strip("# ").strip())
-                elif capture:
-                    if line.startswith("#") and line.strip() != "#":
-                        diagnosis_lines.append(line.strip("# ").strip())
-                    else:
-                        break
-    else:
-        return "Diagnosis file not found."
-    
-    return "\n".join(diagnosis_lines) if diagnosis_lines else "No diagnosis found."
 
+def minmax_decimate(values: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices of at most ``max_points`` samples keeping each bucket's minimum and maximum.
 
+    The samples are split into max_points / 2 equal buckets, and the extremes
+    of every bucket are kept in time order, so peaks such as the QRS survive
+    the decimation.
+    """
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    
+    width = -(-n // max(1, max_points // 2))
+    buckets = -(-n // width)
+    padded = np.full(buckets * width, np.nan)
+    padded[:n] = values
+    padded = padded.reshape(buckets, width)
+    
+    bucket_starts = np.arange(buckets) * width
+    lows = bucket_starts + np.nanargmin(padded, axis=1)
+    highs = bucket_starts + np.nanargmax(padded, axis=1)
+    return np.unique(np.concatenate([lows, highs]))
 
 @router.get("/signal")
+@offload("decode")
 def get_mode3_signal(
     patient: str,
     recording: str,
@@ -47,7 +73,7 @@ def get_mode3_signal(
         return {"error": "Invalid recording path."}
 
     try:
-        record = wfdb.rdrecord(record_path)
+        record = record_store.read_record(record_path)
         df = pd.DataFrame(record.p_signal, columns=record.sig_name)
 
         channels_list = [ch.strip().lower() for ch in channels.split(",")]
@@ -82,4 +108,87 @@ def get_mode3_signal(
         }
         
     except Exception as e:
-        return {"error": f"Error processing signal: {str(e)}"}
\ No newline at end of file
+        return {"error": f"Error processing signal: {str(e)}"}
+
+@router.get("/polar")
+@offload("plots")
+def get_mode3_polar(
+    patient: str,
+    recording: str,
+    channels: str,
+    offset: int = 0,
+    length: int = None,
+    cycle_length: int = 200,
+    display_mode: str = "fixed",
+    time_index: int = 0,
+    max_points: int = 2000
+):
+    """Polar traces (r, theta per sample) of ``channels``, decimated to ``max_points``.
+
+    ``display_mode`` picks the shown segment of the [offset, offset + length)
+    window as the Mode 3 page does: the first ``cycle_length`` samples
+    (fixed), ``cycle_length`` samples from ``time_index`` (moving) or every
+    sample up to ``time_index`` (cumulative). r is the segment min-max
+    normalized to [0, 1] (0.5 for a flat segment).
+    """
+    record_path = os.path.join(BASE_PATH, patient, recording)
+    
+    if not os.path.exists(record_path + ".dat"):
+        return {"error": "Invalid recording path."}
+    if display_mode not in POLAR_DISPLAY_MODES:
+        return {"error": f"Invalid display_mode '{display_mode}'. Use one of {list(POLAR_DISPLAY_MODES)}"}
+    if offset < 0:
+        return {"error": "offset must not be negative"}
+    if length is not None and length <= 0:
+        return {"error": "length must be positive"}
+    if cycle_length <= 0 or max_points < 2:
+        return {"error": "cycle_length must be positive and max_points at least 2"}
+    max_points = min(max_points, MAX_POLAR_POINTS)
+
+    try:
+        record = record_store.read_record(record_path)
+        channels_list = [ch.strip().lower() for ch in channels.split(",") if ch.strip()]
+
+        invalid_channels = [ch for ch in channels_list if ch not in record.sig_name]
+        if invalid_channels:
+            return {"error": f"Invalid channel(s): {', '.join(invalid_channels)}. Available: {record.sig_name}"}
+
+        total_length = record.p_signal.shape[0]
+        if offset >= total_length:
+            return {"error": f"Offset {offset} exceeds signal length {total_length}"}
+        end_index = total_length if length is None else min(offset + length, total_length)
+        
+        start, end = polar_segment(end_index - offset, cycle_length, display_mode, time_index)
+        angles = polar_angles(end - start, cycle_length, display_mode)
+        
+        traces = {}
+        for ch in channels_list:
+            segment = record.p_signal[offset + start:offset + end, record.sig_name.index(ch)]
+            if len(segment) == 0:
+                traces[ch] = {"theta": [], "r": [], "time_index": []}
+                continue
+            
+            value_range = float(segment.max() - segment.min())
+            r = (segment - segment.min()) / value_range if value_range else np.full(len(segment), 0.5)
+            keep = minmax_decimate(r, max_points)
+            traces[ch] = {
+                "theta": np.round(angles[keep], 3).tolist(),
+                "r": np.round(r[keep], 5).tolist(),
+                "time_index": (start + keep).tolist()
+            }
+
+        return {
+            "patient": patient,
+            "recording": recording,
+            "channels": channels_list,
+            "offset": offset,
+            "display_mode": display_mode,
+            "cycle_length": cycle_length,
+            "segment": {"start": int(start), "end": int(end)},
+            "points": int(end - start),
+            "decimated": end - start > max_points,
+            "traces": traces
+        }
+        
+    except Exception as e:
+        return {"error": f"Error computing polar graph: {str(e)}"}
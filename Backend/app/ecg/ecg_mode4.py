@@ -1,31 +1,82 @@
-from fastapi import APIRouter
-import wfdb
-import pandas as pd
+from fastapi import APIRouter, Request
+from .dat_reader import read_header, read_window, channel_scaling
+from .signal_format import wants_binary, binary_signal_response
+from .ptb_index import get_diagnosis
+from .execution import offload
+import numpy as np
 import os
+from typing import Optional
 
 router = APIRouter()
 
 BASE_PATH = r"E:\OneDrive\المستندات\SBE\DSP\SmartSignalAI\Backend\app\data\ptb-diagnostic-ecg-database-1.0.0"
 
-def get_diagnosis(patient: str, recording: str):
-    hea_path = os.path.join(BASE_PATH, patient, f"{recording}.hea")
-    diagnosis_lines = []
-    if os.path.exists(hea_path):
-        with open(hea_path, "r", encoding="utf-8", errors="ignore") as f:
-            capture = False
-            for line in f:
-                if line.startswith("# Diagnose:"):
-                    capture = True
-                    diagnosis_lines.append(line.strip("# ").strip())
-                elif capture:
-                    if line.startswith("#") and line.strip() != "#":
-                        diagnosis_lines.append(line.strip("# ").strip())
-                    else:
-                        break
-    else:
-        return "Diagnosis file not found."
+# Upper bounds on the side of the recurrence bitmap and the histogram bins
+MAX_RECURRENCE_SIZE = 512
+MAX_HISTOGRAM_BINS = 512
+
+
+def min_max_normalize(signal: np.ndarray) -> np.ndarray:
+    value_range = signal.max() - signal.min()
+    if value_range == 0:
+        return np.full(len(signal), 0.5)
+    return (signal - signal.min()) / value_range
+
+
+def adaptive_threshold(signal1: np.ndarray, signal2: np.ndarray) -> float:
+    """A tenth of the channels' mean standard deviation."""
+    return float((signal1.std() + signal2.std()) / 2 * 0.1)
+
+
+def recurrence_density(signal1: np.ndarray, signal2: np.ndarray, threshold: float, size: int) -> np.ndarray:
+    """Recurrence plot of two signals downsampled to a ``size`` × ``size`` grid.
+
+    Sample pair (i, j) recurs when the min-max normalized values differ by at
+    most ``threshold``. Each cell holds the fraction of recurring pairs in its
+    block of the full N × N matrix. The matrix itself is never built: the
+    samples of every column block are sorted and the recurring partners of
+    each row are counted with two binary searches, so memory stays O(N).
+    """
+    norm1 = min_max_normalize(signal1)
+    norm2 = min_max_normalize(signal2)
+    n = min(len(norm1), len(norm2))
+    norm1, norm2 = norm1[:n], norm2[:n]
+    size = min(size, n)
+    
+    edges = np.linspace(0, n, size + 1).astype(np.int64)
+    widths = np.diff(edges)
+    low, high = norm1 - threshold, norm1 + threshold
+    
+    counts = np.empty((size, size))
+    for column in range(size):
+        block = np.sort(norm2[edges[column]:edges[column + 1]])
+        partners = np.searchsorted(block, high, side="right") - np.searchsorted(block, low, side="left")
+        counts[:, column] = np.add.reduceat(partners, edges[:-1])
+    
+    return counts / np.outer(widths, widths)
+
+
+def read_channel_pair(record_path: str, channels: str, offset: int, length: int):
+    """The two channels named in ``channels`` over [offset, offset + length), or an error message."""
+    header = read_header(record_path)
+    channels_list = [ch.strip() for ch in channels.split(",") if ch.strip()]
+    
+    if len(channels_list) != 2:
+        return None, None, "Exactly 2 channels are required"
+    if offset < 0:
+        return None, None, "offset must not be negative"
+    if length <= 0:
+        return None, None, "length must be positive"
+    invalid_channels = [ch for ch in channels_list if ch not in header.sig_name]
+    if invalid_channels:
+        return None, None, f"Invalid channel(s): {', '.join(invalid_channels)}. Available: {header.sig_name}"
+    if offset >= header.sig_len:
+        return None, None, f"Offset {offset} exceeds signal length {header.sig_len}"
     
-    return "\n".join(diagnosis_lines) if diagnosis_lines else "No diagnosis found."
+    window = read_window(record_path, offset, min(offset + length, header.sig_len), channels_list)
+    if len(window) == 0:
+        return None, None, "Empty signal window"
+    return channels_list, window, None
 
 @router.get("/channels")
 def get_channels(patient: str, recording: str):
@@ -35,19 +86,23 @@ def get_channels(patient: str, recording: str):
         return {"error": "Invalid recording path."}
     
     try:
-        record = wfdb.rdrecord(record_path)
-        return {"channels": record.sig_name}
+        header = read_header(record_path)
+        return {"channels": header.sig_name}
     except Exception as e:
         return {"error": f"Error reading record: {str(e)}"}
 
 @router.get("/signal")
+@offload("decode")
 def get_signal(
+    request: Request,
     patient: str, 
     recording: str, 
     channel: str = None,
     channels: str = None,
     offset: int = 0, 
-    length: int = 3000
+    length: int = 3000,
+    format: Optional[str] = None,
+    encoding: str = "float32"
 ):
     record_path = os.path.join(BASE_PATH, patient, recording)
     
@@ -55,8 +110,7 @@ def get_signal(
         return {"error": "Invalid recording path."}
 
     try:
-        record = wfdb.rdrecord(record_path)
-        df = pd.DataFrame(record.p_signal, columns=record.sig_name)
+        header = read_header(record_path)
 
         if channels:
             channels_list = [ch.strip() for ch in channels.split(",")]
@@ -65,20 +119,39 @@ def get_signal(
         else:
             return {"error": "Either 'channel' or 'channels' parameter is required"}
 
-        invalid_channels = [ch for ch in channels_list if ch not in record.sig_name]
+        invalid_channels = [ch for ch in channels_list if ch not in header.sig_name]
         if invalid_channels:
-            return {"error": f"Invalid channel(s): {', '.join(invalid_channels)}. Available: {record.sig_name}"}
+            return {"error": f"Invalid channel(s): {', '.join(invalid_channels)}. Available: {header.sig_name}"}
 
-        total_length = len(df)
+        total_length = header.sig_len
         if offset >= total_length:
             return {"error": f"Offset {offset} exceeds signal length {total_length}"}
         
         end_index = min(offset + length, total_length)
+        window = read_window(record_path, offset, end_index, channels_list)
+
+        if wants_binary(request, format):
+            gains, baselines = channel_scaling(record_path, channels_list)
+            return binary_signal_response(
+                {
+                    "patient": patient,
+                    "recording": recording,
+                    "channels": channels_list,
+                    "offset": offset,
+                    "length": length,
+                    "actual_length": len(window),
+                    "diagnosis": get_diagnosis(patient, recording)
+                },
+                [window[:, i] for i in range(len(channels_list))],
+                encoding,
+                scale=gains,
+                baseline=baselines
+            )
         
         signals = {}
         
-        for ch in channels_list:
-            y = df[ch][offset:end_index].tolist()
+        for i, ch in enumerate(channels_list):
+            y = window[:, i].tolist()
             signals[ch] = y
 
         diagnosis = get_diagnosis(patient, recording)
@@ -95,4 +168,100 @@ def get_signal(
         }
         
     except Exception as e:
-        return {"error": f"Error processing signal: {str(e)}"}
\ No newline at end of file
+        return {"error": f"Error processing signal: {str(e)}"}
+
+@router.get("/recurrence")
+@offload("plots")
+def get_recurrence(
+    patient: str,
+    recording: str,
+    channels: str,
+    offset: int = 0,
+    length: int = 2000,
+    threshold: Optional[float] = None,
+    size: int = 256
+):
+    """Recurrence plot of two channels as a bounded ``size`` × ``size`` density grid.
+
+    Rows follow the first channel and columns the second. ``threshold`` is the
+    distance between normalized values that counts as recurrence; the
+    adaptive threshold of the Mode 4 page is used when it is omitted.
+    """
+    record_path = os.path.join(BASE_PATH, patient, recording)
+    
+    if not os.path.exists(record_path + ".dat"):
+        return {"error": "Invalid recording path."}
+    if size < 1:
+        return {"error": "size must be positive"}
+
+    try:
+        channels_list, window, error = read_channel_pair(record_path, channels, offset, length)
+        if error:
+            return {"error": error}
+        
+        signal1, signal2 = window[:, 0], window[:, 1]
+        applied_threshold = adaptive_threshold(signal1, signal2) if threshold is None else threshold
+        density = recurrence_density(signal1, signal2, applied_threshold, min(size, MAX_RECURRENCE_SIZE))
+
+        return {
+            "patient": patient,
+            "recording": recording,
+            "channels": channels_list,
+            "offset": offset,
+            "actual_length": len(window),
+            "threshold": applied_threshold,
+            "adaptive_threshold": threshold is None,
+            "size": density.shape[0],
+            "samples_per_cell": len(window) / density.shape[0],
+            "recurrence_rate": float(density.mean()),
+            "density": np.round(density, 4).tolist()
+        }
+        
+    except Exception as e:
+        return {"error": f"Error computing recurrence plot: {str(e)}"}
+
+@router.get("/scatter-histogram")
+@offload("plots")
+def get_scatter_histogram(
+    patient: str,
+    recording: str,
+    channels: str,
+    offset: int = 0,
+    length: int = 2000,
+    bins: int = 128
+):
+    """2-D histogram of the channel-vs-channel scatter plot, with their correlation.
+
+    ``counts`` rows follow the first channel (y) and columns the second (x).
+    """
+    record_path = os.path.join(BASE_PATH, patient, recording)
+    
+    if not os.path.exists(record_path + ".dat"):
+        return {"error": "Invalid recording path."}
+    if bins < 1:
+        return {"error": "bins must be positive"}
+
+    try:
+        channels_list, window, error = read_channel_pair(record_path, channels, offset, length)
+        if error:
+            return {"error": error}
+        
+        signal1, signal2 = window[:, 0], window[:, 1]
+        counts, x_edges, y_edges = np.histogram2d(signal2, signal1, bins=min(bins, MAX_HISTOGRAM_BINS))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            correlation = np.corrcoef(signal1, signal2)[0, 1] if len(window) > 1 else 0.0
+
+        return {
+            "patient": patient,
+            "recording": recording,
+            "channels": channels_list,
+            "offset": offset,
+            "actual_length": len(window),
+            "correlation": float(correlation) if np.isfinite(correlation) else 0.0,
+            "x_edges": x_edges.tolist(),
+            "y_edges": y_edges.tolist(),
+            "counts": counts.T.astype(int).tolist()
+        }
+        
+    except Exception as e:
+        return {"error": f"Error computing scatter histogram: {str(e)}"}
@@ -399,16 +399,43 @@ import logging
 from typing import Dict, List, Any, Optional
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-import torch
-import torch.nn as nn
-from huggingface_hub import hf_hub_download
 import hashlib
+import os
+import threading
+import time
+from collections import deque
+from numpy.lib.stride_tricks import sliding_window_view
+from .execution import executor
+from .inference_queue import MicroBatcher
+from .dat_reader import read_header, read_window
+from .result_cache import ResultCache
+from ..lazy import lazy_import
+
+torch = lazy_import("torch")
+nn = lazy_import("torch.nn")
+huggingface_hub = lazy_import("huggingface_hub")
 
 router = APIRouter()
 
+BASE_PATH = r"E:\OneDrive\المستندات\SBE\DSP\SmartSignalAI\Backend\app\data\ptb-diagnostic-ecg-database-1.0.0"
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+PTB_LEADS = ['i', 'ii', 'iii', 'avr', 'avl', 'avf', 'v1', 'v2', 'v3', 'v4', 'v5', 'v6']
+WINDOW_SIZE = 1000
+# Windows per forward pass of whole-record analysis; also the most a request may ask for
+WINDOW_BATCH_SIZE = int(os.environ.get("ECG_MODE5_WINDOW_BATCH", 64))
+
+# Model loading and CPU inference tuning
+MODEL_CACHE_DIR = os.environ.get("ECG_MODE5_MODEL_CACHE", "./model_cache")
+PRELOAD_MODEL = os.environ.get("ECG_MODE5_PRELOAD", "1") == "1"
+QUANTIZE_MODEL = os.environ.get("ECG_MODE5_QUANTIZE", "0") == "1"
+TORCHSCRIPT_MODEL = os.environ.get("ECG_MODE5_TORCHSCRIPT", "0") == "1"
+TORCH_THREADS = int(os.environ.get("ECG_MODE5_THREADS", 0))
+TORCH_INTEROP_THREADS = int(os.environ.get("ECG_MODE5_INTEROP_THREADS", 0))
+WARMUP_PASSES = int(os.environ.get("ECG_MODE5_WARMUP", 3))
+
 class PatientInfo(BaseModel):
     id: str
     age: str
@@ -425,11 +452,25 @@ class AnalysisRequest(BaseModel):
     patient_info: PatientInfo
     recording_data: RecordingData
 
+class FallbackPrediction(tuple):
+    """A (class, confidence) pair from the heuristic fallback rather than the model."""
+
 class RealECGClassifier:
     def __init__(self):
         self.model = None
         self.model_name = "zackyabd/clinical-ecg-classifier"
         self.model_loaded = False
+        self.state = "not_loaded"
+        self.model_path = None
+        self.model_version = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.optimizations = []
+        self._latencies = deque(maxlen=500)
+        self._latency_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.forward_passes = 0
+        self.forward_samples = 0
         
         self.ptb_diagnoses = [
             "Myocardial Infarction",
@@ -445,39 +486,166 @@ class RealECGClassifier:
         
         self.class_names = self.ptb_diagnoses
         
-    def load_model(self):
+    def _model_file(self, local_files_only: bool):
+        """Resolve the checkpoint from ./model_cache, downloading it only if allowed and missing."""
         try:
-            logger.info("Loading clinical ECG classifier for PTB database...")
-            
-            model_path = hf_hub_download(
+            return huggingface_hub.hf_hub_download(
                 repo_id=self.model_name,
                 filename="ecg_model.pth",
-                cache_dir="./model_cache"
+                cache_dir=MODEL_CACHE_DIR,
+                local_files_only=True
             )
+        except Exception:
+            if local_files_only:
+                raise
+            logger.info("Model not in local cache, downloading...")
+            return huggingface_hub.hf_hub_download(
+                repo_id=self.model_name,
+                filename="ecg_model.pth",
+                cache_dir=MODEL_CACHE_DIR
+            )
+
+    def _optimize_model(self, model):
+        """Apply the configured CPU optimizations, keeping each one only if it succeeds."""
+        self.optimizations = []
+        if not isinstance(model, nn.Module):
+            return model
+        
+        if QUANTIZE_MODEL:
+            try:
+                model = torch.ao.quantization.quantize_dynamic(
+                    model, {nn.Linear, nn.LSTM, nn.GRU}, dtype=torch.qint8
+                )
+                self.optimizations.append("dynamic_int8")
+            except Exception as e:
+                logger.warning(f"Dynamic quantization skipped: {e}")
+        
+        if TORCHSCRIPT_MODEL:
+            try:
+                example = torch.zeros(1, len(PTB_LEADS), WINDOW_SIZE)
+                with torch.inference_mode():
+                    traced = torch.jit.freeze(torch.jit.trace(model, example))
+                    if not torch.allclose(self._logits(model(example)), self._logits(traced(example)), atol=1e-4):
+                        raise ValueError("traced outputs differ from eager outputs")
+                model = traced
+                self.optimizations.append("torchscript")
+            except Exception as e:
+                logger.warning(f"TorchScript tracing skipped: {e}")
+        
+        return model
+
+    def _model_version(self, model_path: str):
+        """Identify the loaded weights and optimizations, so cached predictions never outlive them."""
+        stat = os.stat(model_path)
+        revision = os.path.basename(os.path.dirname(model_path))
+        fingerprint = f"{self.model_name}|{revision}|{stat.st_size}|{stat.st_mtime_ns}|{'+'.join(self.optimizations)}"
+        return hashlib.sha1(fingerprint.encode()).hexdigest()[:16]
+
+    def _warm_up(self):
+        started = time.perf_counter()
+        for batch_size in (1, WINDOW_BATCH_SIZE):
+            example = torch.zeros(batch_size, len(PTB_LEADS), WINDOW_SIZE)
+            for _ in range(WARMUP_PASSES):
+                with torch.inference_mode():
+                    self.model(example)
+        self.warmup_seconds = time.perf_counter() - started
+
+    def load_model(self, local_files_only: bool = False):
+        # The startup preload runs in a background thread; serialize it with /load-model
+        with self._load_lock:
+            return self._load_model(local_files_only)
+
+    def _load_model(self, local_files_only: bool = False):
+        started = time.perf_counter()
+        self.state = "loading"
+        try:
+            logger.info("Loading clinical ECG classifier for PTB database...")
+            
+            if TORCH_THREADS:
+                torch.set_num_threads(TORCH_THREADS)
+            if TORCH_INTEROP_THREADS:
+                try:
+                    torch.set_interop_threads(TORCH_INTEROP_THREADS)
+                except RuntimeError as e:
+                    logger.warning(f"Could not set inter-op threads: {e}")
             
-            logger.info(f"Model file downloaded to: {model_path}")
+            model_path = self._model_file(local_files_only)
+            logger.info(f"Model file found at: {model_path}")
             
-            self.model = torch.load(model_path, map_location='cpu', weights_only=False)
+            model = torch.load(model_path, map_location='cpu', weights_only=False)
             
-            if hasattr(self.model, 'eval'):
-                self.model.eval()
+            if hasattr(model, 'eval'):
+                model.eval()
+            
+            self.model = self._optimize_model(model)
+            self.model_path = model_path
+            self.model_version = self._model_version(model_path)
+            
+            if WARMUP_PASSES > 0 and isinstance(model, nn.Module):
+                try:
+                    self._warm_up()
+                except Exception as e:
+                    logger.warning(f"Warm-up failed: {e}")
             
             self.model_loaded = True
-            logger.info("SUCCESS: PTB ECG Model Loaded and Ready!")
+            self.state = "ready"
+            self.load_seconds = time.perf_counter() - started
+            logger.info(f"SUCCESS: PTB ECG Model Loaded and Ready in {self.load_seconds:.2f}s "
+                        f"(optimizations: {self.optimizations or 'none'})")
             logger.info(f"PTB Diagnoses: {self.ptb_diagnoses}")
             return True
             
         except Exception as e:
+            self.state = "failed" if not self.model_loaded else "ready"
             logger.error(f"Model loading failed: {e}")
             import traceback
             logger.error(f"Full traceback: {traceback.format_exc()}")
             return False
 
-    def preprocess_ecg_data(self, ecg_signals: dict):
-        required_leads = ['i', 'ii', 'iii', 'avr', 'avl', 'avf', 'v1', 'v2', 'v3', 'v4', 'v5', 'v6']
+    def _forward(self, batch):
+        """Softmax probabilities of one forward pass, recording its latency."""
+        started = time.perf_counter()
+        with torch.inference_mode():
+            probabilities = torch.softmax(self._logits(self.model(batch)), dim=1)
+        elapsed = time.perf_counter() - started
+        
+        with self._latency_lock:
+            self._latencies.append((elapsed, len(batch)))
+            self.forward_passes += 1
+            self.forward_samples += len(batch)
+        return probabilities
+
+    def status(self):
+        with self._latency_lock:
+            recent = list(self._latencies)
+        
+        inference = {"forward_passes": self.forward_passes, "samples": self.forward_samples}
+        if recent:
+            latencies = np.array([elapsed for elapsed, _ in recent]) * 1000
+            samples = sum(size for _, size in recent)
+            inference.update(
+                last_ms=round(float(latencies[-1]), 3),
+                mean_ms=round(float(latencies.mean()), 3),
+                p50_ms=round(float(np.percentile(latencies, 50)), 3),
+                p95_ms=round(float(np.percentile(latencies, 95)), 3),
+                mean_ms_per_sample=round(float(latencies.sum() / samples), 3)
+            )
         
+        return {
+            "state": self.state,
+            "model_path": self.model_path,
+            "model_version": self.model_version,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "warmup_seconds": round(self.warmup_seconds, 3) if self.warmup_seconds is not None else None,
+            "optimizations": self.optimizations,
+            "threads": torch.get_num_threads(),
+            "interop_threads": torch.get_num_interop_threads(),
+            "inference": inference
+        }
+
+    def preprocess_ecg_data(self, ecg_signals: dict):
         processed_data = []
-        for lead in required_leads:
+        for lead in PTB_LEADS:
             if lead in ecg_signals:
                 signal = np.array(ecg_signals[lead])
                 
@@ -495,28 +663,32 @@ class RealECGClassifier:
         ecg_tensor = torch.FloatTensor(ecg_array).unsqueeze(0)
         return ecg_tensor
 
+    def _logits(self, outputs):
+        if hasattr(outputs, 'logits'):
+            return outputs.logits
+        elif isinstance(outputs, tuple):
+            return outputs[0]
+        return outputs
+
     def predict_ecg(self, ecg_tensor):
+        return self.predict_batch([ecg_tensor])[0]
+
+    def predict_batch(self, ecg_tensors):
+        """Classify several (1, 12, 1000) inputs with a single forward pass."""
         try:
-            with torch.no_grad():
-                outputs = self.model(ecg_tensor)
-                
-                if hasattr(outputs, 'logits'):
-                    outputs = outputs.logits
-                elif isinstance(outputs, tuple):
-                    outputs = outputs[0]
-                
-                probabilities = torch.softmax(outputs, dim=1)
-                confidence, predicted = torch.max(probabilities, 1)
-                
-                predicted_class = predicted.item() % len(self.ptb_diagnoses)
-                actual_confidence = confidence.item()
-                
+            probabilities = self._forward(torch.cat(ecg_tensors, dim=0))
+            confidence, predicted = torch.max(probabilities, 1)
+            
+            predictions = []
+            for predicted_class, actual_confidence in zip(predicted.tolist(), confidence.tolist()):
+                predicted_class = predicted_class % len(self.ptb_diagnoses)
                 logger.info(f"PTB Prediction: {self.ptb_diagnoses[predicted_class]} (Confidence: {actual_confidence:.2f})")
-                return predicted_class, actual_confidence
+                predictions.append((predicted_class, actual_confidence))
+            return predictions
                 
         except Exception as e:
             logger.error(f"PTB Prediction failed: {e}")
-            return self._ptb_fallback_prediction(ecg_tensor)
+            return [self._ptb_fallback_prediction(ecg_tensor) for ecg_tensor in ecg_tensors]
 
     def _ptb_fallback_prediction(self, ecg_tensor):
         try:
@@ -541,95 +713,262 @@ class RealECGClassifier:
             confidence = 0.6 + (hash_int % 30 * 0.01)
             
             logger.info(f"PTB Fallback Prediction: {self.ptb_diagnoses[predicted_class]}")
-            return predicted_class, confidence
+            return FallbackPrediction((predicted_class, confidence))
             
         except Exception as e:
             logger.error(f"Fallback prediction failed: {e}")
-            return 8, 0.7
+            return FallbackPrediction((8, 0.7))
+
+    def extract_signals(self, recording_data: Dict[str, Any]):
+        if not self.model_loaded:
+            raise Exception("PTB AI model not loaded")
+        
+        channels_data = recording_data.get('channels', {})
+        
+        ecg_signals = {}
+        for channel_name, channel_info in channels_data.items():
+            if 'signal' in channel_info:
+                ecg_signals[channel_name] = channel_info['signal']
+        
+        logger.info(f"Analyzing {len(ecg_signals)} PTB ECG channels...")
+        
+        if not ecg_signals:
+            raise Exception("No ECG signals found in request")
+        return ecg_signals
+
+    def prepare_analysis(self, recording_data: Dict[str, Any]):
+        """Pick the channel signals out of a request and build the model input tensor."""
+        ecg_signals = self.extract_signals(recording_data)
+        input_tensor = self.preprocess_ecg_data(ecg_signals)
+        logger.info(f"PTB Input tensor shape: {input_tensor.shape}")
+        return ecg_signals, input_tensor
 
     def analyze_comprehensive_ecg(self, recording_data: Dict[str, Any], patient_info: Dict[str, Any] = None):
         try:
-            if not self.model_loaded:
-                raise Exception("PTB AI model not loaded")
-            
-            channels_data = recording_data.get('channels', {})
-            
-            ecg_signals = {}
-            for channel_name, channel_info in channels_data.items():
-                if 'signal' in channel_info:
-                    ecg_signals[channel_name] = channel_info['signal']
-            
-            logger.info(f"Analyzing {len(ecg_signals)} PTB ECG channels...")
-            
-            if not ecg_signals:
-                raise Exception("No ECG signals found in request")
-            
-            input_tensor = self.preprocess_ecg_data(ecg_signals)
-            logger.info(f"PTB Input tensor shape: {input_tensor.shape}")
-            
+            ecg_signals, input_tensor = self.prepare_analysis(recording_data)
             predicted_class, overall_confidence = self.predict_ecg(input_tensor)
-            diagnosis_description = self.ptb_diagnoses[predicted_class]
+            return self.build_analysis_result(list(ecg_signals), predicted_class, overall_confidence)
             
-            channel_analysis = {}
-            for channel_name in ecg_signals.keys():
-                channel_hash = int(hashlib.md5(channel_name.encode()).hexdigest()[:4], 16)
-                channel_confidence = max(0.5, overall_confidence - (channel_hash % 25 * 0.01))
-                
-                channel_analysis[channel_name] = {
-                    "main_diagnosis": {
-                        "diagnosis_code": f"PTB_{predicted_class}",
-                        "diagnosis_description": diagnosis_description,
-                        "confidence": round(channel_confidence * 100, 1)
-                    },
-                    "risk_level": self._assess_ptb_risk_level(predicted_class),
-                    "technical_quality": "Excellent - PTB AI Model",
-                    "secondary_findings": [
-                        "PTB Diagnostic ECG Analysis",
-                        f"Based on {len(ecg_signals)}-lead ECG",
-                        "PhysioNet PTB Database Compatible"
-                    ]
+        except Exception as e:
+            logger.error(f"PTB Analysis failed: {e}")
+            raise HTTPException(status_code=500, detail=f"PTB Analysis failed: {str(e)}")
+
+    def window_starts(self, length: int, stride: int):
+        """Start of every window; the last window is aligned to the end so the tail is covered."""
+        if length <= WINDOW_SIZE:
+            return np.array([0])
+        starts = np.arange(0, length - WINDOW_SIZE + 1, stride)
+        if starts[-1] != length - WINDOW_SIZE:
+            starts = np.append(starts, length - WINDOW_SIZE)
+        return starts
+
+    def lead_matrix(self, ecg_signals: dict):
+        """(12, n) matrix of the PTB leads, zero for missing leads and zero-padded to one window."""
+        length = max(WINDOW_SIZE, max(len(signal) for signal in ecg_signals.values()))
+        leads = np.zeros((len(PTB_LEADS), length))
+        for row, lead in enumerate(PTB_LEADS):
+            if lead in ecg_signals:
+                signal = np.asarray(ecg_signals[lead], dtype=np.float64)
+                leads[row, :len(signal)] = signal
+        return leads
+
+    def read_record_leads(self, record_path: str, offset: int = 0, length: Optional[int] = None):
+        """Read the PTB leads of ``record_path`` straight from the .dat file into a (12, n) float32 matrix.
+
+        The matrix is preallocated (zero for missing leads, at least one window
+        wide) and filled in place, so no per-sample Python objects are created.
+        Returns the matrix, the leads found and the sampling rate.
+        """
+        header = read_header(record_path)
+        offset = max(0, offset)
+        stop = header.sig_len if length is None else min(offset + length, header.sig_len)
+        if offset >= stop:
+            raise ValueError(f"Offset {offset} exceeds signal length {header.sig_len}")
+
+        channels = [lead for lead in PTB_LEADS if lead in header.sig_name]
+        if not channels:
+            raise ValueError(f"No PTB leads found. Available channels: {header.sig_name}")
+
+        leads = np.zeros((len(PTB_LEADS), max(WINDOW_SIZE, stop - offset)), dtype=np.float32)
+        rows = [PTB_LEADS.index(lead) for lead in channels]
+        if rows == list(range(len(rows))):
+            read_window(record_path, offset, stop, channels, out=leads[:len(rows)].T)
+        else:
+            leads[rows, :stop - offset] = read_window(record_path, offset, stop, channels).T
+        return leads, channels, header.fs
+
+    def window_batch(self, leads: np.ndarray, starts: np.ndarray):
+        """(len(starts), 12, 1000) tensor, each lead of each window normalized like preprocess_ecg_data."""
+        windows = sliding_window_view(leads, WINDOW_SIZE, axis=1)[:, starts].transpose(1, 0, 2)
+        mean = windows.mean(axis=-1, keepdims=True)
+        std = windows.std(axis=-1, keepdims=True)
+        return torch.from_numpy(((windows - mean) / (std + 1e-8)).astype(np.float32))
+
+    def classify_windows(self, leads: np.ndarray, starts: np.ndarray, batch_size: int = WINDOW_BATCH_SIZE):
+        """Per-window class, confidence and PTB class probabilities, ``batch_size`` windows per forward pass.
+
+        Model outputs are folded onto the PTB classes with the same modulo
+        mapping predict_batch applies to the top class. Also returns the
+        number of forward passes and of windows filled in by the fallback
+        because a pass failed.
+        """
+        n_classes = len(self.ptb_diagnoses)
+        probabilities = np.zeros((len(starts), n_classes))
+        classes = np.zeros(len(starts), dtype=np.int64)
+        confidences = np.zeros(len(starts))
+        forward_passes = 0
+        fallback_windows = 0
+
+        for first in range(0, len(starts), batch_size):
+            chunk = slice(first, first + batch_size)
+            batch = self.window_batch(leads, starts[chunk])
+            forward_passes += 1
+
+            try:
+                outputs = self._forward(batch).numpy()
+                classes[chunk] = outputs.argmax(axis=1) % n_classes
+                confidences[chunk] = outputs.max(axis=1)
+                for model_class in range(outputs.shape[1]):
+                    probabilities[chunk, model_class % n_classes] += outputs[:, model_class]
+            except Exception as e:
+                logger.error(f"PTB window prediction failed: {e}")
+                fallback_windows += len(batch)
+                for k, window in enumerate(batch, start=first):
+                    classes[k], confidences[k] = self._ptb_fallback_prediction(window.unsqueeze(0))
+                    probabilities[k, classes[k]] = confidences[k]
+
+        return classes, confidences, probabilities, forward_passes, fallback_windows
+
+    def analyze_whole_record(self, ecg_signals: dict, stride: int = WINDOW_SIZE // 2,
+                             batch_size: int = WINDOW_BATCH_SIZE, sampling_rate: int = 1000):
+        return self.analyze_lead_matrix(
+            self.lead_matrix(ecg_signals), list(ecg_signals), stride, batch_size, sampling_rate
+        )
+
+    def analyze_lead_matrix(self, leads: np.ndarray, channel_names: List[str], stride: int = WINDOW_SIZE // 2,
+                            batch_size: int = WINDOW_BATCH_SIZE, sampling_rate: int = 1000):
+        """Classify every overlapping 1000-sample window of a (12, n) lead matrix and aggregate them.
+
+        The aggregated prediction is cached by model version and lead content,
+        unless some windows fell back to the heuristic because the model failed.
+        batch_size and forward_passes describe this request, so they are not
+        part of the cached summary.
+        """
+        key = prediction_cache.key(self.model_version, "whole_record", leads, stride, sampling_rate)
+        summary = prediction_cache.get(key)
+        cached = summary is not None
+        forward_passes = 0
+        if not cached:
+            summary, forward_passes, fallback_windows = self.classify_lead_matrix(
+                leads, stride, batch_size, sampling_rate
+            )
+            if fallback_windows == 0:
+                prediction_cache.put(key, summary)
+
+        predicted_class, confidence, whole_record = summary
+        result = self.build_analysis_result(channel_names, predicted_class, confidence)
+        result["whole_record"] = {**whole_record, "batch_size": int(batch_size), "forward_passes": forward_passes}
+        result["cached"] = cached
+        return result
+
+    def classify_lead_matrix(self, leads: np.ndarray, stride: int, batch_size: int, sampling_rate: int):
+        """Return (class, confidence, whole_record summary), the forward passes run and the fallback window count."""
+        starts = self.window_starts(leads.shape[1], stride)
+        logger.info(f"Classifying {len(starts)} PTB windows in batches of {batch_size}")
+
+        classes, confidences, probabilities, forward_passes, fallback_windows = self.classify_windows(
+            leads, starts, batch_size
+        )
+
+        mean_probabilities = probabilities.mean(axis=0)
+        predicted_class = int(np.argmax(mean_probabilities))
+        votes = np.bincount(classes, minlength=len(self.ptb_diagnoses))
+
+        whole_record = {
+            "signal_length": int(leads.shape[1]),
+            "window_size": WINDOW_SIZE,
+            "stride": int(stride),
+            "total_windows": int(len(starts)),
+            "fallback_windows": fallback_windows,
+            "window_agreement": round(float(votes[predicted_class]) / len(starts) * 100, 1),
+            "class_probabilities": {
+                name: round(float(p), 4) for name, p in zip(self.ptb_diagnoses, mean_probabilities)
+            },
+            "window_votes": {name: int(v) for name, v in zip(self.ptb_diagnoses, votes) if v},
+            "timeline": [
+                {
+                    "start": int(start),
+                    "end": int(start + WINDOW_SIZE),
+                    "time_s": round(start / sampling_rate, 3),
+                    "diagnosis_code": f"PTB_{int(cls)}",
+                    "diagnosis_description": self.ptb_diagnoses[int(cls)],
+                    "confidence": round(float(conf) * 100, 1)
                 }
+                for start, cls, conf in zip(starts, classes, confidences)
+            ]
+        }
+        summary = (predicted_class, float(mean_probabilities[predicted_class]), whole_record)
+        return summary, forward_passes, fallback_windows
+
+    def build_analysis_result(self, channel_names: List[str], predicted_class: int, overall_confidence: float):
+        diagnosis_description = self.ptb_diagnoses[predicted_class]
+        
+        channel_analysis = {}
+        for channel_name in channel_names:
+            channel_hash = int(hashlib.md5(channel_name.encode()).hexdigest()[:4], 16)
+            channel_confidence = max(0.5, overall_confidence - (channel_hash % 25 * 0.01))
             
-            agreement_ratio = 75 + (hash(str(ecg_signals.keys())) % 20)
-            
-            return {
-                "success": True,
-                "analysis_id": f"PTB_AI_{np.random.randint(10000, 99999)}",
-                "timestamp": np.datetime64('now').astype(str),
-                "channel_analysis": channel_analysis,
-                "final_diagnosis": {
-                    "diagnosis_description": diagnosis_description,
+            channel_analysis[channel_name] = {
+                "main_diagnosis": {
                     "diagnosis_code": f"PTB_{predicted_class}",
-                    "confidence": round(overall_confidence * 100, 1),
-                    "agreement_ratio": agreement_ratio,
-                    "agreeing_channels": len(ecg_signals),
-                    "total_channels": len(ecg_signals),
-                    "severity": self._assess_ptb_risk_level(predicted_class)
-                },
-                "summary": {
-                    "total_channels_analyzed": len(ecg_signals),
-                    "successful_analysis": len(ecg_signals),
-                    "success_rate": 100.0,
-                    "key_findings": f"PTB AI Diagnosis: {diagnosis_description}",
-                    "priority_recommendations": self._generate_ptb_recommendations(predicted_class),
-                    "next_steps": [
-                        "Review with cardiologist",
-                        "Compare with PTB database findings",
-                        "Consider additional cardiac testing"
-                    ]
+                    "diagnosis_description": diagnosis_description,
+                    "confidence": round(channel_confidence * 100, 1)
                 },
-                "model_info": {
-                    "name": "PTB-ECG-Classifier",
-                    "version": "PTB-1.0",
-                    "type": "PTB PhysioNet ECG Classifier",
-                    "database": "PTB Diagnostic ECG Database",
-                    "diagnoses": self.ptb_diagnoses
-                }
+                "risk_level": self._assess_ptb_risk_level(predicted_class),
+                "technical_quality": "Excellent - PTB AI Model",
+                "secondary_findings": [
+                    "PTB Diagnostic ECG Analysis",
+                    f"Based on {len(channel_names)}-lead ECG",
+                    "PhysioNet PTB Database Compatible"
+                ]
             }
-            
-        except Exception as e:
-            logger.error(f"PTB Analysis failed: {e}")
-            raise HTTPException(status_code=500, detail=f"PTB Analysis failed: {str(e)}")
+        
+        agreement_ratio = 75 + (hash(str(channel_names)) % 20)
+        
+        return {
+            "success": True,
+            "analysis_id": f"PTB_AI_{np.random.randint(10000, 99999)}",
+            "timestamp": np.datetime64('now').astype(str),
+            "channel_analysis": channel_analysis,
+            "final_diagnosis": {
+                "diagnosis_description": diagnosis_description,
+                "diagnosis_code": f"PTB_{predicted_class}",
+                "confidence": round(overall_confidence * 100, 1),
+                "agreement_ratio": agreement_ratio,
+                "agreeing_channels": len(channel_names),
+                "total_channels": len(channel_names),
+                "severity": self._assess_ptb_risk_level(predicted_class)
+            },
+            "summary": {
+                "total_channels_analyzed": len(channel_names),
+                "successful_analysis": len(channel_names),
+                "success_rate": 100.0,
+                "key_findings": f"PTB AI Diagnosis: {diagnosis_description}",
+                "priority_recommendations": self._generate_ptb_recommendations(predicted_class),
+                "next_steps": [
+                    "Review with cardiologist",
+                    "Compare with PTB database findings",
+                    "Consider additional cardiac testing"
+                ]
+            },
+            "model_info": {
+                "name": "PTB-ECG-Classifier",
+                "version": "PTB-1.0",
+                "type": "PTB PhysioNet ECG Classifier",
+                "database": "PTB Diagnostic ECG Database",
+                "diagnoses": self.ptb_diagnoses
+            }
+        }
 
     def _assess_ptb_risk_level(self, diagnosis_class):
         high_risk_ptb = [0, 1, 6]
@@ -704,11 +1043,62 @@ class RealECGClassifier:
 
 real_ecg_classifier = RealECGClassifier()
 
+# Predictions keyed by model version and the preprocessed input; responses are
+# rebuilt around them so analysis_id and timestamp stay fresh.
+prediction_cache = ResultCache(
+    max_entries=int(os.environ.get("ECG_MODE5_CACHE_ENTRIES", 1024)),
+    ttl_seconds=float(os.environ.get("ECG_MODE5_CACHE_TTL", 3600)),
+    cache_dir=os.environ.get("ECG_MODE5_CACHE_DIR"),
+    max_disk_bytes=int(os.environ.get("ECG_MODE5_CACHE_DISK_BYTES", 64 * 1024 * 1024))
+)
+
+async def predict_cached(input_tensor):
+    """(class, confidence) of one input, from the cache or the micro-batcher; also returns whether it was cached."""
+    key = prediction_cache.key(real_ecg_classifier.model_version, input_tensor)
+    cached = prediction_cache.get(key)
+    if cached is not None:
+        return tuple(cached), True
+    
+    prediction = await inference_batcher.submit(input_tensor)
+    # A fallback means the model failed on this input; try it again next time
+    if not isinstance(prediction, FallbackPrediction):
+        prediction_cache.put(key, list(prediction))
+    return prediction, False
+
+def preload_model(background: bool = True):
+    """Load and warm up the classifier from the local model cache at startup, without network access.
+
+    By default this runs in a daemon thread, so the API serves requests (with
+    /model-status reporting "loading") while torch and the checkpoint load.
+    """
+    if not PRELOAD_MODEL:
+        logger.info("Mode 5 model preload disabled")
+        return False
+    if not background:
+        return real_ecg_classifier.load_model(local_files_only=True)
+    
+    real_ecg_classifier.state = "loading"
+    threading.Thread(
+        target=real_ecg_classifier.load_model,
+        kwargs={"local_files_only": True},
+        name="mode5-preload",
+        daemon=True
+    ).start()
+    return True
+
+# Concurrent comprehensive-analysis requests are coalesced into one forward pass
+inference_batcher = MicroBatcher(
+    real_ecg_classifier.predict_batch,
+    max_batch_size=int(os.environ.get("ECG_MODE5_MAX_BATCH", 16)),
+    max_wait_ms=float(os.environ.get("ECG_MODE5_MAX_WAIT_MS", 5)),
+    lane="mode5"
+)
+
 @router.post("/load-model")
 async def load_ai_model():
     try:
         logger.info("Loading PTB AI model...")
-        success = real_ecg_classifier.load_model()
+        success = await executor.run("mode5", real_ecg_classifier.load_model)
         
         if success:
             return {
@@ -739,11 +1129,20 @@ async def load_ai_model():
 async def get_model_status():
     return {
         "model_loaded": real_ecg_classifier.model_loaded,
-        "status": "ready" if real_ecg_classifier.model_loaded else "failed",
+        "status": "ready" if real_ecg_classifier.model_loaded else (
+            "loading" if real_ecg_classifier.state == "loading" else "failed"
+        ),
         "model_type": "PTB PhysioNet ECG Classifier",
-        "diagnoses": real_ecg_classifier.ptb_diagnoses
+        "diagnoses": real_ecg_classifier.ptb_diagnoses,
+        "performance": real_ecg_classifier.status(),
+        "result_cache": prediction_cache.stats(),
+        "batching": inference_batcher.stats()
     }
 
+@router.get("/cache-stats")
+async def get_prediction_cache_stats():
+    return prediction_cache.stats()
+
 @router.post("/comprehensive-analysis")
 async def comprehensive_analysis(request: AnalysisRequest):
     try:
@@ -751,15 +1150,112 @@ async def comprehensive_analysis(request: AnalysisRequest):
             raise HTTPException(status_code=500, detail="PTB AI model not loaded. Please load model first.")
         
         recording_data_dict = request.recording_data.dict()
-        patient_info_dict = request.patient_info.dict()
         
-        result = real_ecg_classifier.analyze_comprehensive_ecg(recording_data_dict, patient_info_dict)
+        ecg_signals, input_tensor = real_ecg_classifier.prepare_analysis(recording_data_dict)
+        (predicted_class, overall_confidence), cached = await predict_cached(input_tensor)
+        
+        result = real_ecg_classifier.build_analysis_result(list(ecg_signals), predicted_class, overall_confidence)
+        result["cached"] = cached
         return result
             
+    except HTTPException as e:
+        if e.status_code == 503:
+            raise
+        logger.error(f"Comprehensive analysis failed: {e.detail}")
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {e.detail}")
     except Exception as e:
         logger.error(f"Comprehensive analysis failed: {e}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+@router.post("/whole-record-analysis")
+async def whole_record_analysis(
+    request: AnalysisRequest,
+    stride: int = WINDOW_SIZE // 2,
+    batch_size: int = WINDOW_BATCH_SIZE,
+    sampling_rate: int = 1000
+):
+    """Classify the full recording as overlapping 1000-sample windows instead of its first second."""
+    if not real_ecg_classifier.model_loaded:
+        raise HTTPException(status_code=500, detail="PTB AI model not loaded. Please load model first.")
+    if stride < 1:
+        raise HTTPException(status_code=400, detail="stride must be positive")
+    if not 1 <= batch_size <= WINDOW_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"batch_size must be between 1 and {WINDOW_BATCH_SIZE}")
+    
+    try:
+        ecg_signals = real_ecg_classifier.extract_signals(request.recording_data.dict())
+        return await executor.run(
+            "mode5", real_ecg_classifier.analyze_whole_record, ecg_signals, stride, batch_size, sampling_rate
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Whole-record analysis failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+@router.get("/analyze-record")
+async def analyze_record(
+    patient: str,
+    recording: str,
+    offset: int = 0,
+    length: Optional[int] = None,
+    whole_record: bool = False,
+    stride: int = WINDOW_SIZE // 2,
+    batch_size: int = WINDOW_BATCH_SIZE
+):
+    """Analyze a stored recording without the client uploading its signals.
+
+    By default the first 1000 samples from ``offset`` are classified like
+    /comprehensive-analysis; with ``whole_record`` the whole window (the rest
+    of the record when ``length`` is omitted) is classified with sliding windows.
+    """
+    if not real_ecg_classifier.model_loaded:
+        raise HTTPException(status_code=500, detail="PTB AI model not loaded. Please load model first.")
+    if stride < 1:
+        raise HTTPException(status_code=400, detail="stride must be positive")
+    if not 1 <= batch_size <= WINDOW_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"batch_size must be between 1 and {WINDOW_BATCH_SIZE}")
+    
+    record_path = os.path.join(BASE_PATH, patient, recording)
+    if not os.path.exists(record_path + ".hea"):
+        raise HTTPException(status_code=404, detail="Invalid recording path.")
+    
+    if length is None and not whole_record:
+        length = WINDOW_SIZE
+    
+    try:
+        leads, channels, fs = await executor.run(
+            "decode", real_ecg_classifier.read_record_leads, record_path, offset, length
+        )
+        
+        if whole_record:
+            result = await executor.run(
+                "mode5", real_ecg_classifier.analyze_lead_matrix, leads, channels, stride, batch_size, int(fs)
+            )
+        else:
+            input_tensor = real_ecg_classifier.window_batch(leads, np.array([0]))
+            (predicted_class, overall_confidence), cached = await predict_cached(input_tensor)
+            result = real_ecg_classifier.build_analysis_result(channels, predicted_class, overall_confidence)
+            result["cached"] = cached
+        
+        result["record"] = {
+            "patient": patient,
+            "recording": recording,
+            "offset": offset,
+            "length": int(leads.shape[1]) if length is None else length,
+            "sampling_rate": fs,
+            "channels": channels
+        }
+        return result
+    
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Record analysis failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
 @router.post("/test-model")
 async def test_model():
     try:
@@ -785,7 +1281,7 @@ async def test_model():
             "channels": {ch: {"signal": sig} for ch, sig in test_signals.items()}
         }
         
-        result = real_ecg_classifier.analyze_comprehensive_ecg(test_data)
+        result = await executor.run("mode5", real_ecg_classifier.analyze_comprehensive_ecg, test_data)
         return {
             "success": True,
             "message": "PTB Model test successful!",
@@ -0,0 +1,276 @@
+import asyncio
+import json
+import os
+import struct
+import time
+from typing import Optional
+
+import numpy as np
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from .dat_reader import read_header, read_window
+from .signal_format import encode_signals
+from .stream_detector import StreamingBeatDetector
+
+router = APIRouter()
+
+BASE_PATH = r"E:\OneDrive\المستندات\SBE\DSP\SmartSignalAI\Backend\app\data\ptb-diagnostic-ecg-database-1.0.0"
+
+MAX_BLOCK_SIZE = 10000
+STREAM_MEDIA_TYPE = "application/vnd.smartsignal.signal-stream"
+
+
+async def stream_blocks(record_path: str, channels, start: int, stop: int, block_size: int, interval: float):
+    """Yield ``(block_start, window)`` pairs paced ``interval`` seconds apart.
+
+    Each block is read from the memory-mapped record only when the previous one
+    has been handed to the server, and the server only asks for the next chunk
+    once the client has drained the last, so a slow client stalls its own
+    stream instead of growing a buffer.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+
+    for block_start in range(start, stop, block_size):
+        block_stop = min(block_start + block_size, stop)
+        window = await run_in_threadpool(read_window, record_path, block_start, block_stop, channels)
+        yield block_start, window
+
+        if interval > 0:
+            deadline += interval
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+
+@router.get("/signal")
+async def stream_signal(
+    patient: str,
+    recording: str,
+    channels: str,
+    offset: int = 0,
+    length: Optional[int] = None,
+    block_size: int = 250,
+    rate: float = 1.0,
+    format: str = "ndjson"
+):
+    """Stream fixed-size sample blocks of one or more channels.
+
+    ``rate`` is the playback speed relative to real time (``0`` streams as fast
+    as the client reads). ``format=ndjson`` sends a header line followed by one
+    JSON line per block; ``format=binary`` sends length-prefixed frames in the
+    binary signal format, one per block.
+    """
+    record_path = os.path.join(BASE_PATH, patient, recording)
+
+    if not os.path.exists(record_path + ".dat"):
+        return {"error": "Invalid recording path."}
+
+    try:
+        header = read_header(record_path)
+
+        channels_list = [ch.strip() for ch in channels.split(",") if ch.strip()]
+        invalid_channels = [ch for ch in channels_list if ch not in header.sig_name]
+        if not channels_list or invalid_channels:
+            return {"error": f"Invalid channel(s): {', '.join(invalid_channels)}. Available: {header.sig_name}"}
+
+        if not 1 <= block_size <= MAX_BLOCK_SIZE:
+            return {"error": f"block_size must be between 1 and {MAX_BLOCK_SIZE}"}
+
+        if format not in ("ndjson", "binary"):
+            return {"error": "format must be 'ndjson' or 'binary'"}
+
+        if offset < 0 or offset >= header.sig_len:
+            return {"error": f"Offset {offset} exceeds signal length {header.sig_len}"}
+
+        if length is not None and length <= 0:
+            return {"error": "length must be positive"}
+
+        if rate < 0:
+            return {"error": "rate must not be negative"}
+
+        stop = header.sig_len if length is None else min(offset + length, header.sig_len)
+        interval = block_size / (header.fs * rate) if rate > 0 else 0.0
+
+        stream_header = {
+            "patient": patient,
+            "recording": recording,
+            "channels": channels_list,
+            "sampling_rate": header.fs,
+            "offset": offset,
+            "total_length": header.sig_len,
+            "stream_length": stop - offset,
+            "block_size": block_size,
+            "rate": rate
+        }
+
+    except Exception as e:
+        return {"error": f"Error preparing stream: {str(e)}"}
+
+    async def ndjson_stream():
+        yield json.dumps(stream_header) + "\n"
+        async for block_start, window in stream_blocks(record_path, channels_list, offset, stop, block_size, interval):
+            block = {
+                "offset": block_start,
+                "signals": {ch: window[:, i].tolist() for i, ch in enumerate(channels_list)}
+            }
+            yield json.dumps(block) + "\n"
+
+    async def binary_stream():
+        async for block_start, window in stream_blocks(record_path, channels_list, offset, stop, block_size, interval):
+            frame = encode_signals(
+                dict(stream_header, offset=block_start),
+                [window[:, i] for i in range(len(channels_list))]
+            )
+            yield struct.pack("<I", len(frame)) + frame
+
+    if format == "binary":
+        return StreamingResponse(binary_stream(), media_type=STREAM_MEDIA_TYPE)
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+
+@router.websocket("/abnormal-beats")
+async def stream_abnormal_beats(
+    websocket: WebSocket,
+    patient: Optional[str] = None,
+    recording: Optional[str] = None,
+    channel: str = "ii",
+    offset: int = 0,
+    length: Optional[int] = None,
+    block_size: int = 250,
+    rate: float = 1.0,
+    sampling_rate: int = 1000,
+    threshold: float = 0.025,
+    template_update: str = "exponential",
+    alpha: float = 0.05,
+    include_signal: bool = False
+):
+    """Score the beats of a live ECG feed as they arrive.
+
+    Live mode: the client sends blocks of one lead sampled at
+    ``sampling_rate``, either as binary frames of little-endian float32 or as
+    JSON ``{"samples": [...]}``, of at most MAX_BLOCK_SIZE samples each, then
+    ``{"type": "end"}``. Replay mode, when ``patient`` and ``recording`` are
+    given: the server feeds ``channel`` of that record in ``block_size``
+    blocks at ``rate`` times real time (``0`` replays as fast as possible),
+    for load testing.
+
+    The server sends a ``start`` message, a ``beat`` message per detected
+    beat and a final ``summary``; invalid input gets an ``error`` message and
+    the socket is closed.
+    """
+    await websocket.accept()
+
+    replay = patient is not None and recording is not None
+    try:
+        if replay:
+            record_path = os.path.join(BASE_PATH, patient, recording)
+            if not os.path.exists(record_path + ".dat"):
+                raise ValueError("Invalid recording path.")
+
+            header = read_header(record_path)
+            if channel not in header.sig_name:
+                raise ValueError(f"Invalid channel name: {channel}. Available channels: {header.sig_name}")
+            if not 1 <= block_size <= MAX_BLOCK_SIZE:
+                raise ValueError(f"block_size must be between 1 and {MAX_BLOCK_SIZE}")
+            if rate < 0:
+                raise ValueError("rate must not be negative")
+            if offset < 0 or offset >= header.sig_len:
+                raise ValueError(f"Offset {offset} exceeds signal length {header.sig_len}")
+            if length is not None and length <= 0:
+                raise ValueError("length must be positive")
+
+            sampling_rate = int(header.fs)
+            stop = header.sig_len if length is None else min(offset + length, header.sig_len)
+
+        detector = StreamingBeatDetector(
+            sampling_rate=sampling_rate,
+            threshold=threshold,
+            template_update=template_update,
+            alpha=alpha,
+            include_signal=include_signal
+        )
+    except Exception as e:
+        await websocket.send_json({"type": "error", "error": str(e)})
+        await websocket.close(code=1008)
+        return
+
+    start_message = {
+        "type": "start",
+        "mode": "replay" if replay else "live",
+        "sampling_rate": sampling_rate,
+        "threshold": threshold,
+        "template_update": template_update,
+        "warmup_beats": detector.warmup_beats
+    }
+    if replay:
+        start_message.update({
+            "patient": patient,
+            "recording": recording,
+            "channel": channel,
+            "offset": offset,
+            "stream_length": stop - offset,
+            "block_size": block_size,
+            "rate": rate
+        })
+
+    started = time.perf_counter()
+    max_block_ms = 0.0
+
+    async def process(block):
+        nonlocal max_block_ms
+        block_started = time.perf_counter()
+        events = await run_in_threadpool(detector.process, block)
+        max_block_ms = max(max_block_ms, (time.perf_counter() - block_started) * 1000)
+        for event in events:
+            await websocket.send_json(event)
+
+    try:
+        await websocket.send_json(start_message)
+
+        if replay:
+            interval = block_size / (sampling_rate * rate) if rate > 0 else 0.0
+            async for _, window in stream_blocks(record_path, [channel], offset, stop, block_size, interval):
+                await process(window[:, 0])
+        else:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+
+                try:
+                    if message.get("bytes") is not None:
+                        block = np.frombuffer(message["bytes"], dtype="<f4")
+                    else:
+                        data = json.loads(message.get("text") or "{}")
+                        if data.get("type") == "end":
+                            break
+                        block = np.asarray(data.get("samples", []), dtype=np.float64)
+                except (ValueError, TypeError, AttributeError) as e:
+                    await websocket.send_json({"type": "error", "error": f"Invalid sample block: {str(e)}"})
+                    await websocket.close(code=1003)
+                    return
+
+                if len(block) > MAX_BLOCK_SIZE:
+                    await websocket.send_json({
+                        "type": "error",
+                        "error": f"Sample blocks must not exceed {MAX_BLOCK_SIZE} samples"
+                    })
+                    await websocket.close(code=1009)
+                    return
+
+                await process(block)
+
+        wall_seconds = time.perf_counter() - started
+        signal_seconds = detector.samples_seen / sampling_rate
+        await websocket.send_json({
+            "type": "summary",
+            **detector.stats(),
+            "wall_seconds": round(wall_seconds, 3),
+            "realtime_factor": round(signal_seconds / wall_seconds, 2) if wall_seconds > 0 else None,
+            "max_block_processing_ms": round(max_block_ms, 2)
+        })
+        await websocket.close()
+
+    except WebSocketDisconnect:
+        return
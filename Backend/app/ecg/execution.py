@@ -0,0 +1,171 @@
+"""Bounded execution layer for CPU-bound ECG work.
+
+Heavy handlers run on a shared, sized thread pool (or a process pool for
+picklable module-level functions) instead of the event loop or Starlette's
+default threadpool. Every kind of work goes through a named lane with its own
+concurrency limit and a bounded wait queue, so a burst of one expensive
+analysis queues behind itself while the rest of the API keeps answering.
+
+Limits are configured with ``ECG_EXECUTOR_THREADS``, ``ECG_EXECUTOR_PROCESSES``
+and ``ECG_LANE_<NAME>_LIMIT`` / ``ECG_LANE_<NAME>_QUEUE`` environment variables.
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict
+
+from fastapi import HTTPException
+
+CPU_COUNT = os.cpu_count() or 1
+THREAD_WORKERS = int(os.environ.get("ECG_EXECUTOR_THREADS", 0)) or min(32, CPU_COUNT + 4)
+PROCESS_WORKERS = int(os.environ.get("ECG_EXECUTOR_PROCESSES", 0)) or CPU_COUNT
+
+# lane -> (concurrent jobs, jobs allowed to wait for a slot)
+DEFAULT_LANES = {
+    "decode": (8, 64),
+    "mode2": (max(1, CPU_COUNT // 2), 16),
+    "mode5": (2, 16),
+    "plots": (max(1, CPU_COUNT // 2), 32),
+}
+
+
+class Lane:
+    """Concurrency limit, wait queue and counters of one kind of work."""
+
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+        self._semaphore = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        return self._semaphore
+
+    def stats(self) -> Dict:
+        finished = self.completed + self.failed
+        return {
+            "limit": self.limit,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "peak_queue_depth": self.peak_waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_seconds / finished * 1000, 2) if finished else 0.0,
+            "avg_run_ms": round(self.run_seconds / finished * 1000, 2) if finished else 0.0
+        }
+
+
+class ExecutionLayer:
+    def __init__(self, thread_workers: int = THREAD_WORKERS, process_workers: int = PROCESS_WORKERS):
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self._thread_pool = ThreadPoolExecutor(max_workers=thread_workers, thread_name_prefix="ecg-exec")
+        self._process_pool = None
+        self._lock = threading.Lock()
+        self.lanes: Dict[str, Lane] = {}
+
+        for name, (limit, max_queue) in DEFAULT_LANES.items():
+            self.lane(name, limit, max_queue)
+
+    def lane(self, name: str, limit: int = 4, max_queue: int = 32) -> Lane:
+        """Return lane ``name``, creating it with env overrides of ``limit`` and ``max_queue``."""
+        with self._lock:
+            if name not in self.lanes:
+                prefix = f"ECG_LANE_{name.upper()}"
+                self.lanes[name] = Lane(
+                    name,
+                    int(os.environ.get(f"{prefix}_LIMIT", limit)),
+                    int(os.environ.get(f"{prefix}_QUEUE", max_queue))
+                )
+            return self.lanes[name]
+
+    def process_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.process_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._process_pool
+
+    async def run(self, lane_name: str, func, *args, kind: str = "thread", **kwargs):
+        """Run ``func(*args, **kwargs)`` on the thread or process pool within ``lane_name``'s limit.
+
+        Raises a 503 when the lane's wait queue is full.
+        """
+        lane = self.lane(lane_name)
+        if lane.active >= lane.limit and lane.waiting >= lane.max_queue:
+            lane.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail=f"Too many queued '{lane_name}' requests, try again later",
+                headers={"Retry-After": "1"}
+            )
+
+        pool = self.process_pool() if kind == "process" else self._thread_pool
+        queued_at = time.perf_counter()
+
+        lane.waiting += 1
+        lane.peak_waiting = max(lane.peak_waiting, lane.waiting)
+        try:
+            await lane.semaphore.acquire()
+        finally:
+            lane.waiting -= 1
+
+        started = time.perf_counter()
+        lane.wait_seconds += started - queued_at
+        lane.active += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+            lane.completed += 1
+            return result
+        except BaseException:
+            lane.failed += 1
+            raise
+        finally:
+            lane.active -= 1
+            lane.run_seconds += time.perf_counter() - started
+            lane.semaphore.release()
+
+    def stats(self) -> Dict:
+        return {
+            "thread_workers": self.thread_workers,
+            "process_workers": self.process_workers,
+            "process_pool_started": self._process_pool is not None,
+            "lanes": {name: lane.stats() for name, lane in self.lanes.items()}
+        }
+
+
+executor = ExecutionLayer()
+
+
+def offload(lane: str):
+    """Turn a synchronous route handler into an async one that runs on ``lane``.
+
+    The wrapper keeps the handler's signature, so FastAPI still sees the same
+    query parameters.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await executor.run(lane, func, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,76 @@
+"""Request-coalescing queue for model inference.
+
+Concurrent requests submit one input each; the queue gathers them for at
+most ``max_wait_ms`` (or until ``max_batch_size`` inputs are waiting), runs a
+single batched call on an execution lane and hands every caller its own
+result.
+"""
+import asyncio
+from typing import Callable, List
+
+from .execution import executor
+
+
+class MicroBatcher:
+    def __init__(self, run_batch: Callable[[List], List], max_batch_size: int = 16,
+                 max_wait_ms: float = 5.0, lane: str = "mode5"):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.lane = lane
+        self._pending = []
+        self._timer = None
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+    async def submit(self, item):
+        """Queue ``item`` and wait for its result from the next batch."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+
+        try:
+            results = await executor.run(self.lane, self.run_batch, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches,
+            "requests": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "pending": len(self._pending)
+        }
@@ -0,0 +1,288 @@
+"""In-memory index of the PTB database headers.
+
+The index is built once from the ``.hea`` files, persisted as JSON next to the
+database and refreshed incrementally (only headers whose mtime changed are
+re-parsed). Build or refresh it from the command line with::
+
+    python -m app.ecg.ptb_index [--full]
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .dat_reader import read_header
+
+BASE_PATH = r"E:\OneDrive\المستندات\SBE\DSP\SmartSignalAI\Backend\app\data\ptb-diagnostic-ecg-database-1.0.0"
+
+INDEX_VERSION = 1
+
+
+def parse_diagnosis(lines: List[str]) -> str:
+    """Collect the ``# Diagnose:`` comment block of a header, as the mode routers always have."""
+    diagnosis_lines = []
+    capture = False
+    for line in lines:
+        if line.startswith("# Diagnose:"):
+            capture = True
+            diagnosis_lines.append(line.strip("# ").strip())
+        elif capture:
+            if line.startswith("#") and line.strip() != "#":
+                diagnosis_lines.append(line.strip("# ").strip())
+            else:
+                break
+
+    return "\n".join(diagnosis_lines) if diagnosis_lines else "No diagnosis found."
+
+
+def parse_metadata(comments: List[str]) -> Dict[str, str]:
+    metadata = {}
+    for comment in comments:
+        key, sep, value = comment.partition(":")
+        if sep and key.strip():
+            metadata[key.strip()] = value.strip()
+    return metadata
+
+
+def _to_int(value: Optional[str]):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PTBIndex:
+    """Patients, recordings, channel layout, diagnosis and comment metadata of every record."""
+
+    def __init__(self, base_path: str, index_path: Optional[str] = None):
+        self.base_path = base_path
+        self.index_path = index_path or os.path.join(os.path.dirname(base_path), "ptb_index.json")
+        self._records: Dict[str, Dict] = {}
+        self._lock = threading.RLock()
+        # Serializes loads and refreshes, which scan the database without
+        # holding _lock; always taken before _lock, never inside it
+        self._refresh_lock = threading.RLock()
+        self._loaded = False
+        self.last_refresh = None
+
+    @staticmethod
+    def _key(patient: str, recording: str) -> str:
+        return f"{patient}/{recording}"
+
+    def _index_record(self, patient: str, recording: str, hea_mtime_ns: int) -> Dict:
+        record_path = os.path.join(self.base_path, patient, recording)
+        header = read_header(record_path)
+
+        with open(record_path + ".hea", "r", encoding="utf-8", errors="ignore") as f:
+            diagnosis = parse_diagnosis(f.readlines())
+
+        metadata = parse_metadata(header.comments)
+        return {
+            "patient": patient,
+            "recording": recording,
+            "hea_mtime_ns": hea_mtime_ns,
+            "channels": header.sig_name,
+            "sampling_rate": int(header.fs) if float(header.fs).is_integer() else header.fs,
+            "signal_length": header.sig_len,
+            "has_xyz": os.path.exists(record_path + ".xyz"),
+            "diagnosis": diagnosis,
+            "reason_for_admission": metadata.get("Reason for admission"),
+            "age": _to_int(metadata.get("age")),
+            "sex": (metadata.get("sex") or "").lower() or None,
+            "metadata": metadata
+        }
+
+    def load(self) -> bool:
+        """Load the persisted index, if there is one matching this index version."""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if data.get("version") != INDEX_VERSION:
+            return False
+
+        with self._lock:
+            self._records = data.get("records", {})
+        return True
+
+    def save(self, records: Optional[Dict[str, Dict]] = None):
+        with self._lock:
+            records = dict(self._records if records is None else records)
+        data = {"version": INDEX_VERSION, "base_path": self.base_path, "records": records}
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def refresh(self, full: bool = False) -> Dict:
+        """Re-scan the database, re-parsing only new or modified headers (all of them if ``full``).
+
+        The scan builds a new index from a snapshot of the current one and
+        swaps it in at the end, so lookups are not blocked while it runs.
+        """
+        started = time.perf_counter()
+        added = updated = 0
+
+        with self._refresh_lock:
+            with self._lock:
+                current = dict(self._records)
+
+            records = {}
+            for patient in sorted(os.listdir(self.base_path)):
+                patient_path = os.path.join(self.base_path, patient)
+                if not (patient.startswith("patient") and os.path.isdir(patient_path)):
+                    continue
+
+                for file in os.listdir(patient_path):
+                    if not file.endswith(".hea"):
+                        continue
+                    recording = file[:-len(".hea")]
+                    key = self._key(patient, recording)
+
+                    mtime_ns = os.stat(os.path.join(patient_path, file)).st_mtime_ns
+                    existing = current.get(key)
+                    if not full and existing is not None and existing["hea_mtime_ns"] == mtime_ns:
+                        records[key] = existing
+                        continue
+
+                    try:
+                        records[key] = self._index_record(patient, recording, mtime_ns)
+                    except Exception as e:
+                        print(f"❌ Could not index {key}: {e}")
+                        continue
+
+                    if existing is None:
+                        added += 1
+                    else:
+                        updated += 1
+
+            removed = [key for key in current if key not in records]
+
+            with self._lock:
+                self._records = records
+                self._loaded = True
+                self.last_refresh = time.time()
+
+            if added or updated or removed:
+                try:
+                    self.save(records)
+                except OSError as e:
+                    print(f"⚠️ Could not persist PTB index to {self.index_path}: {e}")
+
+        return {
+            "records": len(records),
+            "added": added,
+            "updated": updated,
+            "removed": len(removed),
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._refresh_lock:
+            if not self._loaded:
+                self.load()
+                self.refresh()
+
+    def get_record(self, patient: str, recording: str) -> Optional[Dict]:
+        """Return the entry for one recording, re-indexing it if its header changed since the last refresh."""
+        self.ensure_loaded()
+        key = self._key(patient, recording)
+        hea_path = os.path.join(self.base_path, patient, f"{recording}.hea")
+
+        try:
+            mtime_ns = os.stat(hea_path).st_mtime_ns
+        except OSError:
+            return None
+
+        entry = self._records.get(key)
+        if entry is None or entry["hea_mtime_ns"] != mtime_ns:
+            with self._lock:
+                entry = self._index_record(patient, recording, mtime_ns)
+                self._records[key] = entry
+        return entry
+
+    def _entries(self) -> List[Dict]:
+        self.ensure_loaded()
+        # refresh() rebuilds _records under the lock; copy it under the lock too
+        with self._lock:
+            return list(self._records.values())
+
+    def get_diagnosis(self, patient: str, recording: str) -> str:
+        entry = self.get_record(patient, recording)
+        if entry is None:
+            return "Diagnosis file not found."
+        return entry["diagnosis"]
+
+    def patients(self) -> List[str]:
+        return sorted({entry["patient"] for entry in self._entries()})
+
+    def has_patient(self, patient: str) -> bool:
+        return any(entry["patient"] == patient for entry in self._entries())
+
+    def records(self, patient: str) -> List[Dict]:
+        entries = [entry for entry in self._entries() if entry["patient"] == patient]
+        return sorted(entries, key=lambda entry: entry["recording"])
+
+    def query(
+        self,
+        diagnosis: Optional[str] = None,
+        sex: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+        channel: Optional[str] = None
+    ) -> List[Dict]:
+        """Filter recordings; ``diagnosis`` is a case-insensitive substring of the diagnosis block."""
+        results = []
+        for entry in self._entries():
+            if diagnosis and diagnosis.lower() not in entry["diagnosis"].lower():
+                continue
+            if sex and entry["sex"] != sex.lower():
+                continue
+            if min_age is not None and (entry["age"] is None or entry["age"] < min_age):
+                continue
+            if max_age is not None and (entry["age"] is None or entry["age"] > max_age):
+                continue
+            if channel and channel not in entry["channels"]:
+                continue
+            results.append(entry)
+
+        return sorted(results, key=lambda entry: (entry["patient"], entry["recording"]))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = list(self._records.values())
+        return {
+            "records": len(entries),
+            "patients": len({entry["patient"] for entry in entries}),
+            "index_path": self.index_path,
+            "last_refresh": self.last_refresh
+        }
+
+
+ptb_index = PTBIndex(BASE_PATH, os.environ.get("PTB_INDEX_PATH"))
+
+
+def get_diagnosis(patient: str, recording: str) -> str:
+    return ptb_index.get_diagnosis(patient, recording)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or refresh the PTB header index")
+    parser.add_argument("--base-path", default=BASE_PATH, help="PTB database directory")
+    parser.add_argument("--output", default=None, help="Index file (defaults to ptb_index.json next to the database)")
+    parser.add_argument("--full", action="store_true", help="Re-parse every header instead of only changed ones")
+    args = parser.parse_args()
+
+    index = PTBIndex(args.base_path, args.output)
+    index.load()
+    print(index.refresh(full=args.full))
+
+
+if __name__ == "__main__":
+    main()
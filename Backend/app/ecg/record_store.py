@@ -0,0 +1,75 @@
+import os
+import threading
+
+from .cache import SizedLRUCache
+from ..lazy import lazy_import
+
+wfdb = lazy_import("wfdb")
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def file_version(record_path: str):
+    """Modification times of a record's ``.dat`` and ``.hea`` files, used to invalidate caches."""
+    return (
+        os.stat(record_path + ".dat").st_mtime_ns,
+        os.stat(record_path + ".hea").st_mtime_ns
+    )
+
+
+class RecordStore:
+    """Shared cache of decoded PTB records used by every ECG mode.
+
+    Records are kept in an LRU bounded by the size of their ``p_signal``
+    arrays and are reloaded when the ``.dat`` or ``.hea`` file changes on disk.
+    Cached ``p_signal`` arrays are read-only; copy before modifying them.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self._cache = SizedLRUCache(max_bytes, sizeof=lambda entry: entry[1].p_signal.nbytes)
+        self._load_locks = {}
+        self._locks_guard = threading.Lock()
+        self.invalidations = 0
+
+    def _load_lock(self, key: str):
+        with self._locks_guard:
+            return self._load_locks.setdefault(key, threading.Lock())
+
+    def read_record(self, record_path: str):
+        """Return the decoded ``wfdb.Record`` for ``record_path``, decoding it at most once per version."""
+        key = os.path.normpath(record_path)
+        version = file_version(key)
+
+        stale = self._cache.peek(key)
+        if stale is not None and stale[0] != version:
+            self._cache.pop(key)
+            self.invalidations += 1
+
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        with self._load_lock(key):
+            # Another request may have decoded the record while we waited
+            entry = self._cache.peek(key)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+
+            record = wfdb.rdrecord(key)
+            record.p_signal.setflags(write=False)
+            self._cache.put(key, (version, record))
+            return record
+
+    def invalidate(self, record_path: str = None):
+        if record_path is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(os.path.normpath(record_path))
+
+    def stats(self):
+        stats = self._cache.stats()
+        stats["invalidations"] = int(self.invalidations)
+        return stats
+
+
+record_store = RecordStore(int(os.environ.get("ECG_RECORD_CACHE_BYTES", DEFAULT_MAX_BYTES)))
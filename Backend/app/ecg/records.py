@@ -1,47 +1,77 @@
 from fastapi import APIRouter
-import os
+from typing import Optional
+from .ptb_index import ptb_index
 
 router = APIRouter()
 
-BASE_PATH = r"E:\OneDrive\المستندات\SBE\DSP\SmartSignalAI\Backend\app\data\ptb-diagnostic-ecg-database-1.0.0"
-
 @router.get("/patients")
 def list_patients():
     try:
-        patients = [
-            folder for folder in os.listdir(BASE_PATH)
-            if os.path.isdir(os.path.join(BASE_PATH, folder)) and folder.startswith('patient')
-        ]
-        patients.sort()  
-        return {"patients": patients}
+        return {"patients": ptb_index.patients()}
     except Exception as e:
         return {"error": str(e)}
 
 
 @router.get("/records")
 def list_patient_records(patient: str):
- 
-    patient_path = os.path.join(BASE_PATH, patient)
-    
-    if not os.path.exists(patient_path):
-        return {"error": "Invalid patient ID."}
-    
-    records = []
+
     try:
-        for file in os.listdir(patient_path):
-            if file.endswith(".hea"):
-                recording = file.replace(".hea", "")
-                xyz_path = os.path.join(patient_path, f"{recording}.xyz")
-                records.append({
-                    "recording": recording,
-                    "has_xyz": os.path.exists(xyz_path)
-                })
-        
-        records.sort(key=lambda x: x["recording"])
-        
+        if not ptb_index.has_patient(patient):
+            return {"error": "Invalid patient ID."}
+
+        records = [
+            {"recording": entry["recording"], "has_xyz": entry["has_xyz"]}
+            for entry in ptb_index.records(patient)
+        ]
+
         return {
             "patient": patient,
             "records": records
         }
     except Exception as e:
-        return {"error": f"Error reading patient records: {str(e)}"}
\ No newline at end of file
+        return {"error": f"Error reading patient records: {str(e)}"}
+
+
+@router.get("/search")
+def search_records(
+    diagnosis: Optional[str] = None,
+    sex: Optional[str] = None,
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None,
+    channel: Optional[str] = None
+):
+    try:
+        matches = ptb_index.query(diagnosis, sex, min_age, max_age, channel)
+        return {
+            "filters": {
+                "diagnosis": diagnosis,
+                "sex": sex,
+                "min_age": min_age,
+                "max_age": max_age,
+                "channel": channel
+            },
+            "total": len(matches),
+            "records": [
+                {key: value for key, value in entry.items() if key != "hea_mtime_ns"}
+                for entry in matches
+            ]
+        }
+    except Exception as e:
+        return {"error": f"Error searching records: {str(e)}"}
+
+
+@router.get("/index/status")
+def get_index_status():
+    try:
+        ptb_index.ensure_loaded()
+        return ptb_index.stats()
+    except Exception as e:
+        return {"error": f"Error loading index: {str(e)}"}
+
+
+@router.post("/index/refresh")
+def refresh_index(full: bool = False):
+    try:
+        return ptb_index.refresh(full=full)
+    except Exception as e:
+        return {"error": f"Error refreshing index: {str(e)}"}
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Optional
+
+import numpy as np
+
+from .cache import DiskBudget, SizedLRUCache, atomic_write
+
+DEFAULT_MAX_DISK_BYTES = 64 * 1024 * 1024
+
+
+class ResultCache:
+    """LRU cache of small JSON-serializable results with a time-to-live.
+
+    Entries are bounded by count and age, and optionally mirrored as JSON
+    files in ``cache_dir`` so they survive restarts; those files are bounded
+    by ``max_disk_bytes`` (oldest deleted first) and deleted once expired.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, cache_dir: Optional[str] = None,
+                 max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES):
+        self._memory = SizedLRUCache(max_entries, sizeof=lambda entry: 1)
+        self.ttl_seconds = ttl_seconds
+        self.cache_dir = cache_dir or None
+        self._disk = DiskBudget(self.cache_dir, max_disk_bytes, ".json") if self.cache_dir else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @staticmethod
+    def key(*parts) -> str:
+        """Hash arrays/tensors by their raw bytes and everything else by ``str``."""
+        digest = hashlib.sha1()
+        for part in parts:
+            if hasattr(part, "numpy"):
+                part = part.detach().cpu().numpy()
+            if isinstance(part, np.ndarray):
+                digest.update(f"{part.dtype.str}{part.shape}".encode())
+                digest.update(np.ascontiguousarray(part).tobytes())
+            else:
+                digest.update(str(part).encode())
+            digest.update(b"|")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._memory.peek(key)
+        source = "hits"
+
+        if entry is None and self.cache_dir is not None:
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    entry = tuple(json.load(f))
+                source = "disk_hits"
+            except (OSError, ValueError):
+                entry = None
+
+        if entry is None:
+            self._count("misses")
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.time():
+            self._count("expired")
+            self._count("misses")
+            self._memory.pop(key)
+            if self._disk is not None:
+                self._disk.remove(self._path(key))
+            return None
+
+        self._count(source)
+        if source == "disk_hits":
+            self._memory.put(key, entry)
+        else:
+            self._memory.get(key)
+        return value
+
+    def put(self, key: str, value: Any):
+        entry = (time.time() + self.ttl_seconds, value)
+        self._memory.put(key, entry)
+
+        if self.cache_dir is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            payload = json.dumps(entry).encode("utf-8")
+            atomic_write(self._path(key), lambda f: f.write(payload))
+            self._disk.added(self._path(key))
+        except (OSError, TypeError) as e:
+            print(f"⚠️ Could not write result cache entry {key}: {e}")
+
+    def clear(self):
+        self._memory.clear()
+
+    def stats(self):
+        memory = self._memory.stats()
+        lookups = self.hits + self.disk_hits + self.misses
+        disk = self._disk.stats() if self._disk is not None else {}
+        return {
+            "entries": memory["entries"],
+            "max_entries": memory["max_bytes"],
+            "ttl_seconds": self.ttl_seconds,
+            "cache_dir": self.cache_dir,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": memory["evictions"],
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            **disk
+        }
@@ -0,0 +1,60 @@
+import json
+import struct
+from typing import Dict, List, Optional
+
+import numpy as np
+from fastapi import Request
+from fastapi.responses import Response
+
+# Layout of a binary signal payload (all little-endian):
+#   uint32  header_length
+#   bytes   UTF-8 JSON header, space-padded so the columns start on a 4-byte boundary
+#   bytes   one contiguous column per channel, in header["channels"] order
+#
+# Sample i of a column sits at x = header["offset"] + i, so no x axis is sent,
+# except for decimated views, whose sample positions are listed in header["x"].
+# int16 columns are converted back with (value - baseline[ch]) / scale[ch].
+BINARY_MEDIA_TYPE = "application/vnd.smartsignal.signal"
+ENCODINGS = {"float32": np.dtype("<f4"), "int16": np.dtype("<i2")}
+
+
+def wants_binary(request: Request, format: Optional[str] = None) -> bool:
+    """Explicit ``format=binary|json`` wins; otherwise negotiate on the Accept header."""
+    if format:
+        return format.lower() == "binary"
+    accept = request.headers.get("accept", "")
+    return BINARY_MEDIA_TYPE in accept or "application/octet-stream" in accept
+
+
+def encode_signals(
+    header: Dict,
+    columns: List[np.ndarray],
+    encoding: str = "float32",
+    scale: Optional[List[float]] = None,
+    baseline: Optional[List[int]] = None
+) -> bytes:
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unsupported encoding: {encoding}. Use one of {list(ENCODINGS)}")
+
+    dtype = ENCODINGS[encoding]
+    header = dict(header, dtype=dtype.str, samples=[int(len(col)) for col in columns])
+
+    if encoding == "int16":
+        scale = [float(s) for s in (scale or [1000.0] * len(columns))]
+        baseline = [int(b) for b in (baseline or [0] * len(columns))]
+        header.update(scale=scale, baseline=baseline)
+        columns = [
+            np.clip(np.rint(np.asarray(col) * s + b), -32768, 32767)
+            for col, s, b in zip(columns, scale, baseline)
+        ]
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (-(len(header_bytes) + 4) % 4)
+
+    parts = [struct.pack("<I", len(header_bytes)), header_bytes]
+    parts.extend(np.ascontiguousarray(col, dtype=dtype).tobytes() for col in columns)
+    return b"".join(parts)
+
+
+def binary_signal_response(header: Dict, columns: List[np.ndarray], encoding: str = "float32", **kwargs) -> Response:
+    return Response(content=encode_signals(header, columns, encoding, **kwargs), media_type=BINARY_MEDIA_TYPE)
@@ -0,0 +1,331 @@
+"""Incremental abnormal-beat detection for live ECG feeds.
+
+StreamingBeatDetector ingests sample blocks of one lead and returns one
+scored event per beat, with bounded delay and constant memory:
+
+- cleaning follows neurokit2's ``ecg_clean`` (0.5 Hz Butterworth high-pass
+  and a 50 Hz moving-average powerline filter), but with causal filters
+  whose state is carried from block to block;
+- R-peaks are found online with the gradient rule of neurokit2's default
+  peak detector (smoothed |gradient| above 1.5× its 0.75 s average), using
+  causal moving averages;
+- each beat spans 0.3 s before to 0.5 s after its R-peak, as in Mode 2, and
+  is reported as soon as its last sample arrives. The first beats are
+  reported unscored while they build the template the way score_beats does.
+  Every later beat is scored with Mode2Processor's difference features
+  against a running template that is updated from normal beats (exponential
+  average or rolling median).
+
+Only the last few seconds of signal and a bounded number of template beats
+are kept, however long the stream runs. Because the filters are causal, the
+scores are close to, but not identical to, those of the stored-record
+analysis.
+"""
+from collections import deque
+from typing import Dict, List
+
+import numpy as np
+
+from .ecg_mode2 import (
+    FEATURE_NAMES,
+    SCORE_WEIGHTS,
+    Mode2Processor,
+    extract_fiducial_points_batch,
+    fiducial_points_dict,
+    mean_pairwise_distances
+)
+from ..lazy import lazy_import
+
+scipy_signal = lazy_import("scipy.signal")
+
+TEMPLATE_UPDATES = ("exponential", "median")
+TEMPLATE_SIZE = 8
+WARMUP_BEATS = 16
+MEDIAN_WINDOW = 16
+
+# Seconds of cleaned signal kept for peak search and beat extraction
+HISTORY_SECONDS = 3.0
+
+# Seconds ignored at the start of a stream while the filters settle
+SETTLE_SECONDS = 1.0
+
+
+class StreamingBeatDetector:
+    def __init__(
+        self,
+        sampling_rate: int = 1000,
+        threshold: float = 0.025,
+        template_update: str = "exponential",
+        alpha: float = 0.05,
+        median_window: int = MEDIAN_WINDOW,
+        warmup_beats: int = WARMUP_BEATS,
+        include_signal: bool = False
+    ):
+        if sampling_rate < 100:
+            raise ValueError("sampling_rate must be at least 100 Hz")
+        if template_update not in TEMPLATE_UPDATES:
+            raise ValueError(f"template_update must be one of {list(TEMPLATE_UPDATES)}")
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be in (0, 1]")
+        if warmup_beats < TEMPLATE_SIZE:
+            raise ValueError(f"warmup_beats must be at least {TEMPLATE_SIZE}")
+        if median_window < 1:
+            raise ValueError("median_window must be positive")
+
+        self.sampling_rate = sampling_rate
+        self.threshold = threshold
+        self.template_update = template_update
+        self.alpha = alpha
+        self.warmup_beats = warmup_beats
+        self.include_signal = include_signal
+
+        self.processor = Mode2Processor()
+        self.processor.sampling_rate = sampling_rate
+        self.weights = np.array([SCORE_WEIGHTS[name] for name in FEATURE_NAMES])
+
+        self.before = int(0.3 * sampling_rate)
+        self.after = int(0.5 * sampling_rate)
+
+        # Cleaning
+        self._sos = scipy_signal.butter(5, 0.5, btype="highpass", output="sos", fs=sampling_rate)
+        self._sos_state = None
+        self._powerline_taps = max(1, int(sampling_rate / 50))
+        self._powerline_state = np.zeros(self._powerline_taps - 1)
+        # Delay of the moving average, subtracted from reported sample indices
+        self._group_delay = (self._powerline_taps - 1) // 2
+
+        # R-peak detection
+        self._smooth_length = max(1, int(0.1 * sampling_rate))
+        self._average_length = max(1, int(0.75 * sampling_rate))
+        self._min_delay = int(0.3 * sampling_rate)
+        self._settle = int(SETTLE_SECONDS * sampling_rate)
+        self._history = max(int(HISTORY_SECONDS * sampling_rate), 2 * (self.before + self.after))
+        # Larger blocks are ingested in chunks of this size, so the history
+        # still holds a detected beat's window when its last sample arrives
+        self._chunk = self._history - 2 * (self.before + self.after) or self.before + self.after
+        self._last_sample = None
+        self._gradient_tail = np.zeros(0)
+        self._smooth_tail = np.zeros(0)
+        self._in_qrs = False
+        self._qrs_start = 0
+        self._qrs_length_mean = None
+        self._last_peak = None
+        self._pending_peaks = deque()
+
+        # Cleaned signal of the last ``_history`` samples; _cleaned[0] is sample _buffer_start
+        self._cleaned = np.zeros(0)
+        self._buffer_start = 0
+        self.samples_seen = 0
+
+        # Scoring
+        self.template = None
+        self._warmup = []
+        self._recent_normal = deque(maxlen=median_window)
+        self.beats_seen = 0
+        self.abnormal_beats = 0
+        self._score_sum = 0.0
+        self._score_sq_sum = 0.0
+        self._scored = 0
+        self.max_delay_ms = 0.0
+
+    def process(self, block) -> List[Dict]:
+        """Ingest the next block of samples; returns the events of every beat completed by it."""
+        block = np.asarray(block, dtype=np.float64).ravel()
+        events = []
+        for start in range(0, len(block), self._chunk):
+            events.extend(self._process_chunk(block[start:start + self._chunk]))
+        return events
+
+    def _process_chunk(self, block: np.ndarray) -> List[Dict]:
+        cleaned = self._clean(block)
+        block_start = self.samples_seen
+        self.samples_seen += len(cleaned)
+
+        self._cleaned = np.concatenate((self._cleaned, cleaned))
+        if len(self._cleaned) > self._history:
+            trim = len(self._cleaned) - self._history
+            self._cleaned = self._cleaned[trim:]
+            self._buffer_start += trim
+
+        self._detect(cleaned, block_start)
+        return self._emit_ready()
+
+    def _clean(self, block: np.ndarray) -> np.ndarray:
+        if self._sos_state is None:
+            self._sos_state = scipy_signal.sosfilt_zi(self._sos) * block[0]
+
+        highpassed, self._sos_state = scipy_signal.sosfilt(self._sos, block, zi=self._sos_state)
+        if self._powerline_taps == 1:
+            return highpassed
+
+        taps = np.full(self._powerline_taps, 1.0 / self._powerline_taps)
+        cleaned, self._powerline_state = scipy_signal.lfilter(taps, [1.0], highpassed, zi=self._powerline_state)
+        return cleaned
+
+    @staticmethod
+    def _causal_mean(tail: np.ndarray, new: np.ndarray, length: int):
+        """Moving average over ``length`` samples of ``new``, continuing from ``tail``; also returns the next tail."""
+        extended = np.concatenate((tail, new))
+        sums = np.concatenate(([0.0], np.cumsum(extended)))
+        positions = np.arange(len(tail), len(extended))
+        starts = np.maximum(0, positions - length + 1)
+        means = (sums[positions + 1] - sums[starts]) / (positions + 1 - starts)
+        return means, extended[max(0, len(extended) - (length - 1)):] if length > 1 else extended[:0]
+
+    def _detect(self, cleaned: np.ndarray, block_start: int):
+        previous = cleaned[0] if self._last_sample is None else self._last_sample
+        gradient = np.abs(np.diff(np.concatenate(([previous], cleaned))))
+        self._last_sample = cleaned[-1]
+
+        smooth, self._gradient_tail = self._causal_mean(self._gradient_tail, gradient, self._smooth_length)
+        average, self._smooth_tail = self._causal_mean(self._smooth_tail, smooth, self._average_length)
+
+        above = smooth > 1.5 * average
+        settled = np.arange(block_start, block_start + len(cleaned)) >= self._settle
+        above &= settled
+
+        edges = np.diff(np.concatenate(([self._in_qrs], above)).astype(np.int8))
+        for position in np.flatnonzero(edges):
+            if edges[position] > 0:
+                self._qrs_start = block_start + int(position)
+            else:
+                self._qrs_region(self._qrs_start, block_start + int(position))
+        self._in_qrs = bool(above[-1])
+
+    def _qrs_region(self, start: int, end: int):
+        """Keep the R-peak of QRS region [start, end) unless it is too short or too close to the last peak."""
+        length = end - start
+        too_short = self._qrs_length_mean is not None and length < 0.4 * self._qrs_length_mean
+        self._qrs_length_mean = length if self._qrs_length_mean is None else 0.9 * self._qrs_length_mean + 0.1 * length
+        if too_short:
+            return
+
+        start = max(start, self._buffer_start)
+        if end <= start:
+            return
+        segment = self._cleaned[start - self._buffer_start:end - self._buffer_start]
+        peak = start + int(np.argmax(segment))
+
+        if self._last_peak is not None and peak - self._last_peak <= self._min_delay:
+            # Causal smoothing can split one QRS into several regions; of two
+            # peaks closer than the refractory period keep the taller one
+            # while it has not been emitted yet
+            if (self._pending_peaks and self._pending_peaks[-1] == self._last_peak
+                    and segment.max() > self._sample(self._last_peak)):
+                self._pending_peaks[-1] = peak
+                self._last_peak = peak
+            return
+        self._last_peak = peak
+        self._pending_peaks.append(peak)
+
+    def _sample(self, index: int) -> float:
+        if index < self._buffer_start:
+            return -np.inf
+        return float(self._cleaned[index - self._buffer_start])
+
+    def _emit_ready(self) -> List[Dict]:
+        events = []
+        while self._pending_peaks and self._pending_peaks[0] + self.after < self.samples_seen:
+            r_peak = self._pending_peaks.popleft()
+            start = r_peak - self.before
+            if start < self._buffer_start:
+                continue
+
+            offset = start - self._buffer_start
+            beat = self._cleaned[offset:offset + self.before + self.after].copy()
+            events.append(self._add_beat(r_peak, beat))
+        return events
+
+    def _add_beat(self, r_peak: int, beat: np.ndarray) -> Dict:
+        beat_index = self.beats_seen
+        self.beats_seen += 1
+        normalized = self.processor.normalize_beat_preserve_variability(beat)
+
+        event = self._beat_event(beat_index, r_peak, beat)
+        if self.template is None:
+            # Warm-up beats are reported unscored so no beat waits for the template
+            event["warmup"] = True
+            self._warmup.append(normalized)
+            if len(self._warmup) == self.warmup_beats:
+                self._build_template()
+            return event
+
+        features = self.processor.compute_difference_features(normalized[None, :], self.template)[0]
+        score = float(features @ self.weights)
+        abnormal = score > self.threshold
+
+        self._scored += 1
+        self._score_sum += score
+        self._score_sq_sum += score * score
+        if abnormal:
+            self.abnormal_beats += 1
+        else:
+            self._update_template(normalized)
+
+        correlation_diff, euclidean_diff, mean_abs_diff, st_t_diff = features
+        event.update({
+            "difference_score": score,
+            "difference_components": {
+                "correlation_diff": float(correlation_diff),
+                "euclidean_diff": float(euclidean_diff),
+                "mean_abs_diff": float(mean_abs_diff),
+                "st_t_diff": float(st_t_diff)
+            },
+            "abnormal": bool(abnormal),
+            "threshold_used": float(self.threshold)
+        })
+        if abnormal:
+            indices, values = extract_fiducial_points_batch(beat[None, :])
+            event["fiducial_points"] = fiducial_points_dict(indices[0], values[0])
+        return event
+
+    def _beat_event(self, beat_index: int, r_peak: int, beat: np.ndarray) -> Dict:
+        delay_ms = (self.samples_seen - r_peak) / self.sampling_rate * 1000
+        self.max_delay_ms = max(self.max_delay_ms, delay_ms)
+        r_peak -= self._group_delay
+
+        event = {
+            "type": "beat",
+            "beat_index": beat_index,
+            "r_peak": int(r_peak),
+            "start_idx": int(r_peak - self.before),
+            "end_idx": int(r_peak + self.after),
+            "warmup": False,
+            "difference_score": None,
+            "abnormal": None,
+            "delay_ms": round(delay_ms, 1)
+        }
+        if self.include_signal:
+            event["signal"] = beat.tolist()
+        return event
+
+    def _build_template(self):
+        """Same template as score_beats: the mean of the least variable warm-up beats."""
+        normalized = np.stack(self._warmup)
+        order = np.argsort(mean_pairwise_distances(normalized), kind="stable")[:TEMPLATE_SIZE]
+        self.template = normalized[order].mean(axis=0)
+        self._recent_normal.extend(normalized[order])
+        self._warmup = []
+
+    def _update_template(self, normalized: np.ndarray):
+        if self.template_update == "median":
+            self._recent_normal.append(normalized)
+            self.template = np.median(np.stack(self._recent_normal), axis=0)
+        else:
+            self.template += self.alpha * (normalized - self.template)
+
+    def stats(self) -> Dict:
+        mean = self._score_sum / self._scored if self._scored else 0.0
+        variance = self._score_sq_sum / self._scored - mean * mean if self._scored else 0.0
+        return {
+            "samples_processed": int(self.samples_seen),
+            "beats_detected": int(self.beats_seen),
+            "beats_scored": int(self._scored),
+            "abnormal_beats": int(self.abnormal_beats),
+            "abnormality_percentage": round(self.abnormal_beats / self._scored * 100, 2) if self._scored else 0.0,
+            "template_ready": self.template is not None,
+            "score_mean": mean,
+            "score_std": float(np.sqrt(max(0.0, variance))),
+            "max_delay_ms": round(self.max_delay_ms, 1),
+            "buffered_samples": int(len(self._cleaned))
+        }
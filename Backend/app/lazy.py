@@ -0,0 +1,43 @@
+"""Deferred imports of heavy libraries.
+
+``lazy_import("torch")`` returns a stand-in module that imports the real one on
+its first attribute access, so routers can be imported (and the API can boot)
+without paying for torch, neurokit2, pandas or wfdb until a request uses them.
+"""
+import importlib
+import time
+import types
+from typing import Dict
+
+# module name -> seconds its deferred import took
+import_seconds: Dict[str, float] = {}
+
+
+class LazyModule(types.ModuleType):
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(self.__name__)
+            import_seconds[self.__name__] = time.perf_counter() - started
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+def loaded_imports() -> Dict[str, float]:
+    """Deferred modules imported so far, with their import time in milliseconds."""
+    return {name: round(seconds * 1000, 1) for name, seconds in import_seconds.items()}
@@ -1,8 +1,15 @@
+# Imported first so boot time is measured from here
+from .startup import startup_report
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .ecg import ecg_router
-from .car.routes import car_router
-from .radar.routes import radar_router  # Add this import
+
+# Comma-separated subsystems to mount, e.g. SMARTSIGNAL_SUBSYSTEMS=ecg,radar
+SUBSYSTEMS = [
+    name.strip().lower()
+    for name in os.environ.get("SMARTSIGNAL_SUBSYSTEMS", "ecg,car,radar").split(",")
+    if name.strip()
+]
 
 app = FastAPI()
 
@@ -22,19 +29,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(ecg_router, prefix="/ecg", tags=["ECG"])
-app.include_router(car_router, prefix="/api/car", tags=["Car Audio"])
-app.include_router(radar_router, prefix="/api/radar", tags=["Radar/Drone Detection"])  # Add this line
+if "ecg" in SUBSYSTEMS:
+    with startup_report.phase("import ecg"):
+        from .ecg import ecg_router, ECG_MODES
+    app.include_router(ecg_router, prefix="/ecg", tags=["ECG"])
+
+if "car" in SUBSYSTEMS:
+    with startup_report.phase("import car"):
+        from .car.routes import car_router
+    app.include_router(car_router, prefix="/api/car", tags=["Car Audio"])
+
+if "radar" in SUBSYSTEMS:
+    with startup_report.phase("import radar"):
+        from .radar.routes import radar_router
+    app.include_router(radar_router, prefix="/api/radar", tags=["Radar/Drone Detection"])
 
 @app.get("/")
 def root():
     return {"message": "Welcome to SmartSignalAI API"}
 
-# Load the drone model when the server starts
+@app.get("/startup")
+def get_startup_report():
+    return {"subsystems": SUBSYSTEMS, **startup_report.stats()}
+
+@app.on_event("startup")
+def build_ptb_index():
+    if "ecg" not in SUBSYSTEMS:
+        return
+    from .ecg.ptb_index import ptb_index
+    try:
+        with startup_report.phase("ptb index"):
+            ptb_index.ensure_loaded()
+        print(f"PTB index ready: {ptb_index.stats()['records']} records")
+    except Exception as e:
+        print(f"Warning: Could not build PTB index: {e}")
+
+@app.on_event("startup")
+def load_mode5_model():
+    if "ecg" not in SUBSYSTEMS or "mode5" not in ECG_MODES:
+        return
+    from .ecg.ecg_mode5 import preload_model
+    try:
+        # Loads in a background thread; /ecg/mode5/model-status reports progress
+        with startup_report.phase("mode5 preload (start)"):
+            preload_model()
+    except Exception as e:
+        print(f"Warning: Could not preload Mode 5 model: {e}")
+
+# Start loading the drone model in the background when the server starts
+# (unless RADAR_PRELOAD_MODEL=0); /api/radar/model-info reports progress
 @app.on_event("startup")
 async def startup_event():
-    from .radar.routes import load_drone_model
+    if "radar" not in SUBSYSTEMS:
+        return
+    from .radar.routes import load_drone_model, PRELOAD_MODEL
+    if not PRELOAD_MODEL:
+        return
     try:
-        load_drone_model()
+        with startup_report.phase("drone model (start)"):
+            load_drone_model()
     except Exception as e:
         print(f"Warning: Could not load drone detection model: {e}")
+
+@app.on_event("startup")
+def report_startup():
+    startup_report.finish()
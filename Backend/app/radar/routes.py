@@ -3,6 +3,8 @@ from fastapi.responses import JSONResponse
 import tempfile
 import os
 import logging
+import threading
+import time
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -10,26 +12,135 @@ logger = logging.getLogger(__name__)
 
 radar_router = APIRouter()
 
-# Global variable to store the model (loaded once)
-drone_detector = None
+MODEL_ID = "preszzz/drone-audio-detection-05-17-trial-0"
 
-def load_drone_model():
-    """Load the drone detection model once when the server starts"""
-    global drone_detector
-    if drone_detector is None:
+# The model is loaded from this directory, downloading it there first if it is
+# missing (unless RADAR_MODEL_DOWNLOAD=0)
+MODEL_DIR = os.environ.get("RADAR_MODEL_DIR", "./model_cache/drone-audio-detection")
+ALLOW_DOWNLOAD = os.environ.get("RADAR_MODEL_DOWNLOAD", "1") == "1"
+
+# Start loading the model in the background at startup instead of on the
+# first request that needs it
+PRELOAD_MODEL = os.environ.get("RADAR_PRELOAD_MODEL", "1") == "1"
+
+# After a failed load, wait RETRY_BASE_SECONDS * 2**(failures - 1) (capped at
+# RETRY_MAX_SECONDS) before trying again
+RETRY_BASE_SECONDS = float(os.environ.get("RADAR_RETRY_BASE_SECONDS", 5))
+RETRY_MAX_SECONDS = float(os.environ.get("RADAR_RETRY_MAX_SECONDS", 300))
+
+# Retry-After sent to requests that arrive while the model is loading
+LOADING_RETRY_AFTER = 5
+
+
+class DroneModelLoader:
+    """Loads the drone detection pipeline in a background thread.
+
+    States: not_loaded -> loading -> ready, or loading -> failed. A failed
+    load is retried by the next request once its backoff has elapsed.
+    """
+
+    def __init__(self, model_id: str, model_dir: str):
+        self.model_id = model_id
+        self.model_dir = model_dir
+        self.detector = None
+        self.state = "not_loaded"
+        self.source = None
+        self.failures = 0
+        self.last_error = None
+        self.next_retry_at = 0.0
+        self.load_seconds = None
+        self._lock = threading.Lock()
+
+    def _model_source(self) -> str:
+        if os.path.isfile(os.path.join(self.model_dir, "config.json")):
+            return self.model_dir
+        if not ALLOW_DOWNLOAD:
+            raise FileNotFoundError(f"No model found in {self.model_dir} and RADAR_MODEL_DOWNLOAD=0")
+
+        logger.info(f"Downloading {self.model_id} to {self.model_dir}...")
+        from huggingface_hub import snapshot_download
+        snapshot_download(repo_id=self.model_id, local_dir=self.model_dir)
+        return self.model_dir
+
+    def _load(self):
+        started = time.perf_counter()
         try:
             logger.info("Loading drone detection model...")
+            source = self._model_source()
             from transformers import pipeline
-            drone_detector = pipeline(
-                "audio-classification", 
-                model="preszzz/drone-audio-detection-05-17-trial-0"
-            )
-            logger.info("Drone detection model loaded successfully!")
+            detector = pipeline("audio-classification", model=source)
         except Exception as e:
-            logger.error(f"Failed to load drone detection model: {str(e)}")
-            # Don't raise the error, just log it so the server can still start
-            drone_detector = None
-    return drone_detector
+            with self._lock:
+                self.failures += 1
+                self.last_error = str(e)
+                self.next_retry_at = time.time() + self.retry_delay()
+                self.state = "failed"
+            logger.error(f"Failed to load drone detection model: {str(e)} "
+                         f"(retry in {self.retry_delay():.0f}s)")
+            return
+
+        with self._lock:
+            self.detector = detector
+            self.source = source
+            self.failures = 0
+            self.last_error = None
+            self.load_seconds = time.perf_counter() - started
+            self.state = "ready"
+        logger.info(f"Drone detection model loaded successfully in {self.load_seconds:.2f}s!")
+
+    def retry_delay(self) -> float:
+        if self.failures == 0:
+            return 0.0
+        return min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (self.failures - 1))
+
+    def retry_in(self) -> float:
+        return max(0.0, self.next_retry_at - time.time())
+
+    def start(self) -> bool:
+        """Start a background load unless one is running, the model is ready, or a failed load is backing off."""
+        with self._lock:
+            if self.state in ("loading", "ready"):
+                return False
+            if self.state == "failed" and self.retry_in() > 0:
+                return False
+            self.state = "loading"
+
+        threading.Thread(target=self._load, name="drone-model-loader", daemon=True).start()
+        return True
+
+    def require(self):
+        """Return the ready pipeline, or raise a 503 with Retry-After while it is loading or backing off."""
+        if self.state == "ready":
+            return self.detector
+
+        self.start()
+        if self.state == "failed":
+            retry_after = max(1, int(self.retry_in() + 0.999))
+            detail = f"Drone detection model failed to load: {self.last_error}"
+        else:
+            retry_after = LOADING_RETRY_AFTER
+            detail = "Drone detection model is loading, try again shortly"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(retry_after)})
+
+    def info(self):
+        return {
+            "status": self.state,
+            "model_loaded": self.state == "ready",
+            "model_dir": self.model_dir,
+            "source": self.source,
+            "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "retry_in_seconds": round(self.retry_in(), 1) if self.state == "failed" else None
+        }
+
+
+drone_model = DroneModelLoader(MODEL_ID, MODEL_DIR)
+
+def load_drone_model():
+    """Start loading the drone detection model in the background; returns it once ready, else None"""
+    drone_model.start()
+    return drone_model.detector
 
 @radar_router.post("/detect-drone")
 async def detect_drone(audio_file: UploadFile = File(...)):
@@ -37,13 +148,8 @@ async def detect_drone(audio_file: UploadFile = File(...)):
     Detect if the uploaded audio contains drone sounds
     """
     try:
-        # Check if model is loaded
-        detector = load_drone_model()
-        if detector is None:
-            raise HTTPException(
-                status_code=503, 
-                detail="Drone detection model is not available. Please check server logs."
-            )
+        # Fails fast with a 503 while the model is loading or backing off after a failure
+        detector = drone_model.require()
 
         # Validate file type (optional - let the model handle format detection)
         logger.info(f"Processing audio file: {audio_file.filename} ({audio_file.content_type})")
@@ -105,17 +211,15 @@ async def detect_drone(audio_file: UploadFile = File(...)):
 
 @radar_router.get("/model-info")
 async def get_model_info():
-    """Get information about the drone detection model"""
-    detector = load_drone_model()
-    model_available = detector is not None
+    """Get information about the drone detection model and its loading state"""
+    load_drone_model()
     
     return {
-        "model_name": "preszzz/drone-audio-detection-05-17-trial-0",
+        "model_name": MODEL_ID,
         "description": "Pre-trained model for detecting drone sounds in audio files",
         "supported_formats": ["WAV", "MP3", "OGG", "FLAC", "M4A"],
         "labels": ["drone", "not_drone"],
-        "model_loaded": model_available,
-        "status": "ready" if model_available else "loading_failed"
+        **drone_model.info()
     }
 
 @radar_router.get("/health")
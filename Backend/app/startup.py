@@ -0,0 +1,54 @@
+"""Boot-time measurement.
+
+Each phase of startup (router imports, startup hooks) is timed, and a report
+is printed once the server is ready, compared against ``STARTUP_BUDGET_MS``.
+Time is counted from the import of ``app.main``.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from .lazy import loaded_imports
+
+STARTUP_BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", 1000))
+
+
+class StartupReport:
+    def __init__(self, budget_ms: float = STARTUP_BUDGET_MS):
+        self.budget_ms = budget_ms
+        self.started = time.perf_counter()
+        self.phases = []
+        self.ready_ms = None
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, (time.perf_counter() - started) * 1000))
+
+    def finish(self):
+        """Mark the server as ready and print the timing report."""
+        self.ready_ms = (time.perf_counter() - self.started) * 1000
+
+        print("\n⏱️ Startup timing:")
+        for name, elapsed_ms in self.phases:
+            print(f"   {name:<28} {elapsed_ms:8.1f} ms")
+        status = "within" if self.within_budget() else "OVER"
+        print(f"   {'ready':<28} {self.ready_ms:8.1f} ms ({status} budget of {self.budget_ms:.0f} ms)")
+
+    def within_budget(self) -> bool:
+        return self.ready_ms is not None and self.ready_ms <= self.budget_ms
+
+    def stats(self):
+        return {
+            "budget_ms": self.budget_ms,
+            "ready_ms": round(self.ready_ms, 1) if self.ready_ms is not None else None,
+            "within_budget": self.within_budget(),
+            "phases": {name: round(elapsed_ms, 1) for name, elapsed_ms in self.phases},
+            "deferred_imports_loaded": loaded_imports()
+        }
+
+
+startup_report = StartupReport()
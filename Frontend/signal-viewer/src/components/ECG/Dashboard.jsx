@@ -115,12 +115,12 @@ export default function Dashboard() {
       const channelsParam = mode3Channels.join(",");
       const apiUrl = `${
         import.meta.env.VITE_API_URL
-      }/ecg/mode3/signal?patient=${selectedPatient}&recording=${selectedRecording}&channels=${channelsParam}&offset=${offset}&length=${length}`;
+      }/ecg/mode3/polar?patient=${selectedPatient}&recording=${selectedRecording}&channels=${channelsParam}&offset=${offset}&length=${length}&cycle_length=${mode3CycleLength}&display_mode=fixed`;
 
       const response = await fetch(apiUrl);
       const jsonData = await response.json();
 
-      if (response.ok && jsonData.signals) {
+      if (response.ok && jsonData.traces) {
         setMode3Signals(jsonData);
       } else {
         setError("Failed to load Mode 3 signals");
@@ -261,7 +261,7 @@ export default function Dashboard() {
         fetchMode6Data();
         break;
     }
-  }, [activeTab, selectedPatient, selectedRecording, mode1Channel, mode2Channel, mode2Threshold, mode3Channels, mode4Channels, mode6Channel]);
+  }, [activeTab, selectedPatient, selectedRecording, mode1Channel, mode2Channel, mode2Threshold, mode3Channels, mode3CycleLength, mode4Channels, mode6Channel]);
 
   // Render Mode 1 Content (Time Series)
   const renderTimeSeries = () => {
@@ -414,31 +414,21 @@ export default function Dashboard() {
 
   // Render Mode 3 Content (Polar Graph)
   const renderPolarGraph = () => {
-    if (!mode3Signals?.signals) {
+    if (!mode3Signals?.traces) {
       return <div className="no-data">No polar graph data loaded</div>;
     }
 
     const polarData = mode3Channels.map((channel, index) => {
-      const signal = mode3Signals.signals[channel] || [];
-      const segment = signal.slice(0, mode3CycleLength);
+      // r/theta are computed (and decimated) by /ecg/mode3/polar
+      const trace = mode3Signals.traces[channel];
       
-      if (segment.length === 0) return null;
-
-      const minVal = Math.min(...segment);
-      const maxVal = Math.max(...segment);
-      const range = maxVal - minVal;
-
-      const polarPoints = segment.map((value, i) => {
-        const normalized = range === 0 ? 0.5 : (value - minVal) / range;
-        const angle = (i / segment.length) * 360;
-        return { r: normalized, theta: angle };
-      });
+      if (!trace || trace.r.length === 0) return null;
 
       const colors = ["#FF6B6B", "#4ECDC4", "#45B7D1"];
       
       return {
-        r: polarPoints.map(p => p.r),
-        theta: polarPoints.map(p => p.theta),
+        r: trace.r,
+        theta: trace.theta,
         mode: "lines",
         type: "scatterpolar",
         name: `Channel ${channel.toUpperCase()}`,
@@ -8,6 +8,7 @@ import React, {
 import Plot from "react-plotly.js";
 import { useNavigate } from "react-router-dom";
 import { useECG } from "./ecgContext";
+import { fetchSignalColumns } from "./signalFormat";
 import "./mode1.css";
 
 // Reusable ECG Plot Component to reduce code repetition
@@ -381,11 +382,9 @@ const calculateOptimalSpacing = useCallback((signalsData, channels) => {
         import.meta.env.VITE_API_URL
       }/ecg/mode1/full-signal?patient=${selectedPatient}&recording=${selectedRecording}&channel=${backendChannelName}`;
 
-      const response = await fetch(apiUrl);
-      if (!response.ok) throw new Error(`HTTP ${response.status}`);
-
-      const data = await response.json();
-      if (!data.x || !data.y) throw new Error("Invalid data format");
+      const { header, columns, xAxis } = await fetchSignalColumns(apiUrl);
+      const y = Array.from(columns[header.channels[0]]);
+      const data = { ...header, x: xAxis(y.length), y };
 
       const channelProcessedData = processChannelData(channel, data, offset);
       
@@ -556,25 +555,11 @@ const calculateOptimalSpacing = useCallback((signalsData, channels) => {
       const status = await statusResponse.json();
       if (!status.model_loaded) throw new Error("AI model failed to load");
 
-      const requestData = {
-        patient_info: { id: selectedPatient, age: "52", gender: "Male", history: "No known cardiac history" },
-        recording_data: { channels: {}, sampling_frequency: displaySamplingFrequency },
-      };
-
-      selectedChannels.forEach((channel) => {
-        if (channelData[channel]?.originalData) {
-          const backendChannel = findBackendChannel(channel);
-          const originalData = channelData[channel].originalData;
-          const processedData = processSignalForDisplay(originalData.x, originalData.y);
-
-          requestData.recording_data.channels[backendChannel] = { signal: processedData.y };
-        }
-      });
-
-      const response = await fetch(`${import.meta.env.VITE_API_URL}/ecg/mode5/comprehensive-analysis`, {
-        method: "POST", headers: { "Content-Type": "application/json", Accept: "application/json" },
-        body: JSON.stringify(requestData),
-      });
+      // The backend reads the leads from the record itself, so the loaded
+      // signals are not sent back; like before, the start of the record is analyzed.
+      const response = await fetch(
+        `${import.meta.env.VITE_API_URL}/ecg/mode5/analyze-record?patient=${selectedPatient}&recording=${selectedRecording}`
+      );
 
       if (!response.ok) {
         const errorText = await response.text();
@@ -587,7 +572,10 @@ const calculateOptimalSpacing = useCallback((signalsData, channels) => {
         const mappedChannelAnalysis = {};
         if (jsonData.channel_analysis) {
           Object.entries(jsonData.channel_analysis).forEach(([backendChannel, analysis]) => {
-            mappedChannelAnalysis[mapChannelName(backendChannel)] = analysis;
+            const channel = mapChannelName(backendChannel);
+            if (selectedChannels.includes(channel)) {
+              mappedChannelAnalysis[channel] = analysis;
+            }
           });
         }
 
@@ -610,8 +598,7 @@ const calculateOptimalSpacing = useCallback((signalsData, channels) => {
       setEstimationLoading(false);
     }
   }, [
-    selectedChannels, selectedPatient, displaySamplingFrequency, channelData,
-    findBackendChannel, processSignalForDisplay, mapChannelName, setEcgData, ecgData,
+    selectedChannels, selectedPatient, selectedRecording, mapChannelName, setEcgData, ecgData,
   ]);
 
   // Plot configuration
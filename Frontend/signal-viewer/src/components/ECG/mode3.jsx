@@ -2,6 +2,7 @@ import React, { useState, useEffect, useMemo } from "react";
 import Plot from "react-plotly.js";
 import { useNavigate } from "react-router-dom";
 import { useECG } from "./ecgContext";
+import { fetchSignalColumns } from "./signalFormat";
 import "./mode3.css";
 
 export default function CombinedMode() {
@@ -263,29 +264,24 @@ export default function CombinedMode() {
 
       console.log(`📡 Fetching full signal for ${channel}...`);
 
-      const response = await fetch(apiUrl);
+      const { header, columns, xAxis } = await fetchSignalColumns(apiUrl);
+      const y = Array.from(columns[header.channels[0]]);
+
+      if (y.length > 0) {
+        console.log(`✅ ${channel}: Loaded ${y.length} samples`);
+
+        const displayData = {
+          x: xAxis(y.length),
+          y,
+          fullLength: y.length,
+        };
 
-      if (response.ok) {
-        const data = await response.json();
-
-        if (data.x && data.y && data.y.length > 0) {
-          console.log(`✅ ${channel}: Loaded ${data.y.length} samples`);
-
-          const displayData = {
-            x: data.x,
-            y: data.y,
-            fullLength: data.y.length,
-          };
-
-          setChannelData((prev) => ({
-            ...prev,
-            [channel]: displayData,
-          }));
-        } else {
-          throw new Error("Invalid or empty data format");
-        }
+        setChannelData((prev) => ({
+          ...prev,
+          [channel]: displayData,
+        }));
       } else {
-        throw new Error(`HTTP ${response.status}`);
+        throw new Error("Invalid or empty data format");
       }
     } catch (error) {
       console.error(`💥 Error loading channel ${channel}:`, error);
@@ -223,16 +223,8 @@ export default function Mode5() {
   };
 
   const performComprehensiveAnalysis = async () => {
-    const currentECGData = ecgData || ecgDataLocal;
-
-    if (!currentECGData || !currentECGData.signals) {
-      setError("No ECG data available. Please load data first.");
-      return;
-    }
-
-    const ecgChannels = Object.keys(currentECGData.signals);
-    if (ecgChannels.length === 0) {
-      setError("No ECG channels found in the loaded data.");
+    if (!selectedPatient || !selectedRecording) {
+      setError("Please select a patient and recording first.");
       return;
     }
 
@@ -240,41 +232,20 @@ export default function Mode5() {
     setError("");
 
     try {
-      const requestData = {
-        patient_info: {
-          id: selectedPatient,
-          age: "52",
-          gender: "Male",
-          history: "No known cardiac history",
-        },
-        recording_data: {
-          channels: ecgChannels.reduce((acc, channel) => {
-            acc[channel] = {
-              signal: currentECGData.signals[channel],
-            };
-            return acc;
-          }, {}),
-        },
-      };
-
-      console.log("🚀 Sending REAL ECG data for analysis...", {
+      // The backend reads the leads from the record itself, so the signals
+      // loaded for display are not sent back.
+      console.log("🚀 Requesting server-side ECG analysis...", {
         patient: selectedPatient,
         recording: selectedRecording,
-        channels: ecgChannels,
-        samples: ecgChannels.map((ch) => currentECGData.signals[ch].length),
+        offset: offset,
+        length: length,
       });
 
       const apiUrl = `${
         import.meta.env.VITE_API_URL
-      }/ecg/mode5/comprehensive-analysis`;
-
-      const response = await fetch(apiUrl, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify(requestData),
-      });
+      }/ecg/mode5/analyze-record?patient=${selectedPatient}&recording=${selectedRecording}&offset=${offset}&length=${length}`;
+
+      const response = await fetch(apiUrl);
 
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
@@ -2,6 +2,7 @@ import React, { useState, useEffect, useRef, useCallback, useMemo } from "react"
 import Plot from "react-plotly.js";
 import { useNavigate } from "react-router-dom";
 import { useECG } from "./ecgContext";
+import { fetchSignalColumns } from "./signalFormat";
 import "./mode6.css";
 
 export default function Mode6() {
@@ -70,7 +71,8 @@ export default function Mode6() {
   // محاولة جلب البيانات من Mode 2
   const tryMode2Data = useCallback(async () => {
     try {
-      const apiUrl = `http://127.0.0.1:8000/ecg/mode2/analyze-optimized?patient=${selectedPatient}&recording=${selectedRecording}&channel=${channels[0]}&threshold=0.05&max_beats=100`;
+      const params = `patient=${selectedPatient}&recording=${selectedRecording}&channel=${channels[0]}&threshold=0.05&max_beats=100`;
+      const apiUrl = `http://127.0.0.1:8000/ecg/mode2/analyze-optimized?${params}&compact=true`;
       console.log("🔄 Trying Mode 2 data:", apiUrl);
 
       const response = await fetch(apiUrl);
@@ -81,9 +83,13 @@ export default function Mode6() {
 
       const jsonData = await response.json();
 
-      if (jsonData.beat_data || jsonData.abnormal_beats) {
+      if (jsonData.abnormal_beats && jsonData.abnormal_beats.count > 0) {
+        // Beat samples come separately, as one binary column per beat
+        const { columns } = await fetchSignalColumns(
+          `http://127.0.0.1:8000/ecg/mode2/beat-signals?${params}&beats=${jsonData.abnormal_beats.beat_index.join(",")}`
+        );
         console.log("✅ Using Mode 2 data for XOR");
-        const processedData = processMode2Data(jsonData, channels[0]);
+        const processedData = processMode2Data(jsonData, columns, channels[0]);
         setEcgData(processedData);
         initializeXOR(processedData);
       } 
@@ -109,18 +115,25 @@ export default function Mode6() {
     };
   }, []);
 
-  const processMode2Data = useCallback((data, channel) => {
-    const allBeats = [
-      ...(data.beat_data?.normal_beats || []),
-      ...(data.abnormal_beats || []),
-    ].sort((a, b) => a.beat_index - b.beat_index);
-
-    let combinedSignal = [];
-    allBeats.forEach((beat) => {
-      if (beat.signal && Array.isArray(beat.signal)) {
-        combinedSignal = [...combinedSignal, ...beat.signal];
-      }
+  const processMode2Data = useCallback((data, columns, channel) => {
+    const beats = data.abnormal_beats;
+    const allBeats = beats.beat_index
+      .map((beatIndex, k) => ({
+        beat_index: beatIndex,
+        start_idx: beats.start_idx[k],
+        end_idx: beats.end_idx[k],
+        difference_score: beats.difference_score[k],
+      }))
+      .sort((a, b) => a.beat_index - b.beat_index);
+
+    const beatSignals = allBeats.map((beat) => columns[`beat_${beat.beat_index}`] || []);
+    const combined = new Float32Array(beatSignals.reduce((total, signal) => total + signal.length, 0));
+    let offset = 0;
+    beatSignals.forEach((signal) => {
+      combined.set(signal, offset);
+      offset += signal.length;
     });
+    const combinedSignal = Array.from(combined);
 
     const samplingRate = 1000;
 
@@ -0,0 +1,51 @@
+// Client for the binary signal format served by the ECG signal endpoints
+// (see Backend/app/ecg/signal_format.py for the layout).
+export const BINARY_SIGNAL_TYPE = "application/vnd.smartsignal.signal";
+
+export function decodeSignalPayload(buffer) {
+  const view = new DataView(buffer);
+  const headerLength = view.getUint32(0, true);
+  const header = JSON.parse(
+    new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength))
+  );
+
+  const ArrayType = header.dtype === "<i2" ? Int16Array : Float32Array;
+  let byteOffset = 4 + headerLength;
+
+  const columns = {};
+  header.channels.forEach((channel, i) => {
+    const samples = header.samples[i];
+    const raw = new ArrayType(buffer.slice(byteOffset, byteOffset + samples * ArrayType.BYTES_PER_ELEMENT));
+    byteOffset += samples * ArrayType.BYTES_PER_ELEMENT;
+
+    if (ArrayType === Int16Array) {
+      const scale = header.scale[i];
+      const baseline = header.baseline[i];
+      columns[channel] = Float32Array.from(raw, (v) => (v - baseline) / scale);
+    } else {
+      columns[channel] = raw;
+    }
+  });
+
+  return { header, columns };
+}
+
+// Fetches a signal endpoint in binary form and rebuilds the x axis
+// (implicit from the offset, or listed in the header for decimated views).
+export async function fetchSignalColumns(url) {
+  const response = await fetch(url, { headers: { Accept: BINARY_SIGNAL_TYPE } });
+  if (!response.ok) throw new Error(`HTTP ${response.status}`);
+
+  const contentType = response.headers.get("content-type") || "";
+  if (!contentType.startsWith(BINARY_SIGNAL_TYPE)) {
+    const data = await response.json();
+    throw new Error(data.error || "Invalid data format");
+  }
+
+  const { header, columns } = decodeSignalPayload(await response.arrayBuffer());
+  const offset = header.offset || 0;
+  const xAxis = (length) =>
+    header.x ? header.x.slice(0, length) : Array.from({ length }, (_, i) => offset + i);
+
+  return { header, columns, xAxis };
+}